@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-from timfuz import Benchmark, Ar_di2np, loadc_Ads_b, index_names, A_ds2np, simplify_rows, OrderedSet
+from timfuz import Benchmark, OrderedSet
+from timfuz_eqns import Eqns
 import numpy as np
 import glob
 import math
@@ -10,20 +11,14 @@ from collections import OrderedDict
 from fractions import Fraction
 
 
-def rm_zero_cols(Ads, verbose=True):
-    removed = OrderedSet()
-
+def rm_zero_cols(eqns, verbose=True):
+    '''Returns (eqns without ZERO elements, removed names)'''
     print('Removing ZERO elements')
-    for row_ds in Ads:
-        for k in set(row_ds.keys()):
-            if k in removed:
-                del row_ds[k]
-            elif k.find('ZERO') >= 0:
-                del row_ds[k]
-                removed.add(k)
-                if verbose:
-                    print('  Removing %s' % k)
-    return removed
+    eqns, removed = eqns.remove_names(lambda name: name.find('ZERO') >= 0)
+    if verbose:
+        for k in removed:
+            print('  Removing %s' % k)
+    return eqns, OrderedSet(removed)
 
 
 def fracr_quick(r):
@@ -38,9 +33,10 @@ def fracm_quick(m):
 
 
 class State(object):
-    def __init__(self, Ads, zero_names=[]):
-        self.Ads = Ads
-        self.names = index_names(self.Ads)
+    def __init__(self, eqns, zero_names=[]):
+        # timfuz_eqns.Eqns
+        self.eqns = eqns
+        self.names = eqns.used_names()
 
         # known zero delay elements
         self.zero_names = OrderedSet(zero_names)
@@ -60,7 +56,7 @@ class State(object):
         if self.subs:
             print(
                 "    Largest: %u" % max([len(x) for x in self.subs.values()]))
-        print("  Rows: %u" % len(self.Ads))
+        print("  Rows: %u" % len(self.eqns))
         print(
             "  Cols (in): %u" % (len(self.base_names) + len(self.zero_names)))
         print("  Cols (preprocessed): %u" % len(self.base_names))
@@ -73,13 +69,13 @@ class State(object):
     def load(fn_ins, simplify=False, corner=None, rm_zero=False):
         zero_names = OrderedSet()
 
-        Ads, b = loadc_Ads_b(fn_ins, corner=corner)
+        eqns = Eqns.load(fn_ins, corner=corner)
         if rm_zero:
-            zero_names = rm_zero_cols(Ads)
+            eqns, zero_names = rm_zero_cols(eqns)
         if simplify:
             print('Simplifying corner %s' % (corner, ))
-            Ads, b = simplify_rows(Ads, b, remove_zd=False, corner=corner)
-        return State(Ads, zero_names=zero_names)
+            eqns = eqns.simplify(remove_zd=False, corner=corner)
+        return State(eqns, zero_names=zero_names)
 
 
 def write_state(state, fout):
@@ -124,7 +120,7 @@ def row_sym2dsf(rowsym, names):
 
 def state_rref(state, verbose=False):
     print('Converting rows to integer keys')
-    names, Anp = A_ds2np(state.Ads)
+    names, Anp = state.eqns.to_dense()
 
     print('np: %u rows x %u cols' % (len(Anp), len(Anp[0])))
     mnp = Anp
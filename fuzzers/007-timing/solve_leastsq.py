@@ -125,7 +125,13 @@ def main():
         help='Derive additional constraints to improve solution')
     parser.add_argument(
         '--sub-json', help='Group substitutions to make fully ranked')
-    parser.add_argument('--corner', required=True, default="slow_max", help='')
+    corner_group = parser.add_mutually_exclusive_group(required=True)
+    corner_group.add_argument('--corner', default=None, help='')
+    corner_group.add_argument(
+        '--corners',
+        help='Comma separated corners to solve in parallel, '
+        '{corner} in --out is replaced by the corner')
+    parser.add_argument('--jobs', type=int, help='Processes used by --corners')
     parser.add_argument(
         '--out', default=None, help='output timing delay .json')
     parser.add_argument('fns_in', nargs='+', help='timing4i.csv input files')
@@ -142,14 +148,25 @@ def main():
         sub_json = load_sub(args.sub_json)
 
     try:
-        timfuz_solve.run(
-            run_corner=run_corner,
-            sub_json=sub_json,
-            fns_in=fns_in,
-            corner=args.corner,
-            massage=args.massage,
-            outfn=args.out,
-            verbose=args.verbose)
+        if args.corners:
+            timfuz_solve.run_corners(
+                run_corner=run_corner,
+                sub_json=sub_json,
+                fns_in=fns_in,
+                corners=args.corners.split(','),
+                massage=args.massage,
+                outfn=args.out,
+                verbose=args.verbose,
+                processes=args.jobs)
+        else:
+            timfuz_solve.run(
+                run_corner=run_corner,
+                sub_json=sub_json,
+                fns_in=fns_in,
+                corner=args.corner,
+                massage=args.massage,
+                outfn=args.out,
+                verbose=args.verbose)
     finally:
         print('Exiting after %s' % bench)
 
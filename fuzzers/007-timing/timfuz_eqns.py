@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+'''
+Timing equation store backed by scipy.sparse
+
+timfuz.loadc_Ads_mkb and friends keep every equation as an OrderedDict of
+variable name => coefficient.  Eqns instead keeps the whole system in a CSR
+matrix (one row per equation, one column per variable name) plus a numpy
+vector of delays, so the simplify / substitute / massage stages are matrix
+operations rather than loops over dicts.
+
+Equations are the same as the dict form:
+A[row] . x = b[row]
+where x are the delay elements named by names.
+'''
+
+from timfuz import SimplifiedToZero, corner_s2i
+import itertools
+import sys
+import numpy as np
+import scipy.sparse as sparse
+
+# Lines parsed per chunk by load_csv
+CSV_CHUNK_LINES = 100000
+
+# Reference rows compared at once by Eqns.derive_by_row
+DERIVE_ROW_CHUNK = 256
+
+# Coefficients smaller than this after substitution are rounding errors
+COEF_EPS = 1e-9
+
+# Same as simplify_rows: value so that unknown delays get ignored
+T_UNK = {
+    'fast_max': 0,
+    'fast_min': 10e9,
+    'slow_max': 0,
+    'slow_min': 10e9,
+}
+
+
+def is_max_corner(corner):
+    return {
+        'fast_max': True,
+        'fast_min': False,
+        'slow_max': True,
+        'slow_min': False,
+    }[corner]
+
+
+def load_csv(fns, names=None, chunk_lines=CSV_CHUNK_LINES):
+    '''
+    Parse timing .csv files (see loadc_Ads_mkb)
+
+    Returns (A, bs, ico, names)
+    A: csr_matrix with one row per line
+    bs: rows x 4 float array of the corner delays, nan for None
+    ico: bool array
+    names: list of variable names, indexed by column
+    names may be passed in to extend an existing list
+    '''
+    names = [] if names is None else names
+    name_index = dict((name, i) for i, name in enumerate(names))
+
+    indptr = [np.zeros(1, dtype=np.int64)]
+    indices = []
+    data = []
+    bs = []
+    ico = []
+    nnz = 0
+
+    def parse_chunk(lines):
+        chunk_indptr = []
+        chunk_indices = []
+        chunk_data = []
+        chunk_bs = []
+        chunk_ico = []
+        for l in lines:
+            cols = l.split(',')
+            chunk_ico.append(cols[0] == '1')
+            chunk_bs.append(
+                [
+                    float('nan') if corner == 'None' else int(corner)
+                    for corner in cols[1].split()
+                ])
+            for var in cols[2:]:
+                n, name = var.split()
+                i = name_index.get(name)
+                if i is None:
+                    i = name_index[name] = len(names)
+                    names.append(name)
+                chunk_indices.append(i)
+                chunk_data.append(int(n))
+            chunk_indptr.append(len(chunk_indices))
+        return chunk_indptr, chunk_indices, chunk_data, chunk_bs, chunk_ico
+
+    for fn in fns:
+        with open(fn, 'r') as f:
+            # skip header
+            f.readline()
+            while True:
+                lines = list(itertools.islice(f, chunk_lines))
+                if not lines:
+                    break
+                chunk_indptr, chunk_indices, chunk_data, chunk_bs, chunk_ico = parse_chunk(
+                    lines)
+                indptr.append(np.array(chunk_indptr, dtype=np.int64) + nnz)
+                indices.append(np.array(chunk_indices, dtype=np.int64))
+                data.append(np.array(chunk_data, dtype=np.float64))
+                bs.append(np.array(chunk_bs, dtype=np.float64).reshape(-1, 4))
+                ico.append(np.array(chunk_ico, dtype=bool))
+                nnz += len(chunk_indices)
+
+    rows = sum(len(x) for x in ico)
+    A = sparse.csr_matrix(
+        (
+            np.concatenate(data) if data else np.zeros(0),
+            np.concatenate(indices) if indices else np.zeros(0, np.int64),
+            np.concatenate(indptr)),
+        shape=(rows, len(names)))
+    A.sum_duplicates()
+    bs = np.concatenate(bs) if bs else np.zeros((0, 4))
+    ico = np.concatenate(ico) if ico else np.zeros(0, dtype=bool)
+    return A, bs, ico, names
+
+
+def simplify_corners(A, bs, corners, remove_zd=False):
+    '''
+    Eqns.simplify for several corners at once
+
+    bs has one column of delays per entry in corners.  Duplicate rows of A
+    are grouped once and each column is reduced according to its own corner,
+    so all corners share the returned A.
+    Returns (A, bs)
+    '''
+    assert bs.shape == (A.shape[0], len(corners)), (bs.shape, A.shape)
+    rows_in = A.shape[0]
+    nnz = np.diff(A.indptr)
+    bs = np.array(bs, dtype=np.float64)
+    A = A.copy()
+
+    keep = np.ones(rows_in, dtype=bool)
+    # Equations with a total delay of zero
+    zero_ds = 0
+    if remove_zd:
+        zero_d = np.any(bs == 0, axis=1)
+        zero_ds = int(zero_d.sum())
+        keep &= ~zero_d
+
+    # Equations with zero elements, these should have zero delay
+    zero_e = keep & (nnz == 0)
+    zero_es = int(zero_e.sum())
+    if zero_es:
+        assert not np.any(bs[zero_e][1:] != 0
+                          ), 'Unexpected zero element row with non-zero delay'
+    keep &= ~zero_e
+
+    # Reduce single constants to canonical form (ex: 2 a = 30 => a = 15)
+    single = np.flatnonzero(keep & (nnz == 1))
+    single_data = A.indptr[single]
+    v = A.data[single_data]
+    scale = v != 1
+    bs[single[scale]] = bs[single[scale]] / v[scale, None]
+    A.data[single_data] = 1
+
+    rows = np.flatnonzero(keep)
+    eqn_index = {}
+    group = np.empty(len(rows), dtype=np.int64)
+    for i, rowi in enumerate(rows):
+        start, end = A.indptr[rowi], A.indptr[rowi + 1]
+        key = A.indices[start:end].tobytes() + A.data[start:end].tobytes()
+        group[i] = eqn_index.setdefault(key, len(eqn_index))
+
+    ngroups = len(eqn_index)
+    bs_ret = np.empty((ngroups, len(corners)), dtype=np.float64)
+    for corneri, corner in enumerate(corners):
+        b_ret = np.full(ngroups, T_UNK[corner], dtype=np.float64)
+        if is_max_corner(corner):
+            np.maximum.at(b_ret, group, bs[rows, corneri])
+        else:
+            np.minimum.at(b_ret, group, bs[rows, corneri])
+        bs_ret[:, corneri] = b_ret
+    _, first = np.unique(group, return_index=True)
+
+    print(
+        'Simplify rows: %d => %d rows w/ rm zd %d, rm ze %d' %
+        (rows_in, ngroups, zero_ds, zero_es))
+    if ngroups == 0:
+        raise SimplifiedToZero()
+    return A[rows[first]], bs_ret
+
+
+class Eqns(object):
+    '''System of equations A x = b for a single corner'''
+
+    def __init__(self, A, b, names):
+        self.A = sparse.csr_matrix(A)
+        self.A.sort_indices()
+        self.b = np.asarray(b, dtype=np.float64)
+        self.names = list(names)
+        assert self.A.shape == (len(self.b), len(
+            self.names)), (self.A.shape, len(self.b), len(self.names))
+
+    @staticmethod
+    def load(fns, corner):
+        '''Equivalent of loadc_Ads_b'''
+        corner = corner or "slow_max"
+        A, bs, _ico, names = load_csv(fns)
+        return Eqns(A, bs[:, corner_s2i[corner]], names)
+
+    @staticmethod
+    def from_Ads(Ads, b):
+        '''Convert from the list of dict form'''
+        names = []
+        name_index = {}
+        indptr = [0]
+        indices = []
+        data = []
+        for row_ds in Ads:
+            for k, v in row_ds.items():
+                i = name_index.get(k)
+                if i is None:
+                    i = name_index[k] = len(names)
+                    names.append(k)
+                indices.append(i)
+                data.append(float(v))
+            indptr.append(len(indices))
+        A = sparse.csr_matrix(
+            (data, indices, indptr), shape=(len(Ads), len(names)))
+        return Eqns(A, b, names)
+
+    def to_Ads(self, rows=None):
+        '''Convert (rows of) to the list of dict form, with b'''
+        rows = range(len(self)) if rows is None else rows
+        Ads = []
+        for rowi in rows:
+            start, end = self.A.indptr[rowi], self.A.indptr[rowi + 1]
+            Ads.append(
+                dict(
+                    (self.names[i], v) for i, v in zip(
+                        self.A.indices[start:end], self.A.data[start:end])))
+        return Ads, [self.b[rowi] for rowi in rows]
+
+    def __len__(self):
+        return len(self.b)
+
+    def row_nnz(self):
+        return np.diff(self.A.indptr)
+
+    def instances(self):
+        return self.A.data.sum()
+
+    def rows(self, mask_or_index):
+        '''Returns Eqns with a subset of the rows'''
+        return Eqns(self.A[mask_or_index], self.b[mask_or_index], self.names)
+
+    def name_order(self):
+        '''
+        Returns array of column indices of the names used by any row, in order
+        of first appearance (rows in order, names in a row sorted)
+        '''
+        name_rank = np.argsort(np.argsort(np.array(self.names, dtype=object)))
+        row_of = np.repeat(np.arange(len(self)), self.row_nnz())
+        order = np.lexsort((name_rank[self.A.indices], row_of))
+        cols = self.A.indices[order]
+        _, first = np.unique(cols, return_index=True)
+        return cols[np.sort(first)]
+
+    def used_names(self):
+        '''Equivalent of index_names'''
+        return [self.names[i] for i in self.name_order()]
+
+    def compact(self):
+        '''Returns Eqns with only the used names, see name_order'''
+        cols = self.name_order()
+        return Eqns(self.A[:, cols], self.b, [self.names[i] for i in cols])
+
+    def to_dense(self):
+        '''Equivalent of A_ds2np: returns (names, rows x names array)'''
+        eqns = self.compact()
+        return eqns.names, eqns.A.toarray()
+
+    def concat(self, other):
+        '''Append the rows of other'''
+        names = list(self.names)
+        name_index = dict((name, i) for i, name in enumerate(names))
+        col_map = np.zeros(len(other.names), dtype=np.int64)
+        for i, name in enumerate(other.names):
+            if name not in name_index:
+                name_index[name] = len(names)
+                names.append(name)
+            col_map[i] = name_index[name]
+
+        other_A = sparse.csr_matrix(
+            (other.A.data, col_map[other.A.indices], other.A.indptr),
+            shape=(len(other), len(names)))
+        A = self.A.copy()
+        A.resize((len(self), len(names)))
+        return Eqns(
+            sparse.vstack((A, other_A), format='csr'),
+            np.concatenate((self.b, other.b)), names)
+
+    def remove_names(self, pred):
+        '''
+        Remove the columns of names matching pred
+        Returns (Eqns, list of removed names that were used)
+        '''
+        used = np.zeros(len(self.names), dtype=bool)
+        used[self.A.indices] = True
+        remove = np.array(
+            [bool(pred(name)) for name in self.names], dtype=bool)
+        keep = np.flatnonzero(~remove)
+        removed = [
+            self.names[i] for i in self.name_order() if remove[i] and used[i]
+        ]
+        return Eqns(self.A[:, keep], self.b,
+                    [self.names[i] for i in keep]), removed
+
+    def simplify(self, remove_zd=False, corner=None):
+        '''Equivalent of simplify_rows: remove duplicate equations, taking highest delay'''
+        assert corner is not None
+        A, bs = simplify_corners(
+            self.A, self.b[:, None], [corner], remove_zd=remove_zd)
+        return Eqns(A, bs[:, 0], self.names)
+
+    def sub_json(self, sub_json):
+        '''
+        Equivalent of run_sub_json (without strict checking)
+
+        Removes zero_names, then replaces every pivot with its group.  Pivot
+        columns are zero in the other groups (RREF), so all groups can be
+        substituted at once:
+        A' = A - N S + N in the group columns
+        where N are the pivot columns of A and S the group substitutions.
+        '''
+        zero_names = set(sub_json['zero_names'])
+        eqns, _removed = self.remove_names(lambda name: name in zero_names)
+
+        groups = sorted(sub_json['pivots'].keys())
+        names = list(eqns.names)
+        name_index = dict((name, i) for i, name in enumerate(names))
+        for group in groups:
+            if group not in name_index:
+                name_index[group] = len(names)
+                names.append(group)
+
+        def col(name):
+            if name not in name_index:
+                name_index[name] = len(names)
+                names.append(name)
+            return name_index[name]
+
+        pivot_cols = np.array(
+            [col(sub_json['pivots'][group]) for group in groups],
+            dtype=np.int64)
+        s_rows = []
+        s_cols = []
+        s_data = []
+        for gi, group in enumerate(groups):
+            for subk, subv in sorted(sub_json['subs'][group].items()):
+                s_rows.append(gi)
+                s_cols.append(col(subk))
+                s_data.append(float(subv))
+        group_cols = np.array(
+            [name_index[group] for group in groups], dtype=np.int64)
+
+        A = eqns.A.copy()
+        A.resize((len(eqns), len(names)))
+        S = sparse.csr_matrix(
+            (s_data, (s_rows, s_cols)), shape=(len(groups), len(names)))
+        N = A[:, pivot_cols]
+        G = sparse.csr_matrix(
+            (np.ones(len(groups)), (np.arange(len(groups)), group_cols)),
+            shape=(len(groups), len(names)))
+        A = (A - N * S + N * G).tocsr()
+        A.data[np.abs(A.data) < COEF_EPS] = 0
+        A.eliminate_zeros()
+
+        changed = (np.diff(N.indptr) > 0) | (eqns.row_nnz() != self.row_nnz())
+        print("Sub: %u / %u rows changed" % (changed.sum(), len(eqns)))
+        print("Sub: %u => %u non-zero row cols" % (self.A.nnz, A.nnz))
+        return Eqns(A, eqns.b, names)
+
+    def bounds(self):
+        '''Equivalent of Ads2bounds'''
+        assert np.all(self.row_nnz() == 1)
+        assert np.all(self.A.data == 1)
+        return dict(
+            (self.names[coli], b) for coli, b in zip(self.A.indices, self.b))
+
+    def filter_bounds(self, bounds, corner):
+        '''Equivalent of timfuz_solve.filter_bounds'''
+        maxcorner = is_max_corner(corner)
+        t_unk = 0 if maxcorner else 1e9
+
+        x = np.array(
+            [bounds.get(name, t_unk) for name in self.names], dtype=np.float64)
+        used = np.zeros(len(self.names), dtype=bool)
+        used[self.A.indices] = True
+        unknowns = sum(
+            1 for name, u in zip(self.names, used) if u and name not in bounds)
+
+        est = self.A.dot(x)
+        if maxcorner:
+            # Keep delays possibly larger than current bound
+            keep = self.b > est
+        else:
+            # Keep delays possibly smaller than current bound
+            keep = self.b < est
+
+        if unknowns:
+            print('WARNING: %u encountered undefined bounds' % unknowns)
+        return self.rows(keep)
+
+    def derive_by_col(self, keep_orig=True):
+        '''Equivalent of derive_eq_by_col: subtract out all single variable (known) columns'''
+        nnz = self.row_nnz()
+
+        single = np.flatnonzero(nnz == 1)
+        known_cols = self.A.indices[self.A.indptr[single]]
+        assert len(np.unique(known_cols)) == len(known_cols), 'Duplicate known'
+        known_vals = np.zeros(len(self.names))
+        known_vals[known_cols] = self.b[single] / self.A.data[self.A.
+                                                              indptr[single]]
+        known = np.zeros(len(self.names), dtype=bool)
+        known[known_cols] = True
+        print('%d constrained' % len(known_cols))
+
+        # Remove known columns from rows with more than one variable
+        multi = nnz > 1
+        row_of = np.repeat(np.arange(len(self)), nnz)
+        drop = known[self.A.indices] & multi[row_of]
+        b_new = self.b - np.bincount(
+            row_of[drop],
+            weights=self.A.data[drop] * known_vals[self.A.indices[drop]],
+            minlength=len(self))
+        A_new = self.A.copy()
+        A_new.data[drop] = 0
+        A_new.eliminate_zeros()
+        new_nnz = np.diff(A_new.indptr)
+
+        # Possibly reduced all usable contants out, or invalid
+        derived = (new_nnz > 0) & (b_new >= 0)
+        if keep_orig:
+            derived &= new_nnz < nnz
+            # Keep derived rows next to their original row
+            A = sparse.vstack((self.A, A_new[derived]), format='csr')
+            b = np.concatenate((self.b, b_new[derived]))
+            rows = np.arange(len(self))
+            order = np.argsort(
+                np.concatenate((2 * rows, 2 * rows[derived] + 1)),
+                kind='mergesort')
+        else:
+            A = A_new[derived]
+            b = b_new[derived]
+            order = np.arange(len(b))
+
+        print('Derive col: %d => %d rows' % (len(self), len(order)))
+        return Eqns(A[order], b[order], self.names)
+
+    def derive_by_row(self, col_lim=0, cmp_heuristic=True):
+        '''
+        Equivalent of derive_eq_by_row: subtract whole rows
+
+        Row pairs where every variable of row_cmp is in row_ref with at least
+        the same coefficient are found by counting shared variables with a
+        sparse product of the variable indicator matrix, DERIVE_ROW_CHUNK
+        reference rows at a time.
+        '''
+        nnz = self.row_nnz()
+        eligible = np.ones(len(self), dtype=bool)
+        if col_lim:
+            eligible = nnz <= col_lim
+
+        indicator = self.A.copy()
+        indicator.data = np.ones_like(indicator.data)
+        indicator_t = indicator[eligible].T.tocsc()
+        cmp_rows = np.flatnonzero(eligible)
+
+        sys.stdout.write('Deriving rows (%u) ' % len(self))
+        sys.stdout.flush()
+        new_A = []
+        new_b = []
+        ltes = 0
+        b_warns = 0
+        ref_rows = np.flatnonzero(eligible)
+        for chunk_start in range(0, len(ref_rows), DERIVE_ROW_CHUNK):
+            sys.stdout.write('.')
+            sys.stdout.flush()
+            refs = ref_rows[chunk_start:chunk_start + DERIVE_ROW_CHUNK]
+            overlap = (indicator[refs] * indicator_t).tocoo()
+            ref = refs[overlap.row]
+            cmp = cmp_rows[overlap.col]
+            subset = (overlap.data == nnz[cmp]) & (ref != cmp)
+            ref = ref[subset]
+            cmp = cmp[subset]
+            order = np.lexsort((cmp, ref))
+            ref = ref[order]
+            cmp = cmp[order]
+            if not len(ref):
+                continue
+
+            diff = (self.A[ref] - self.A[cmp]).tocsr()
+            # Coefficients on the variables of row_cmp must not go negative
+            lte = diff.multiply(
+                indicator[cmp]).min(axis=1).toarray().ravel() >= 0
+            ltes += int(lte.sum())
+
+            diff.eliminate_zeros()
+            diff_nnz = np.diff(diff.indptr)
+            keep = lte
+            if cmp_heuristic:
+                # Keep any generally small rows
+                # And anything that reduced at least one row by half
+                keep = keep & (
+                    (diff_nnz <= 8) | (diff_nnz <= nnz[cmp] / 2) |
+                    (diff_nnz <= nnz[ref] / 2))
+            b_diff = self.b[ref] - self.b[cmp]
+            b_warns += int((keep & (b_diff < 0)).sum())
+            keep &= b_diff >= 0
+
+            new_A.append(diff[keep])
+            new_b.append(b_diff[keep])
+        print(' done')
+
+        A = sparse.vstack([self.A] + new_A, format='csr')
+        b = np.concatenate([self.b] + new_b)
+        print(
+            'Derive row: %d => %d rows using %d lte' %
+            (len(self), len(b), ltes))
+        print('Dropped %u invalid equations' % b_warns)
+        return Eqns(A, b, self.names)
+
+    def sort(self):
+        '''Equivalent of sort_equations'''
+        keys = []
+        for rowi in range(len(self)):
+            start, end = self.A.indptr[rowi], self.A.indptr[rowi + 1]
+            row = sorted(
+                zip(
+                    (self.names[i] for i in self.A.indices[start:end]),
+                    self.A.data[start:end]))
+            keys.append((row, self.b[rowi], rowi))
+        order = np.array([key[2] for key in sorted(keys)], dtype=np.int64)
+        return self.rows(order)
+
+    def col_dist(self, desc='of', lim=0):
+        '''Equivalent of col_dist'''
+        counts = np.bincount(self.row_nnz())
+        fs = [(k, v) for k, v in enumerate(counts) if v]
+        print(
+            'Col count distribution (%s) for %dr x %dc w/ %d freqs' %
+            (desc, len(self), len(self.names), len(fs)))
+        prints = 0
+        for i, (k, v) in enumerate(fs):
+            if lim == 0 or (lim and prints < lim or i == len(fs) - 1):
+                print('  %d: %d' % (k, v))
+            prints += 1
+            if lim and prints == lim:
+                print('  ...')
+
+    def print_eqns(self, verbose=0, lim=3, label=''):
+        '''Equivalent of print_eqns'''
+        rows = len(self)
+        print('Sample equations (%s) from %d r' % (label, rows))
+        prints = 0
+        for rowi in range(rows):
+            if not (verbose or ((rowi < 10 or rowi % max(1,
+                                                         (rows / 20)) == 0) and
+                                (not lim or prints < lim))):
+                continue
+            Ads, b = self.to_Ads([rowi])
+            line = '  EQN: p%u: ' % rowi
+            for k, v in sorted(Ads[0].items()):
+                line += '%u*t%s ' % (v, k)
+            line += '= %d' % b[0]
+            print(line)
+            prints += 1
@@ -320,3 +320,68 @@ def massage_equations(
     print('Massage final: %d => %d cols' % (cols, cols_end))
     assert cols_end == cols
     return Ads, b
+
+
+def massage_eqns(eqns, verbose=False, corner=None, iter_lim=1, col_lim=100000):
+    '''
+    massage_equations on a timfuz_eqns.Eqns
+
+    Same pipeline (derive rows, simplify, derive cols, simplify, sort), but
+    every step is a sparse matrix operation
+    '''
+
+    def check_cols():
+        assert len(eqns.name_order()) == cols
+
+    def debug(what):
+        check_cols()
+        print('')
+        eqns.print_eqns(verbose=verbose, label=what, lim=20)
+        eqns.col_dist(what)
+
+    dstart = len(eqns)
+    cols = len(eqns.name_order())
+
+    # Each iteration one more column is allowed until all columns are included
+    # (and the system is stable)
+    di = 0
+    while True:
+        n_orig = len(eqns)
+
+        print('Loop %d, lim %d' % (di + 1, col_lim))
+        eqns = eqns.derive_by_row(col_lim=col_lim, cmp_heuristic=True)
+        debug("der_rows")
+        eqns = eqns.simplify(corner=corner)
+        print('Derive row: %d => %d equations' % (n_orig, len(eqns)))
+        debug("der_rows simp")
+
+        n_orig2 = len(eqns)
+        eqns = eqns.derive_by_col()
+        debug("der_cols")
+        eqns = eqns.simplify(corner=corner)
+        print(
+            'Derive col %d: %d => %d equations' % (di + 1, n_orig2, len(eqns)))
+        debug("der_cols simp")
+
+        eqns = eqns.sort()
+        debug("loop done")
+        eqns.col_dist('derive done iter %d, lim %d' % (di, col_lim), lim=12)
+
+        di += 1
+        dend = len(eqns)
+        if n_orig == len(eqns) and col_lim >= cols or di >= iter_lim:
+            break
+        col_lim += col_lim / 5
+
+        print('')
+        print('Derive net: %d => %d' % (dstart, dend))
+        print('')
+
+    eqns = eqns.sort()
+    debug("final (sorted)")
+    print('')
+    print('Massage final: %d => %d rows' % (dstart, dend))
+    cols_end = len(eqns.name_order())
+    print('Massage final: %d => %d cols' % (cols, cols_end))
+    assert cols_end == cols
+    return eqns
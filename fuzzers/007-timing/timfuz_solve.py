@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
-from timfuz import simplify_rows, loadc_Ads_b, index_names, A_ds2np, run_sub_json, print_eqns, Ads2bounds, instances, SimplifiedToZero, allow_zero_eqns, corner_s2i, acorner2csv
-from timfuz_massage import massage_equations
+from timfuz import SimplifiedToZero, allow_zero_eqns, corner_s2i, acorner2csv
+from timfuz_massage import massage_eqns
+from timfuz_eqns import Eqns, load_csv, simplify_corners
+import multiprocessing
 import numpy as np
 import sys
 import math
@@ -156,82 +158,171 @@ def solve_save(outfn, xvals, names, corner, save_zero=True, verbose=False):
         assert nonzeros, 'Failed to estimate delay'
 
 
-def run(
-        fns_in,
-        corner,
-        run_corner,
-        sub_json=None,
-        bounds_csv=None,
-        dedup=True,
-        massage=False,
-        outfn=None,
-        verbose=False,
-        **kwargs):
-    print('Loading data')
-    Ads, b = loadc_Ads_b(fns_in, corner)
+def load_eqns(fns_in, corners, dedup=True, sub_json=None):
+    '''
+    Load and simplify the equations of all corners at once
+    Returns (A, bs, names) with one column in bs per entry in corners
+    '''
+    A, bs, _ico, names = load_csv(fns_in)
+    bs = bs[:, [corner_s2i[corner] for corner in corners]]
 
     # Remove duplicate rows
     # is this necessary?
     # maybe better to just add them into the matrix directly
     if dedup:
-        oldn = len(Ads)
-        iold = instances(Ads)
-        Ads, b = simplify_rows(Ads, b, corner=corner)
-        print('Simplify %u => %u rows' % (oldn, len(Ads)))
-        print('Simplify %u => %u instances' % (iold, instances(Ads)))
+        oldn = A.shape[0]
+        iold = A.data.sum()
+        A, bs = simplify_corners(A, bs, corners)
+        print('Simplify %u => %u rows' % (oldn, A.shape[0]))
+        print('Simplify %u => %u instances' % (iold, A.data.sum()))
 
     if sub_json:
-        print('Sub: %u rows' % len(Ads))
-        iold = instances(Ads)
-        names_old = index_names(Ads)
-        run_sub_json(Ads, sub_json, verbose=verbose)
-        names = index_names(Ads)
-        print("Sub: %u => %u names" % (len(names_old), len(names)))
-        print('Sub: %u => %u instances' % (iold, instances(Ads)))
-    else:
-        names = index_names(Ads)
+        # Substitution only touches A and keeps the row order, so solve it
+        # for the first corner and reuse the result for the others
+        eqns = Eqns(A, bs[:, 0], names)
+        print('Sub: %u rows' % len(eqns))
+        iold = eqns.instances()
+        names_old = eqns.used_names()
+        eqns = eqns.sub_json(sub_json)
+        print("Sub: %u => %u names" % (len(names_old), len(eqns.used_names())))
+        print('Sub: %u => %u instances' % (iold, eqns.instances()))
+        A, names = eqns.A, eqns.names
+
+    return A, bs, names
+
+
+def solve_eqns(
+        eqns,
+        corner,
+        run_corner,
+        bounds_csv=None,
+        massage=False,
+        outfn=None,
+        verbose=False,
+        **kwargs):
     '''
+    Corner specific part of run: bounds, massage and the actual solve
+
     Substitution .csv
     Special .csv containing one variable per line
     Used primarily for multiple optimization passes, such as different algorithms or additional constraints
     '''
     if bounds_csv:
-        Ads2, b2 = loadc_Ads_b([bounds_csv], corner)
-        bounds = Ads2bounds(Ads2, b2)
+        eqns2 = Eqns.load([bounds_csv], corner)
+        bounds = eqns2.bounds()
         assert len(bounds), 'Failed to load bounds'
-        rows_old = len(Ads)
-        Ads, b = filter_bounds(Ads, b, bounds, corner)
+        rows_old = len(eqns)
+        eqns = eqns.filter_bounds(bounds, corner)
         print(
             'Filter bounds: %s => %s + %s rows' %
-            (rows_old, len(Ads), len(Ads2)))
-        Ads = Ads + Ads2
-        b = b + b2
-        assert len(Ads) or allow_zero_eqns()
-        assert len(Ads) == len(b), 'Ads, b length mismatch'
+            (rows_old, len(eqns), len(eqns2)))
+        eqns = eqns.concat(eqns2)
+        assert len(eqns) or allow_zero_eqns()
 
     if verbose:
         print
-        print_eqns(Ads, b, verbose=verbose)
+        eqns.print_eqns(verbose=verbose)
 
-        #print
-        #col_dist(A_ubd, 'final', names)
     if massage:
         try:
-            Ads, b = massage_equations(Ads, b, corner=corner)
+            eqns = massage_eqns(eqns, corner=corner)
         except SimplifiedToZero:
             if not allow_zero_eqns():
                 raise
             print('WARNING: simplified to zero equations')
-            Ads = []
-            b = []
+            eqns = eqns.rows(np.zeros(len(eqns), dtype=bool))
 
     print('Converting to numpy...')
-    names, Anp = A_ds2np(Ads)
+    names, Anp = eqns.to_dense()
     run_corner(
-        Anp,
-        np.asarray(b),
-        names,
+        Anp, eqns.b, names, corner, outfn=outfn, verbose=verbose, **kwargs)
+
+
+def run(
+        fns_in,
         corner,
+        run_corner,
+        sub_json=None,
+        bounds_csv=None,
+        dedup=True,
+        massage=False,
+        outfn=None,
+        verbose=False,
+        **kwargs):
+    print('Loading data')
+    A, bs, names = load_eqns(fns_in, [corner], dedup=dedup, sub_json=sub_json)
+    solve_eqns(
+        Eqns(A, bs[:, 0], names),
+        corner,
+        run_corner,
+        bounds_csv=bounds_csv,
+        massage=massage,
         outfn=outfn,
         verbose=verbose,
         **kwargs)
+
+
+def corner_fn(fn, corner):
+    '''Expand the {corner} placeholder of a per corner file name'''
+    if fn is None:
+        return None
+    return fn.format(corner=corner)
+
+
+def check_corner_fn(option, fn, corners):
+    '''Several corners must not write or read the same file'''
+    if fn is None or len(corners) < 2:
+        return
+    if len(set(corner_fn(fn, corner) for corner in corners)) != len(corners):
+        raise ValueError(
+            '%s %s must contain {corner} to solve several corners' %
+            (option, fn))
+
+
+def solve_corner(args):
+    '''Pool worker of run_corners'''
+    A, b, names, corner, run_corner, kwargs = args
+    solve_eqns(Eqns(A, b, names), corner, run_corner, **kwargs)
+    return corner
+
+
+def run_corners(
+        fns_in,
+        corners,
+        run_corner,
+        sub_json=None,
+        bounds_csv=None,
+        dedup=True,
+        massage=False,
+        outfn=None,
+        verbose=False,
+        processes=None,
+        **kwargs):
+    '''
+    run for several corners, loading and simplifying the equations only once
+
+    Every corner is solved in its own process, which gets its own copy of the
+    simplified sparse equations.  bounds_csv and outfn must contain a {corner}
+    placeholder when solving several corners, ex: build/{corner}/leastsq.csv
+    '''
+    check_corner_fn('--bounds-csv', bounds_csv, corners)
+    check_corner_fn('--out', outfn, corners)
+
+    print('Loading data')
+    A, bs, names = load_eqns(fns_in, corners, dedup=dedup, sub_json=sub_json)
+
+    jobs = []
+    for corneri, corner in enumerate(corners):
+        corner_kwargs = dict(kwargs)
+        corner_kwargs.update(
+            bounds_csv=corner_fn(bounds_csv, corner),
+            massage=massage,
+            outfn=corner_fn(outfn, corner),
+            verbose=verbose)
+        jobs.append(
+            (A, bs[:, corneri], names, corner, run_corner, corner_kwargs))
+
+    processes = processes or min(len(corners), multiprocessing.cpu_count())
+    with multiprocessing.Pool(processes) as pool:
+        for corner in pool.imap_unordered(solve_corner, jobs):
+            print('Solved corner %s' % corner)
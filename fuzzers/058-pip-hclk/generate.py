@@ -4,6 +4,7 @@ import sys
 import re
 
 from prjxray.segmaker import Segmaker
+from prjxray.grid_types import BlockType
 
 tags = dict()
 en_tags = dict()
@@ -38,7 +39,8 @@ for arg in sys.argv[1:]:
             src, dst = pip.split("->>")
 
             # FIXME: workaround for https://github.com/SymbiFlow/prjxray/issues/392
-            if "CLB_IO_CLK" not in segmk.grid[tile]["bits"]:
+            if BlockType.CLB_IO_CLK not in segmk.grid.gridinfo_at_tilename(
+                    tile).bits:
                 print("WARNING: dropping tile %s" % tile)
                 continue
             tag = "%s.%s" % (dst, src)
@@ -201,7 +201,17 @@ def read_json5(fname, database_file):
             yield get_prototype_site(site)
 
     site_types = tuple(get_site_types())
-    sites = tuple(get_sites(tile, node_lookup.site_pin_node_to_wires))
+
+    # Look up the wires of all site pins of the tile in one query.
+    site_pin_wires = node_lookup.site_pin_nodes_to_wires(
+        (tile['tile'], site_pin['node'])
+        for site in tile['sites']
+        for site_pin in site['site_pins'])
+
+    def site_pin_node_to_wires(tile_name, node):
+        return site_pin_wires.get((tile_name, node), ())
+
+    sites = tuple(get_sites(tile, site_pin_node_to_wires))
     pips = get_pips(tile['tile'], tile['pips'])
 
     def inner():
@@ -13,6 +13,10 @@ endif
 # Driven by int_loop.sh
 ITER ?= 1
 MAKETODO_FLAGS ?=--pip-type pips_int --seg-type int
+# Solver used by the database target.  Specimens of previous iterations are
+# kept in a state file next to the output, so every iteration only reads its
+# own specimens (see prjxray/segmatch.py).
+PIP_SEGMATCH ?= ${XRAY_SEGMATCH_PY} --incremental
 SPECIMENS_DEPS ?=
 
 # See int_loop_check.py
@@ -18,13 +18,12 @@ def write(bits_fn, fnout, tags):
     # Everything relative to start of bitstream
     line("seg 00000000_000")
 
-    bitdata = bitstream.load_bitdata2(open(bits_fn, "r"))
+    with open(bits_fn, "r") as f:
+        bitdata = bitstream.BitData.load(f)
 
-    for frame, words in bitdata.items():
-        for word, wbits in words.items():
-            for bitidx in sorted(list(wbits)):
-                # Are the names arbitrary? Lets just re-create
-                line("bit %08X_%03u_%02u" % (frame, word, bitidx))
+    for frame, word, bitidx in bitdata.iter_bits():
+        # Are the names arbitrary? Lets just re-create
+        line("bit %08X_%03u_%02u" % (frame, word, bitidx))
 
     for k, v in tags.items():
         line("tag %s %u" % (k, v))
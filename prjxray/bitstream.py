@@ -4,6 +4,7 @@ from prjxray import util
 
 # Break frames into WORD_SIZE bit words.
 WORD_SIZE_BITS = 32
+WORD_MASK = (1 << WORD_SIZE_BITS) - 1
 
 # How many 32-bit words for frame in a 7-series bitstream?
 FRAME_WORD_COUNT = 101
@@ -25,6 +26,8 @@ def load_bitdata(f):
     """ Read bit file and return bitdata map.
     Similar to segbits file
 
+    This layout is kept for compatibility, new code should use BitData.
+
     bitdata is a map of of two sets.
     The map key is the frame address.
     The first sets are the word columns that have any bits set.
@@ -48,8 +51,7 @@ def load_bitdata(f):
     return bitdata
 
 
-# used by segprint
-# TODO: merge these
+# Older layout, kept for compatibility, new code should use BitData.
 def load_bitdata2(f):
     '''
     return as bitdata[frame][wordidx].add(bitidx)
@@ -80,6 +82,272 @@ def load_bitdata2(f):
     return bitdata
 
 
+def iter_set_bits(bitmap):
+    """ Yields the index of each bit set in bitmap, lowest first.
+
+    >>> list(iter_set_bits(0b10110))
+    [1, 2, 4]
+
+    """
+    while bitmap:
+        low_bit = bitmap & -bitmap
+        yield low_bit.bit_length() - 1
+        bitmap ^= low_bit
+
+
+def word_mask(first_word, words):
+    """ Returns frame bitmap with every bit of words words from first_word set.
+
+    >>> hex(word_mask(1, 2))
+    '0xffffffffffffffff00000000'
+
+    """
+    return ((1 << (words * WORD_SIZE_BITS)) - 1) << (
+        first_word * WORD_SIZE_BITS)
+
+
+class BitData(object):
+    """ Set of bits in a bitstream.
+
+    Bits are stored as one integer bitmap per frame, where the bit index within
+    the frame is wordidx * WORD_SIZE_BITS + bitidx.  Frames without any bits
+    are not stored.  This is considerably smaller than sets of bit indices,
+    and allows per word and per frame queries and set algebra with a handful
+    of integer operations.
+
+    Iterating, len() and "in" operate on the frames that have bits set.
+
+    """
+
+    def __init__(self, frames=None):
+        # Frame address to bitmap.
+        self.frames = {}
+
+        # Base frame to sorted list of frames, built on request.
+        self._base_frames = None
+
+        if frames is not None:
+            for frame, bitmap in frames.items():
+                if bitmap:
+                    self.frames[frame] = bitmap
+
+    @staticmethod
+    def load(f):
+        """ Read bits file (bitread -y output), see load_bitdata. """
+        frames = {}
+        for line in f:
+            # ex: bit_00020500_000_17
+            line = line.split("_")
+            frame = int(line[1], 16)
+            bit = int(line[2], 10) * WORD_SIZE_BITS + int(line[3], 10)
+            frames[frame] = frames.get(frame, 0) | (1 << bit)
+
+        return BitData(frames)
+
+    @staticmethod
+    def from_bits(bits):
+        """ Create BitData from iterable of (frame, wordidx, bitidx). """
+        frames = {}
+        for frame, wordidx, bitidx in bits:
+            frames[frame] = frames.get(
+                frame, 0) | (1 << (wordidx * WORD_SIZE_BITS + bitidx))
+
+        return BitData(frames)
+
+    @staticmethod
+    def from_bitdata(bitdata):
+        """ Create BitData from load_bitdata output.
+
+        If bitdata is already a BitData, it is returned as is.
+
+        """
+        if isinstance(bitdata, BitData):
+            return bitdata
+
+        frames = {}
+        for frame, (_, bits) in bitdata.items():
+            bitmap = 0
+            for bit in bits:
+                bitmap |= 1 << bit
+            frames[frame] = bitmap
+
+        return BitData(frames)
+
+    def to_bitdata(self):
+        """ Return bits in the load_bitdata layout. """
+        bitdata = {}
+        for frame, bitmap in self.frames.items():
+            bits = set(iter_set_bits(bitmap))
+            bitdata[frame] = set(bit // WORD_SIZE_BITS for bit in bits), bits
+
+        return bitdata
+
+    def to_bitdata2(self):
+        """ Return bits in the load_bitdata2 layout. """
+        bitdata = {}
+        for frame, wordidx, bitidx in self.iter_bits():
+            bitdata.setdefault(frame, {}).setdefault(wordidx,
+                                                     set()).add(bitidx)
+
+        return bitdata
+
+    def __contains__(self, frame):
+        return frame in self.frames
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __eq__(self, other):
+        return isinstance(other, BitData) and self.frames == other.frames
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        return self.frames
+
+    def __setstate__(self, frames):
+        self.frames = frames
+        self._base_frames = None
+
+    def copy(self):
+        return BitData(self.frames)
+
+    def count_bits(self):
+        """ Returns the total number of bits set. """
+        return sum(bin(bitmap).count('1') for bitmap in self.frames.values())
+
+    def add_bitmap(self, frame, bitmap):
+        """ Set every bit of bitmap in frame. """
+        if not bitmap:
+            return
+
+        if frame not in self.frames:
+            self.frames[frame] = bitmap
+            self._base_frames = None
+        else:
+            self.frames[frame] |= bitmap
+
+    def add_bit(self, frame, bit):
+        """ Set bit (wordidx * WORD_SIZE_BITS + bitidx) in frame. """
+        self.add_bitmap(frame, 1 << bit)
+
+    def has_bit(self, frame, bit):
+        """ Returns True if bit (wordidx * WORD_SIZE_BITS + bitidx) is set. """
+        return (self.frames.get(frame, 0) >> bit) & 1 == 1
+
+    def frame_bitmap(self, frame):
+        """ Returns the bitmap of frame, 0 if no bits are set. """
+        return self.frames.get(frame, 0)
+
+    def frame_bits(self, frame):
+        """ Returns sorted list of the bits set in frame. """
+        return list(iter_set_bits(self.frames.get(frame, 0)))
+
+    def frame_words(self, frame):
+        """ Returns sorted list of the words of frame with any bit set. """
+        bitmap = self.frames.get(frame, 0)
+        words = []
+        word = 0
+        while bitmap:
+            if bitmap & WORD_MASK:
+                words.append(word)
+            bitmap >>= WORD_SIZE_BITS
+            word += 1
+
+        return words
+
+    def word_value(self, frame, wordidx):
+        """ Returns the 32-bit value of word wordidx of frame. """
+        return (self.frames.get(frame, 0) >>
+                (wordidx * WORD_SIZE_BITS)) & WORD_MASK
+
+    def word_bits(self, frame, wordidx):
+        """ Returns sorted list of the bit indices (0-31) set in word. """
+        return list(iter_set_bits(self.word_value(frame, wordidx)))
+
+    def has_words(self, frame, first_word, words):
+        """ Returns True if any bit is set in words words from first_word. """
+        return self.frames.get(frame, 0) & word_mask(first_word, words) != 0
+
+    def words_bits(self, frame, first_word, words):
+        """ Returns sorted list of the bits set in words words from first_word.
+
+        Bit indices are relative to the frame, not to first_word.
+
+        """
+        return list(
+            iter_set_bits(
+                self.frames.get(frame, 0) & word_mask(first_word, words)))
+
+    def iter_bits(self):
+        """ Yields (frame, wordidx, bitidx) of every bit set, sorted. """
+        for frame in sorted(self.frames):
+            for bit in iter_set_bits(self.frames[frame]):
+                yield frame, bit // WORD_SIZE_BITS, bit % WORD_SIZE_BITS
+
+    def base_frames(self):
+        """ Returns dict of base frame to sorted list of frames with bits.
+
+        The base frame is the frame address aligned to FRAME_ALIGNMENT, ie
+        the first frame of the column.
+
+        """
+        if self._base_frames is None:
+            base_frames = {}
+            for frame in sorted(self.frames):
+                base_frames.setdefault(frame & ~(FRAME_ALIGNMENT - 1),
+                                       []).append(frame)
+            self._base_frames = base_frames
+
+        return self._base_frames
+
+    def frames_in_base(self, base_frame):
+        """ Returns sorted list of frames with bits within base_frame. """
+        return self.base_frames().get(base_frame, [])
+
+    def __or__(self, other):
+        result = self.copy()
+        result |= other
+        return result
+
+    def __ior__(self, other):
+        for frame, bitmap in other.frames.items():
+            self.add_bitmap(frame, bitmap)
+
+        return self
+
+    def __and__(self, other):
+        frames = {}
+        for frame, bitmap in self.frames.items():
+            if frame in other.frames:
+                frames[frame] = bitmap & other.frames[frame]
+
+        return BitData(frames)
+
+    def __sub__(self, other):
+        result = self.copy()
+        result -= other
+        return result
+
+    def __isub__(self, other):
+        for frame, bitmap in other.frames.items():
+            if frame not in self.frames:
+                continue
+
+            remaining = self.frames[frame] & ~bitmap
+            if remaining:
+                self.frames[frame] = remaining
+            else:
+                del self.frames[frame]
+                self._base_frames = None
+
+        return self
+
+
 def gen_part_base_addrs():
     """
     Return (block_type, top_bottom, cfg_row, cfg_col, frame_count)
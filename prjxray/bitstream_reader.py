@@ -0,0 +1,422 @@
+""" Native reader for 7-series .bit files.
+
+This is a Python port of the packet and frame decoding done by bitread
+(lib/xilinx/xc7series/bitstream_reader.cc, configuration_packet.cc and
+configuration.h), which avoids having to write the configuration frames to an
+ASCII .bits file and parse them back.
+
+The configuration words are read from a memory map of the .bit file, frame
+data is kept as numpy views of the configuration words, and each frame is
+converted to a prjxray.bitstream.BitData bitmap in one step.
+
+"""
+import mmap
+import json
+import numpy as np
+
+from prjxray import util
+from prjxray.bitstream import BitData, FRAME_WORD_COUNT
+
+SYNC_WORD = b'\xaa\x99\x55\x66'
+
+# Configuration packet opcodes.
+OPCODE_NOP = 0
+OPCODE_READ = 1
+OPCODE_WRITE = 2
+
+# Configuration registers, see
+# lib/include/prjxray/xilinx/xc7series/configuration_register.h
+REG_CRC = 0x00
+REG_FAR = 0x01
+REG_FDRI = 0x02
+REG_CMD = 0x04
+REG_MASK = 0x06
+REG_IDCODE = 0x0c
+REG_CTL1 = 0x18
+
+CMD_WCFG = 0x1
+
+# Word within each frame holding the ECC bits, and the mask of the non-ECC
+# bits in that word.  bitread ignores the ECC bits unless -C is given.
+ECC_WORD = 50
+ECC_WORD_MASK = 0xffffe000
+
+
+def frame_address(block_type, is_bottom_half_rows, row, column, minor):
+    """ Construct frame address from its fields.
+
+    >>> hex(frame_address(1, True, 2, 3, 4))
+    '0xc40184'
+
+    """
+    return (
+        (block_type & 0x7) << 23 | (1 if is_bottom_half_rows else 0) << 22
+        | (row & 0x1f) << 17 | (column & 0x3ff) << 7 | (minor & 0x7f))
+
+
+def decode_frame_address(address):
+    """ Return (block_type, is_bottom_half_rows, row, column, minor).
+
+    >>> decode_frame_address(0xc40184)
+    (1, True, 2, 3, 4)
+
+    """
+    return (
+        (address >> 23) & 0x7,
+        bool((address >> 22) & 0x1),
+        (address >> 17) & 0x1f,
+        (address >> 7) & 0x3ff,
+        address & 0x7f,
+    )
+
+
+class Part(object):
+    """ Frame address layout of a part.
+
+    Constructed from the part JSON (<part>.json in the database, converted from
+    <part>.yaml by utils/xyaml.py).  Implements the same frame address
+    auto-increment rules as Part::GetNextFrameAddress.
+
+    """
+
+    def __init__(self, idcode, regions):
+        """
+        idcode: IDCODE of the part.
+        regions: dict of is_bottom_half_rows to dict of row to dict of block
+                 type to dict of column to frame count.
+        """
+        self.idcode = idcode
+        self.regions = regions
+
+    @staticmethod
+    def from_json(j):
+        idcode = j['idcode']
+        if isinstance(idcode, str):
+            idcode = int(idcode, 0)
+
+        regions = {}
+        for top_bottom, is_bottom in (('top', False), ('bottom', True)):
+            rows = {}
+            region = j['global_clock_regions'].get(top_bottom, {})
+            for row, row_data in region.get('rows', {}).items():
+                buses = {}
+                for bus, bus_data in row_data['configuration_buses'].items():
+                    buses[util.block_type_s2i[bus]] = dict(
+                        (int(column), column_data['frame_count'])
+                        for column, column_data in
+                        bus_data['configuration_columns'].items())
+
+                rows[int(row)] = buses
+
+            regions[is_bottom] = rows
+
+        return Part(idcode, regions)
+
+    @staticmethod
+    def from_file(fn):
+        """ Load part from JSON file.
+
+        For convenience the path to the part YAML may be given, in which case
+        the JSON file next to it is loaded.
+
+        """
+        if fn.endswith('.yaml'):
+            fn = fn[:-len('.yaml')] + '.json'
+
+        with open(fn) as f:
+            return Part.from_json(json.load(f))
+
+    def _columns(self, block_type, is_bottom_half_rows, row):
+        return self.regions[is_bottom_half_rows].get(row, {}).get(block_type)
+
+    def is_valid_frame_address(self, address):
+        block_type, is_bottom, row, column, minor = decode_frame_address(
+            address)
+        columns = self._columns(block_type, is_bottom, row)
+        if columns is None or column not in columns:
+            return False
+
+        return minor < columns[column]
+
+    def _next_in_bus(self, address):
+        block_type, is_bottom, row, column, minor = decode_frame_address(
+            address)
+        columns = self._columns(block_type, is_bottom, row)
+        if columns is None or column not in columns:
+            return None
+
+        if minor >= columns[column]:
+            return None
+
+        if minor + 1 < columns[column]:
+            return address + 1
+
+        # Next valid address is the start of the next column.
+        next_columns = [c for c in columns if c > column]
+        if next_columns:
+            next_address = frame_address(
+                block_type, is_bottom, row, min(next_columns), 0)
+            if self.is_valid_frame_address(next_address):
+                return next_address
+
+        return None
+
+    def _next_in_region(self, address):
+        block_type, is_bottom, row, _, _ = decode_frame_address(address)
+        rows = self.regions[is_bottom]
+        if row not in rows:
+            return None
+
+        next_address = self._next_in_bus(address)
+        if next_address is not None:
+            return next_address
+
+        # Next valid address is the start of the next row.
+        next_rows = [r for r in rows if r > row]
+        if next_rows:
+            next_address = frame_address(
+                block_type, is_bottom, min(next_rows), 0, 0)
+            if self.is_valid_frame_address(next_address):
+                return next_address
+
+        return None
+
+    def get_next_frame_address(self, address):
+        """ Returns the frame address following address, or None. """
+        next_address = self._next_in_region(address)
+        if next_address is not None:
+            return next_address
+
+        block_type, is_bottom, _, _, _ = decode_frame_address(address)
+
+        # The bottom region follows the top region.
+        if not is_bottom:
+            next_address = frame_address(block_type, True, 0, 0, 0)
+            if self.is_valid_frame_address(next_address):
+                return next_address
+
+        # Block types are next numerically.
+        for next_block_type in (util.block_type_s2i['BLOCK_RAM'],
+                                util.block_type_s2i['CFG_CLB']):
+            if block_type < next_block_type:
+                next_address = frame_address(next_block_type, False, 0, 0, 0)
+                if self.is_valid_frame_address(next_address):
+                    return next_address
+
+        return None
+
+
+def read_config_words(f):
+    """ Return the configuration words following the sync word of a .bit file.
+
+    f: Binary file object of the .bit file.
+
+    Returns a numpy uint32 array, or None if no sync word was found.
+
+    """
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        sync_pos = m.find(SYNC_WORD)
+        if sync_pos == -1:
+            return None
+
+        start = sync_pos + len(SYNC_WORD)
+        count = (len(m) - start) // 4
+
+        # Configuration words are big endian, convert to native order (which
+        # also copies them out of the memory map).
+        words = np.frombuffer(
+            m, dtype='>u4', count=count, offset=start).astype(np.uint32)
+
+    return words
+
+
+def iter_packets(words):
+    """ Yields (opcode, register, data) for each configuration packet.
+
+    data is a numpy view of words.  Type 0 packets (zero padding) are
+    consumed without being yielded, and parsing stops at the first invalid or
+    incomplete packet.
+
+    """
+    idx = 0
+    nwords = len(words)
+    previous_register = None
+
+    while idx < nwords:
+        header = int(words[idx])
+        header_type = header >> 29
+
+        if header_type == 0:
+            # Zero padding, interpreted as a NOP to the CRC register.
+            previous_register = REG_CRC
+            idx += 1
+        elif header_type == 1:
+            opcode = (header >> 27) & 0x3
+            register = (header >> 13) & 0x3fff
+            count = header & 0x7ff
+            if count > nwords - idx - 1:
+                return
+
+            data = words[idx + 1:idx + 1 + count]
+            idx += count + 1
+            previous_register = register
+            yield opcode, register, data
+        elif header_type == 2:
+            # Type 2 packets write to the register of the previous packet.
+            opcode = (header >> 27) & 0x3
+            count = header & 0x7ffffff
+            if count > nwords - idx - 1:
+                return
+
+            data = words[idx + 1:idx + 1 + count]
+            idx += count + 1
+            if previous_register is not None:
+                yield opcode, previous_register, data
+        else:
+            return
+
+
+def read_frames(part, words):
+    """ Return dict of frame address to frame words written by words.
+
+    Follows the write state machine in Configuration::InitWithPackets.  The
+    frame words are numpy views of words.
+
+    Raises ValueError if the bitstream IDCODE does not match the part.
+
+    """
+    command_register = 0
+    frame_address_register = 0
+    mask_register = 0
+    ctl1_register = 0
+
+    start_new_write = False
+    current_frame_address = 0
+
+    frames = {}
+    for opcode, register, data in iter_packets(words):
+        if opcode != OPCODE_WRITE:
+            continue
+
+        if register == REG_FDRI:
+            if start_new_write:
+                current_frame_address = frame_address_register
+                start_new_write = False
+
+            # Writes to FDRI can be multiples of a frame, in which case the
+            # frame address auto-increments.
+            idx = 0
+            while idx < len(data):
+                frames[current_frame_address] = data[idx:idx +
+                                                     FRAME_WORD_COUNT]
+
+                next_address = part.get_next_frame_address(
+                    current_frame_address)
+                if next_address is None:
+                    break
+
+                # Bitstreams have 2 frames of padding between rows.
+                if decode_frame_address(next_address)[2] != \
+                        decode_frame_address(current_frame_address)[2]:
+                    idx += 2 * FRAME_WORD_COUNT
+
+                current_frame_address = next_address
+                idx += FRAME_WORD_COUNT
+
+            continue
+
+        if len(data) < 1:
+            continue
+
+        value = int(data[0])
+        if register == REG_MASK:
+            mask_register = value
+        elif register == REG_CTL1:
+            ctl1_register = value & mask_register
+        elif register == REG_CMD:
+            command_register = value
+            if command_register == CMD_WCFG:
+                start_new_write = True
+        elif register == REG_IDCODE:
+            if value != part.idcode:
+                raise ValueError(
+                    'Bitstream IDCODE 0x{:08x} does not match part IDCODE '
+                    '0x{:08x}'.format(value, part.idcode))
+        elif register == REG_FAR:
+            frame_address_register = value
+
+            # Bit 21 of CTL1 inhibits re-executing CMD on FAR writes.
+            if (ctl1_register >> 21) & 1 == 0 and \
+                    command_register == CMD_WCFG:
+                start_new_write = True
+
+    return frames
+
+
+def parse_frame_range(frame_range):
+    """ Parse bitread style "<first>:<last>" frame range, last is inclusive.
+
+    >>> parse_frame_range('0x00400000:0x004000ff')
+    (4194304, 4194559)
+
+    """
+    first, last = frame_range.split(':')
+    return int(first, 0), int(last, 0)
+
+
+def frames_to_bitdata(frames, frame_range=None, include_ecc=False):
+    """ Convert frames from read_frames to a bitstream.BitData.
+
+    The returned bits are identical to the output of "bitread -z -y".
+
+    frames: dict of frame address to frame words.
+    frame_range: Optional (first, last) frame addresses, inclusive.
+    include_ecc: If False, the ECC bits are ignored (like bitread without -C).
+
+    """
+    addresses = sorted(frames.keys())
+    if frame_range is not None:
+        first, last = frame_range
+        addresses = [addr for addr in addresses if first <= addr <= last]
+
+    frame_words = np.zeros((len(addresses), FRAME_WORD_COUNT), dtype='<u4')
+    for frame_idx, address in enumerate(addresses):
+        data = frames[address]
+        frame_words[frame_idx, :len(data)] = data
+
+    if not include_ecc:
+        frame_words[:, ECC_WORD] &= ECC_WORD_MASK
+
+    # BitData bitmaps have word 0 in the low bits, which is exactly the
+    # little endian byte representation of the frame words.
+    bitdata = {}
+    for frame_idx in np.flatnonzero(frame_words.any(axis=1)):
+        bitdata[addresses[frame_idx]] = int.from_bytes(
+            frame_words[frame_idx].tobytes(), 'little')
+
+    return BitData(bitdata)
+
+
+def load_bitdata_from_bit(bit_file, part, frame_range=None, include_ecc=False):
+    """ Read .bit file and return bitstream.BitData.
+
+    bit_file: Path to the .bit file.
+    part: Part, or path to the part JSON (or YAML) file.
+    frame_range: Optional (first, last) frame addresses, inclusive.
+
+    """
+    if not isinstance(part, Part):
+        part = Part.from_file(part)
+
+    with open(bit_file, 'rb') as f:
+        words = read_config_words(f)
+
+    if words is None:
+        raise ValueError(
+            '{} does not appear to be a Xilinx 7-series bitstream'.format(
+                bit_file))
+
+    return frames_to_bitdata(
+        read_frames(part, words),
+        frame_range=frame_range,
+        include_ecc=include_ecc)
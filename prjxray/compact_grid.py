@@ -0,0 +1,308 @@
+""" Array backed implementation of prjxray.grid.Grid.
+
+Grid builds a GridInfo namedtuple with nested Bits namedtuples and dicts for
+every tile in tilegrid.json, which on the larger parts is hundreds of thousands
+of small Python objects per process.  CompactGrid instead stores the grid in a
+handful of typed numpy columns, and only builds GridInfo / Bits tuples when
+they are requested.
+
+The columns can be stored in the database cache (see prjxray.db_cache), in
+which case they are read-only views of the memory mapped cache file and are
+shared by every process that opens the same cache.
+
+"""
+import pickle
+import numpy as np
+
+from prjxray.grid import Grid
+from prjxray.grid_types import BlockType, GridLoc, GridInfo, BitAlias, Bits, BitsInfo
+
+# Column order of the per block type columns.
+BLOCK_TYPES = tuple(BlockType)
+
+# Names of the numpy columns of a CompactGrid.
+COLUMNS = (
+    'tile_names',
+    'grid_x',
+    'grid_y',
+    'tile_type',
+    'loc_table',
+    'has_bits',
+    'base_address',
+    'frames',
+    'offset',
+    'words',
+    'site_indptr',
+    'site_names',
+    'site_type',
+)
+
+
+class CompactGrid(Grid):
+    """ Grid with the same public API as Grid, backed by numpy columns.
+
+    Tiles are stored sorted by name, and a tile index is the position of the
+    tile in that order.
+
+    Columns:
+     - tile_names: Fixed width bytes array of tile names (sorted).
+     - grid_x, grid_y: Grid coordinates of each tile.
+     - tile_type: Index into tile_type_names for each tile.
+     - loc_table: Dense (x, y) table of tile index, -1 if unpopulated.
+       Indexed relative to the minimum grid_x / grid_y.
+     - has_bits, base_address, frames, offset, words: (tiles, BLOCK_TYPES)
+       tables of the "bits" entries in tilegrid.json.
+     - site_indptr, site_names, site_type: CSR table of the sites of each
+       tile, site_type indexes into site_type_names.
+
+    Bit aliases are rare, and are stored as a dict of
+    (tile index, block type index) to BitAlias.
+
+    """
+
+    def __init__(self, db, columns, meta):
+        # Grid.__init__ is not called, all state lives in the columns.
+        self.db = db
+
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+        self.tile_type_names = meta['tile_type_names']
+        self.site_type_names = meta['site_type_names']
+        self.aliases = meta['aliases']
+        self._dims = meta['dims']
+
+    @staticmethod
+    def from_tilegrid(db, tilegrid):
+        """ Build CompactGrid from the tilegrid.json object. """
+        tile_names = sorted(tilegrid.keys())
+
+        tile_type_names = sorted(
+            set(tilegrid[tile]['type'] for tile in tile_names))
+        tile_type_index = dict(
+            (tile_type, idx) for idx, tile_type in enumerate(tile_type_names))
+
+        site_type_names = sorted(
+            set(
+                site_type for tile in tile_names
+                for site_type in tilegrid[tile]['sites'].values()))
+        site_type_index = dict(
+            (site_type, idx) for idx, site_type in enumerate(site_type_names))
+
+        ntiles = len(tile_names)
+        nblocks = len(BLOCK_TYPES)
+
+        grid_x = np.zeros(ntiles, dtype=np.int32)
+        grid_y = np.zeros(ntiles, dtype=np.int32)
+        tile_type = np.zeros(ntiles, dtype=np.int32)
+        has_bits = np.zeros((ntiles, nblocks), dtype=np.bool_)
+        base_address = np.zeros((ntiles, nblocks), dtype=np.uint32)
+        frames = np.zeros((ntiles, nblocks), dtype=np.int32)
+        offset = np.zeros((ntiles, nblocks), dtype=np.int32)
+        words = np.zeros((ntiles, nblocks), dtype=np.int32)
+        site_indptr = np.zeros(ntiles + 1, dtype=np.int64)
+        site_names = []
+        site_type = []
+        aliases = {}
+
+        for tile_idx, tile in enumerate(tile_names):
+            tileinfo = tilegrid[tile]
+            grid_x[tile_idx] = tileinfo['grid_x']
+            grid_y[tile_idx] = tileinfo['grid_y']
+            tile_type[tile_idx] = tile_type_index[tileinfo['type']]
+
+            for block_idx, block_type in enumerate(BLOCK_TYPES):
+                if block_type.value not in tileinfo.get('bits', {}):
+                    continue
+
+                bits = tileinfo['bits'][block_type.value]
+                has_bits[tile_idx, block_idx] = True
+                base_address[tile_idx, block_idx] = int(bits['baseaddr'], 0)
+                frames[tile_idx, block_idx] = bits['frames']
+                offset[tile_idx, block_idx] = bits['offset']
+                words[tile_idx, block_idx] = bits['words']
+
+                if 'alias' in bits:
+                    aliases[(tile_idx, block_idx)] = BitAlias(
+                        tile_type=bits['alias']['type'],
+                        start_offset=bits['alias']['start_offset'],
+                        sites=bits['alias']['sites'],
+                    )
+
+            for site_name, site_type_name in tileinfo['sites'].items():
+                site_names.append(site_name)
+                site_type.append(site_type_index[site_type_name])
+
+            site_indptr[tile_idx + 1] = len(site_names)
+
+        x_min, x_max = int(grid_x.min()), int(grid_x.max())
+        y_min, y_max = int(grid_y.min()), int(grid_y.max())
+
+        loc_table = np.full(
+            (x_max - x_min + 1, y_max - y_min + 1), -1, dtype=np.int32)
+        loc_table[grid_x - x_min, grid_y - y_min] = np.arange(
+            ntiles, dtype=np.int32)
+        assert (loc_table >= 0).sum() == ntiles, "Duplicate grid locations"
+
+        columns = {
+            'tile_names': encode_names(tile_names),
+            'grid_x': grid_x,
+            'grid_y': grid_y,
+            'tile_type': tile_type,
+            'loc_table': loc_table,
+            'has_bits': has_bits,
+            'base_address': base_address,
+            'frames': frames,
+            'offset': offset,
+            'words': words,
+            'site_indptr': site_indptr,
+            'site_names': encode_names(site_names),
+            'site_type': np.array(site_type, dtype=np.int32),
+        }
+
+        meta = {
+            'tile_type_names': tile_type_names,
+            'site_type_names': site_type_names,
+            'aliases': aliases,
+            'dims': (x_min, x_max, y_min, y_max),
+        }
+
+        return CompactGrid(db, columns, meta)
+
+    @staticmethod
+    def from_cache(db, cache, prefix='compact_grid/'):
+        """ Build CompactGrid from columns stored in a DatabaseCache. """
+        columns = dict(
+            (name, cache.get_array(prefix + name)) for name in COLUMNS)
+        return CompactGrid(db, columns, cache.load(prefix + 'meta'))
+
+    def gen_sections(self):
+        """ Yields (name, data) sections for prjxray.db_cache. """
+        for name in COLUMNS:
+            yield name, getattr(self, name)
+
+        meta = {
+            'tile_type_names': self.tile_type_names,
+            'site_type_names': self.site_type_names,
+            'aliases': self.aliases,
+            'dims': self._dims,
+        }
+        yield 'meta', pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def tile_index(self, tilename):
+        """ Return the index of tilename, raise KeyError if not in grid. """
+        key = tilename.encode('ascii')
+        idx = int(np.searchsorted(self.tile_names, key))
+        if idx >= len(self.tile_names) or self.tile_names[idx] != key:
+            raise KeyError(tilename)
+
+        return idx
+
+    def tilename_of_index(self, tile_idx):
+        return self.tile_names[tile_idx].decode('ascii')
+
+    def tiles(self):
+        """ Return list of tiles. """
+        return [name.decode('ascii') for name in self.tile_names]
+
+    def tile_locations(self):
+        """ Return list of tile locations. """
+        return [
+            GridLoc(int(x), int(y)) for x, y in zip(self.grid_x, self.grid_y)
+        ]
+
+    def _loc_index(self, grid_loc):
+        x_min, x_max, y_min, y_max = self._dims
+        x, y = grid_loc
+        if x < x_min or x > x_max or y < y_min or y > y_max:
+            return -1
+
+        return int(self.loc_table[x - x_min, y - y_min])
+
+    def is_populated(self, grid_loc):
+        return self._loc_index(grid_loc) != -1
+
+    def loc_of_tilename(self, tilename):
+        tile_idx = self.tile_index(tilename)
+        return GridLoc(int(self.grid_x[tile_idx]), int(self.grid_y[tile_idx]))
+
+    def tilename_at_loc(self, grid_loc):
+        tile_idx = self._loc_index(grid_loc)
+        if tile_idx == -1:
+            raise KeyError(grid_loc)
+
+        return self.tilename_of_index(tile_idx)
+
+    def gridinfo_at_loc(self, grid_loc):
+        tile_idx = self._loc_index(grid_loc)
+        if tile_idx == -1:
+            raise KeyError(grid_loc)
+
+        return self.gridinfo_at_index(tile_idx)
+
+    def gridinfo_at_tilename(self, tilename):
+        return self.gridinfo_at_index(self.tile_index(tilename))
+
+    def bits_at_index(self, tile_idx):
+        """ Return dict of BlockType to Bits for tile at tile_idx. """
+        bits = {}
+        for block_idx in np.flatnonzero(self.has_bits[tile_idx]):
+            block_idx = int(block_idx)
+            bits[BLOCK_TYPES[block_idx]] = Bits(
+                base_address=int(self.base_address[tile_idx, block_idx]),
+                frames=int(self.frames[tile_idx, block_idx]),
+                offset=int(self.offset[tile_idx, block_idx]),
+                words=int(self.words[tile_idx, block_idx]),
+                alias=self.aliases.get((tile_idx, block_idx)),
+            )
+
+        return bits
+
+    def gridinfo_at_index(self, tile_idx):
+        start = int(self.site_indptr[tile_idx])
+        end = int(self.site_indptr[tile_idx + 1])
+
+        sites = {}
+        for site_idx in range(start, end):
+            sites[self.site_names[site_idx].decode(
+                'ascii')] = self.site_type_names[self.site_type[site_idx]]
+
+        return GridInfo(
+            bits=self.bits_at_index(tile_idx),
+            sites=sites,
+            tile_type=self.tile_type_names[self.tile_type[tile_idx]],
+        )
+
+    def iter_sites(self):
+        """ Yields (site, tile) of every site in the grid. """
+        tiles = self.tiles()
+        site_tiles = np.repeat(
+            np.arange(len(tiles)), np.diff(self.site_indptr)).tolist()
+        for site, tile_idx in zip(self.site_names, site_tiles):
+            yield site.decode('ascii'), tiles[tile_idx]
+
+    def iter_all_frames(self):
+        for tile_idx, block_idx in zip(*np.nonzero(self.has_bits)):
+            tile_idx = int(tile_idx)
+            block_idx = int(block_idx)
+            yield BitsInfo(
+                block_type=BLOCK_TYPES[block_idx],
+                tile=self.tilename_of_index(tile_idx),
+                bits=Bits(
+                    base_address=int(self.base_address[tile_idx, block_idx]),
+                    frames=int(self.frames[tile_idx, block_idx]),
+                    offset=int(self.offset[tile_idx, block_idx]),
+                    words=int(self.words[tile_idx, block_idx]),
+                    alias=self.aliases.get((tile_idx, block_idx)),
+                ),
+            )
+
+
+def encode_names(names):
+    """ Encode list of str to fixed width bytes array.
+
+    >>> encode_names(['B', 'AA'])
+    array([b'B', b'AA'], dtype='|S2')
+
+    """
+    return np.array([name.encode('ascii') for name in names], dtype=np.bytes_)
@@ -1,3 +1,10 @@
+""" Project X-ray database access.
+
+The numpy based modules (compact_grid, segment_map, site_instances,
+node_graph and router) are imported by the Database and Grid methods that
+use them, so that numpy is only loaded when needed.
+
+"""
 import os.path
 import simplejson as json
 from prjxray import grid
@@ -5,6 +12,7 @@ from prjxray import tile
 from prjxray import tile_segbits
 from prjxray import site_type
 from prjxray import connections
+from prjxray import db_cache
 
 
 def get_available_databases(prjxray_root):
@@ -25,14 +33,23 @@ def get_available_databases(prjxray_root):
 
 
 class Database(object):
-    def __init__(self, db_root):
+    def __init__(self, db_root, cache_file=None, compact_grid=False):
         """ Create project x-ray Database at given db_root.
 
     db_root: Path to directory containing settings.sh, *.db, tilegrid.json and
              tileconn.json
+    cache_file: Optional path to a compiled database cache (see
+                prjxray.db_cache).  If not given and XRAY_DATABASE_CACHE is
+                set, the cache is stored in that directory, in a file named
+                after db_root.  If neither is set, no cache is used.  The
+                cache is built or rebuilt when missing or stale.
+    compact_grid: If True, grid() returns a prjxray.compact_grid.CompactGrid
+                  instead of a Grid.  When a cache is used, the CompactGrid
+                  columns are memory mapped from the cache file.
 
     """
         self.db_root = db_root
+        self.compact_grid = compact_grid
         # tilegrid.json JSON object
         self.tilegrid = None
         self.tileconn = None
@@ -87,6 +104,14 @@ class Database(object):
 
         self.tile_types_obj = {}
 
+        self.cache = None
+        cache_dir = os.getenv('XRAY_DATABASE_CACHE')
+        if cache_file is None and cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_file = db_cache.cache_file_in_dir(cache_dir, db_root)
+        if cache_file:
+            self.cache = db_cache.open_database_cache(self, cache_file)
+
     def get_tile_types(self):
         """ Return list of tile types """
         return self.tile_types.keys()
@@ -94,44 +119,88 @@ class Database(object):
     def get_tile_type(self, tile_type):
         """ Return Tile object for given tilename. """
         if tile_type not in self.tile_types_obj:
-            self.tile_types_obj[tile_type] = tile.Tile(
-                tile_type, self.tile_types[tile_type])
+            section = 'tile/{}'.format(tile_type)
+            if self.cache is not None and self.cache.has_section(section):
+                self.tile_types_obj[tile_type] = self.cache.load(section)
+            else:
+                self.tile_types_obj[tile_type] = tile.Tile(
+                    tile_type, self.tile_types[tile_type])
 
         return self.tile_types_obj[tile_type]
 
     def _read_tilegrid(self):
         """ Read tilegrid database if not already read. """
         if not self.tilegrid:
+            if self.cache is not None:
+                self.tilegrid = self.cache.load('tilegrid')
+                return
+
             with open(os.path.join(self.db_root, 'tilegrid.json')) as f:
                 self.tilegrid = json.load(f)
 
     def _read_tileconn(self):
         """ Read tileconn database if not already read. """
         if not self.tileconn:
+            if self.cache is not None and self.cache.has_section('tileconn'):
+                self.tileconn = self.cache.load('tileconn')
+                return
+
             with open(os.path.join(self.db_root, 'tileconn.json')) as f:
                 self.tileconn = json.load(f)
 
     def grid(self):
         """ Return Grid object for database. """
+        if self.compact_grid:
+            from prjxray import compact_grid
+
+            if self.cache is not None:
+                return compact_grid.CompactGrid.from_cache(self, self.cache)
+
+            self._read_tilegrid()
+            return compact_grid.CompactGrid.from_tilegrid(self, self.tilegrid)
+
+        if self.cache is not None:
+            cached_grid = self.cache.load('grid')
+            cached_grid.db = self
+            return cached_grid
+
         self._read_tilegrid()
         return grid.Grid(self, self.tilegrid)
 
-    def _read_tile_types(self):
-        for tile_type, db in self.tile_types.items():
-            with open(db.tile_type) as f:
-                self.tile_types[tile_type] = json.load(f)
-
     def connections(self):
         self._read_tilegrid()
         self._read_tileconn()
-        self._read_tile_types()
 
         tile_wires = dict(
-            (tile_type, db['wires'])
-            for tile_type, db in self.tile_types.items())
+            (tile_type, self.get_tile_type(tile_type).get_wires())
+            for tile_type in self.tile_types)
         return connections.Connections(
             self.tilegrid, self.tileconn, tile_wires)
 
+    def node_graph(self, cache_file=None):
+        """ Return NodeGraph of the nodes of the database.
+
+        The NodeGraph is stored in cache_file (default next to the database
+        cache, see prjxray.node_graph.open_node_graph), and is only rebuilt
+        when the database changes.  Without a cache it is built in memory.
+
+        """
+        from prjxray import node_graph
+
+        return node_graph.open_node_graph(self, cache_file)
+
+    def routing_graph(self, cache_file=None):
+        """ Return RoutingGraph of the PIPs between the nodes of the database.
+
+        The RoutingGraph is stored in cache_file (default next to the
+        database cache, see prjxray.router.open_routing_graph).  Without a
+        cache it is built in memory.
+
+        """
+        from prjxray import router
+
+        return router.open_routing_graph(self, cache_file)
+
     def get_site_types(self):
         return self.site_types.keys()
 
@@ -143,7 +212,11 @@ class Database(object):
 
     def get_tile_segbits(self, tile_type):
         if tile_type not in self.tile_segbits:
-            self.tile_segbits[tile_type] = tile_segbits.TileSegbits(
-                self.tile_types[tile_type.upper()])
+            section = 'tile_segbits/{}'.format(tile_type.upper())
+            if self.cache is not None and self.cache.has_section(section):
+                self.tile_segbits[tile_type] = self.cache.load(section)
+            else:
+                self.tile_segbits[tile_type] = tile_segbits.TileSegbits(
+                    self.tile_types[tile_type.upper()])
 
         return self.tile_segbits[tile_type]
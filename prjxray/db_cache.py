@@ -0,0 +1,392 @@
+""" Compiled binary cache for prjxray.db.Database.
+
+Parsing tilegrid.json, tileconn.json, the tile_type_*.json files and the
+segbits_*.db files dominates the start up time of tools built on Database.
+The cache stores the already constructed objects (Grid, Tile, TileSegbits,
+etc) in a single versioned file.  Each object is stored in its own section, so
+only objects that are actually requested are unpickled.  Sections may also hold
+raw numpy arrays, which are returned as read-only views of the memory mapped
+file, so processes that open the same cache share one copy of that data.
+
+The cache is keyed on the source files of the database.  For each source file
+the size, mtime and SHA1 of the contents are recorded.  When the size or mtime
+of a file changes, the file is hashed again, and the cache is only considered
+stale if the contents actually changed (or files were added or removed).
+
+File layout (all integers little endian):
+
+  8 bytes  - Magic, CACHE_MAGIC
+  4 bytes  - Cache format version, CACHE_VERSION
+  8 bytes  - Length of the header
+  N bytes  - Header, JSON object with the source manifest and section table.
+  ...      - Section data, each section starting at a SECTION_ALIGNMENT
+             boundary.
+
+"""
+import fcntl
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+import os.path
+import pickle
+import struct
+import tempfile
+from prjxray import grid
+
+CACHE_MAGIC = b'PRJXRAYC'
+
+# Increment when the file layout, or the layout of any object stored in the
+# cache changes.
+CACHE_VERSION = 9
+
+SECTION_ALIGNMENT = 64
+
+PREAMBLE = struct.Struct('<8sIQ')
+
+# Files within a database directory that Database reads.
+SOURCE_PATTERNS = (
+    'tilegrid.json',
+    'tileconn.json',
+    'tile_type_*.json',
+    'site_type_*.json',
+    'segbits_*.db',
+    'ppips_*.db',
+    'mask_*.db',
+)
+
+
+class CacheError(Exception):
+    pass
+
+
+def default_cache_file(db_root):
+    """ Return the default location of the cache file for db_root. """
+    return os.path.join(db_root, '.prjxray_db.cache')
+
+
+def cache_file_in_dir(cache_dir, db_root):
+    """ Return the location of the cache file for db_root in cache_dir.
+
+    The file name includes a hash of the absolute path of db_root, so that
+    databases of several parts can share one cache directory.
+
+    """
+    db_root = os.path.abspath(db_root)
+    digest = hashlib.sha1(db_root.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(
+        cache_dir, '{}-{}.cache'.format(os.path.basename(db_root), digest))
+
+
+def database_source_files(db_root):
+    """ Return sorted list of the files in db_root that the cache depends on.
+    """
+    source_files = []
+    for f in os.listdir(db_root):
+        for pattern in SOURCE_PATTERNS:
+            if fnmatch.fnmatchcase(f, pattern):
+                source_files.append(f)
+                break
+
+    return sorted(source_files)
+
+
+def hash_file(fname):
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def build_manifest(db_root):
+    """ Return manifest of database source files.
+
+    Manifest is a dict of filename to [size, mtime_ns, sha1].
+
+    """
+    manifest = {}
+    for f in database_source_files(db_root):
+        fname = os.path.join(db_root, f)
+        st = os.stat(fname)
+        manifest[f] = [st.st_size, st.st_mtime_ns, hash_file(fname)]
+
+    return manifest
+
+
+def manifest_is_current(db_root, manifest):
+    """ Returns True if the source files in db_root match the manifest. """
+    source_files = database_source_files(db_root)
+    if set(source_files) != set(manifest.keys()):
+        return False
+
+    for f in source_files:
+        size, mtime_ns, sha1 = manifest[f]
+        fname = os.path.join(db_root, f)
+        st = os.stat(fname)
+        if st.st_size == size and st.st_mtime_ns == mtime_ns:
+            continue
+
+        if st.st_size != size or hash_file(fname) != sha1:
+            return False
+
+    return True
+
+
+def write_cache_file(fname, manifest, sections):
+    """ Write cache file.
+
+    fname: Path of cache file to write.  The file is replaced atomically, so
+           concurrent readers either see the old or the new cache.
+    manifest: Source manifest, see build_manifest.
+    sections: Iterable of (name, data) tuples, where data is either bytes or a
+              numpy array.
+
+    """
+    section_table = {}
+    section_data = []
+    offset = 0
+    for name, data in sections:
+        assert name not in section_table, name
+        if hasattr(data, 'dtype'):
+            # numpy array, store dtype and shape so it can be viewed in place.
+            array = data
+            data = array.tobytes()
+            section_table[name] = [
+                offset, len(data), array.dtype.str,
+                list(array.shape)
+            ]
+        else:
+            section_table[name] = [offset, len(data)]
+        section_data.append(data)
+        offset += len(data)
+        offset += -offset % SECTION_ALIGNMENT
+
+    header = json.dumps(
+        {
+            'manifest': manifest,
+            'sections': section_table,
+        }, sort_keys=True).encode('utf-8')
+
+    fd, tmp_fname = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(fname)),
+        prefix='.' + os.path.basename(fname))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PREAMBLE.pack(CACHE_MAGIC, CACHE_VERSION, len(header)))
+            f.write(header)
+            for data in section_data:
+                # data_start is aligned, so aligning the file offset also
+                # aligns the section offset.
+                f.write(b'\0' * (-f.tell() % SECTION_ALIGNMENT))
+                f.write(data)
+
+        os.replace(tmp_fname, fname)
+    except Exception:
+        os.unlink(tmp_fname)
+        raise
+
+
+class DatabaseCache(object):
+    """ Read-only view of a cache file.
+
+    Section data is memory mapped, and sections are only decoded on request.
+
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+
+        # mmap can not map an empty file.
+        if os.path.getsize(fname) < PREAMBLE.size:
+            raise CacheError('{} is truncated'.format(fname))
+
+        with open(fname, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._read_header()
+        except CacheError:
+            self.mmap.close()
+            raise
+        except (ValueError, KeyError, TypeError) as e:
+            # ValueError includes json and unicode decoding errors.
+            self.mmap.close()
+            raise CacheError('{} has a corrupt header: {}'.format(fname, e))
+
+    def _read_header(self):
+        magic, version, header_len = PREAMBLE.unpack_from(self.mmap, 0)
+        if magic != CACHE_MAGIC:
+            raise CacheError('{} is not a database cache'.format(self.fname))
+
+        if version != CACHE_VERSION:
+            raise CacheError(
+                '{} has version {}, expected {}'.format(
+                    self.fname, version, CACHE_VERSION))
+
+        header_end = PREAMBLE.size + header_len
+        if header_end > len(self.mmap):
+            raise CacheError('{} is truncated'.format(self.fname))
+
+        header = json.loads(
+            self.mmap[PREAMBLE.size:header_end].decode('utf-8'))
+
+        self.manifest = header['manifest']
+        self.sections = header['sections']
+        if not isinstance(self.manifest, dict) or not isinstance(self.sections,
+                                                                 dict):
+            raise CacheError('{} has a corrupt header'.format(self.fname))
+
+        self.data_start = header_end + (-header_end % SECTION_ALIGNMENT)
+
+    def close(self):
+        self.mmap.close()
+
+    def has_section(self, name):
+        return name in self.sections
+
+    def get_bytes(self, name):
+        """ Returns memoryview of section data. """
+        offset, length = self.sections[name][:2]
+        start = self.data_start + offset
+        return memoryview(self.mmap)[start:start + length]
+
+    def load(self, name):
+        """ Returns object stored in section. """
+        return pickle.loads(self.get_bytes(name))
+
+    def get_array(self, name):
+        """ Returns read-only numpy array view of an array section. """
+        import numpy as np
+
+        offset, length, dtype, shape = self.sections[name]
+        if length == 0:
+            return np.empty(shape, dtype=np.dtype(dtype))
+
+        return np.frombuffer(
+            self.mmap,
+            dtype=np.dtype(dtype),
+            count=length // np.dtype(dtype).itemsize,
+            offset=self.data_start + offset).reshape(shape)
+
+
+def pickle_section(name, obj):
+    return name, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def gen_database_sections(db):
+    """ Yields (name, data) for every object cached from Database db. """
+    db._read_tilegrid()
+    yield pickle_section('tilegrid', db.tilegrid)
+
+    full_grid = grid.Grid(db, db.tilegrid)
+    yield pickle_section('grid', full_grid)
+
+    from prjxray import segment_map
+    for name, data in segment_map.SegmentMap(full_grid).gen_sections():
+        yield 'segment_map/{}'.format(name), data
+
+    from prjxray import site_instances
+    for name, data in site_instances.SiteInstances(full_grid).gen_sections():
+        yield 'site_instances/{}'.format(name), data
+
+    from prjxray import compact_grid
+    compact = compact_grid.CompactGrid.from_tilegrid(db, db.tilegrid)
+    for name, data in compact.gen_sections():
+        yield 'compact_grid/{}'.format(name), data
+
+    if os.path.exists(os.path.join(db.db_root, 'tileconn.json')):
+        db._read_tileconn()
+        yield pickle_section('tileconn', db.tileconn)
+
+    for tile_type, tile_dbs in sorted(db.tile_types.items()):
+        if tile_dbs.tile_type is not None:
+            yield pickle_section(
+                'tile/{}'.format(tile_type), db.get_tile_type(tile_type))
+
+        # Build the bit indices up front, so they are cached as well.
+        segbits = db.get_tile_segbits(tile_type)
+        for block_type in segbits.segbits:
+            segbits.get_bit_index(block_type)
+
+        yield pickle_section('tile_segbits/{}'.format(tile_type), segbits)
+
+
+def build_database_cache(db, fname):
+    """ Build cache file for Database db.
+
+    db must be a Database that is not itself using a cache.
+
+    """
+    assert db.cache is None
+
+    manifest = build_manifest(db.db_root)
+    write_cache_file(fname, manifest, gen_database_sections(db))
+
+
+def open_current_cache(db_root, fname):
+    """ Returns DatabaseCache of fname if it is current, otherwise None. """
+    if not os.path.exists(fname):
+        return None
+
+    try:
+        cache = DatabaseCache(fname)
+    except CacheError:
+        return None
+
+    if manifest_is_current(db_root, cache.manifest):
+        return cache
+
+    cache.close()
+    return None
+
+
+def open_cache_file(db_root, fname, gen_sections):
+    """ Returns DatabaseCache of fname, (re)building it if required.
+
+    The cache file is (re)built from gen_sections() if it is missing, stale
+    with respect to the database at db_root or from a different cache
+    version.
+
+    Building holds an exclusive lock on fname + '.lock', so when many
+    processes (e.g. parallel fuzzer specimens) open a stale cache at once,
+    the cache is only built once and the other processes wait for it and map
+    the result.
+
+    """
+    cache = open_current_cache(db_root, fname)
+    if cache is not None:
+        return cache
+
+    with open(fname + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Another process may have built the cache while waiting.
+            cache = open_current_cache(db_root, fname)
+            if cache is not None:
+                return cache
+
+            manifest = build_manifest(db_root)
+            write_cache_file(fname, manifest, gen_sections())
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return DatabaseCache(fname)
+
+
+def open_database_cache(db, fname=None):
+    """ Returns DatabaseCache for Database db.
+
+    The cache file is (re)built if it is missing, stale or from a different
+    cache version.
+
+    """
+    if fname is None:
+        fname = default_cache_file(db.db_root)
+
+    # db must not use the cache while it is being built.
+    assert db.cache is None
+    return open_cache_file(
+        db.db_root, fname, lambda: gen_database_sections(db))
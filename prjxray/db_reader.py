@@ -0,0 +1,282 @@
+""" Reader for the segbits_*.db, mask_*.db and ppips_*.db files.
+
+All three file types are lines of a tag followed by values:
+
+  segbits: CLBLL_L.SLICEL_X0.AOUTMUX.A5Q !30_06 !30_08 30_07
+           INT_L.BYP_BOUNCE5.BYP_ALT5 always
+           CLBLL_L.SLICEL_X0.AMUX.A5Q <0 candidates>
+  mask:    bit 30_06
+  ppips:   INT_L.BYP_BOUNCE5.BYP_ALT5 always
+
+A file is read at once and every line is split into tokens.  Tags and bits are
+interned in StringTable's, so each distinct bit is only validated and parsed
+once, instead of once per occurrence, and tables can be shared across files.
+
+The result is a DbEntries, which stores the entries by column: the tag id of
+every entry, the bits of entry i as bit_ids[indptr[i]:indptr[i + 1]], and the
+word column, word bit and polarity of every bit as numpy arrays.
+
+Entries whose values are not bits (always, <0 candidates>, etc) have a mode,
+and no bits.  For ppips files the mode is the pseudo pip type.
+
+"""
+from operator import itemgetter
+import re
+import sys
+
+SEGBITS = 'segbits'
+MASK = 'mask'
+PPIPS = 'ppips'
+
+# Only the first character of a tag is checked, see util.parse_db_line.
+TAG_START = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.')
+
+# Ex: 19_39, !100_319
+BIT_PATTERN = re.compile(r'(!?)([0-9]+)_([0-9]+)$')
+
+
+class StringTable(object):
+    """ Interned strings, by id. """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_all(self, names):
+        """ Adds distinct new names, which are checked first. """
+        names = list(map(sys.intern, names))
+        start = len(self.names)
+        self.names.extend(names)
+        self.ids.update(zip(names, range(start, len(self.names))))
+
+    def intern(self, name):
+        """ Returns the id of name, adding it if required. """
+        if name not in self.ids:
+            self.add_all([name])
+
+        return self.ids[name]
+
+    def intern_all(self, names, get_ids=True):
+        """ Returns the list of ids of names, adding new names.
+
+        Each distinct new name is only checked and added once, in order of
+        first appearance.  With get_ids=False, names are only added, and None
+        is returned.
+
+        """
+        ids = self.ids
+        new_names = dict.fromkeys(names)
+        if ids:
+            new_names = [name for name in new_names if name not in ids]
+        self.add_all(list(new_names))
+
+        if get_ids:
+            return list(map(ids.__getitem__, names))
+
+
+class TagTable(StringTable):
+    """ Interned tags of segbits files. """
+
+    def add_all(self, tags):
+        if 'bit' in tags:
+            raise ValueError("Wanted bits db but got mask db")
+        if not TAG_START.issuperset(map(itemgetter(0), tags)):
+            for tag in tags:
+                assert tag[0] in TAG_START, "Invalid tag name: %s" % tag
+
+        StringTable.add_all(self, tags)
+
+
+class BitTable(StringTable):
+    """ Interned bits, with the parsed bit of each id.
+
+    word_column, word_bit and isset are lists indexed by bit id.
+
+    """
+
+    def __init__(self):
+        StringTable.__init__(self)
+        self.word_column = []
+        self.word_bit = []
+        self.isset = []
+
+    def add_all(self, bits):
+        for bit in bits:
+            m = BIT_PATTERN.match(bit)
+            assert m is not None, "Invalid bit: %s" % bit
+
+            self.isset.append(m.group(1) != '!')
+            self.word_column.append(int(m.group(2)))
+            self.word_bit.append(int(m.group(3)))
+
+        StringTable.add_all(self, bits)
+
+
+def split_lines(lines, kind):
+    """ Split the non empty lines of a .db file.
+
+    Returns (lines, tags, modes, counts, bits), where lines are the stripped
+    lines, and tags, modes and counts (number of bits) have one entry per
+    line.  bits are the bits of all lines.
+
+    """
+    db_lines = []
+    tags = []
+    modes = []
+    counts = []
+    bits = []
+    for line in lines:
+        parts = line.split()
+        if not parts:
+            continue
+
+        line = line.strip()
+        tag = parts[0]
+        mode = None
+        if kind == SEGBITS:
+            # <0 candidates> etc
+            # Ex: INT_L.BYP_BOUNCE5.BYP_ALT5 always
+            values = line[len(tag):]
+            if '<' in values or (len(parts) == 2 and parts[1] == 'always'):
+                mode = values.strip()
+        elif kind == MASK:
+            assert len(parts) == 2 and tag == 'bit', line
+        else:
+            assert kind == PPIPS, kind
+            assert len(parts) == 2, line
+            mode = parts[1]
+
+        db_lines.append(line)
+        tags.append(tag)
+        modes.append(mode)
+        if mode is None:
+            counts.append(len(parts) - 1)
+            bits += parts[1:]
+        else:
+            counts.append(0)
+
+    return db_lines, tags, modes, counts, bits
+
+
+class DbEntries(object):
+    """ Entries of a .db file, by column.
+
+    tags - StringTable of the tag names.
+    bits - BitTable of the bit names.
+    lines - Stripped source line of each entry.
+    tag_ids - numpy array, tag id of each entry.
+    modes - Mode of each entry (ex: "always"), None for entries with bits.
+    indptr - numpy array, bits of entry i are bit_ids[indptr[i]:indptr[i+1]].
+    bit_ids - numpy array, bit id of each bit, in file order.
+    word_column, word_bit - numpy arrays, the parsed bit of each bit.
+    isset - numpy array, False for bits that must be cleared (!30_06).
+
+    """
+
+    def __init__(
+            self, kind, tags, bits, lines, tag_ids, modes, counts, bit_ids):
+        import numpy as np
+
+        self.kind = kind
+        self.tags = tags
+        self.bits = bits
+        self.lines = lines
+        self.modes = modes
+
+        self.tag_ids = np.array(tag_ids, dtype=np.int32)
+        self.indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.bit_ids = np.array(bit_ids, dtype=np.int32)
+
+        self.word_column = np.array(
+            bits.word_column, dtype=np.int32)[self.bit_ids]
+        self.word_bit = np.array(bits.word_bit, dtype=np.int32)[self.bit_ids]
+        self.isset = np.array(bits.isset, dtype=np.bool_)[self.bit_ids]
+
+    def __len__(self):
+        return len(self.lines)
+
+    def items(self):
+        """ Yields (tag, bits, mode) of each entry, see util.parse_db_line.
+
+        bits is a frozenset of the bit names, None for entries with a mode.
+
+        """
+        tag_names = self.tags.names
+        bit_name = self.bits.names.__getitem__
+        indptr = self.indptr.tolist()
+        bit_ids = self.bit_ids.tolist()
+        for tag_id, mode, start, end in zip(self.tag_ids.tolist(), self.modes,
+                                            indptr, indptr[1:]):
+            if mode is None:
+                bits = frozenset(map(bit_name, bit_ids[start:end]))
+            else:
+                bits = None
+
+            yield tag_names[tag_id], bits, mode
+
+
+def parse_lines(
+        lines, kind=SEGBITS, tags=None, bits=None, validate_only=False):
+    """ Parse the lines of a .db file.
+
+    kind is SEGBITS, MASK or PPIPS.  tags and bits are the StringTable (a
+    TagTable for SEGBITS) and BitTable to intern into, pass the tables of an
+    earlier DbEntries to share ids between files.
+
+    Raises AssertionError (or ValueError for a mask line in a segbits file,
+    see util.parse_db_line) on malformed lines.
+
+    Returns DbEntries.  With validate_only, the lines are only checked, and
+    the number of entries is returned.
+
+    """
+    if tags is None:
+        tags = TagTable() if kind == SEGBITS else StringTable()
+    if bits is None:
+        bits = BitTable()
+
+    db_lines, tag_names, modes, counts, bit_names = split_lines(lines, kind)
+    tag_ids = tags.intern_all(tag_names, get_ids=not validate_only)
+    bit_ids = bits.intern_all(bit_names, get_ids=not validate_only)
+    if validate_only:
+        return len(db_lines)
+
+    return DbEntries(
+        kind, tags, bits, db_lines, tag_ids, modes, counts, bit_ids)
+
+
+def read_db(fn, kind=SEGBITS, tags=None, bits=None, validate_only=False):
+    """ Parse .db file fn, see parse_lines. """
+    with open(fn, 'r') as f:
+        return parse_lines(
+            f.read().splitlines(),
+            kind=kind,
+            tags=tags,
+            bits=bits,
+            validate_only=validate_only)
+
+
+def parse_db_line(line):
+    """ Returns (tag, bits, mode) of a single segbits line.
+
+    >>> parse_db_line("CLBLL_L.SLICEL_X0.AMUX.A5Q !30_06 30_07")[0]
+    'CLBLL_L.SLICEL_X0.AMUX.A5Q'
+    >>> sorted(parse_db_line("CLBLL_L.SLICEL_X0.AMUX.A5Q !30_06 30_07")[1])
+    ['!30_06', '30_07']
+    >>> parse_db_line("INT_L.BYP_BOUNCE5.BYP_ALT5 always")
+    ('INT_L.BYP_BOUNCE5.BYP_ALT5', None, 'always')
+
+    """
+    db_lines, tags, modes, _, bits = split_lines([line], SEGBITS)
+    assert len(db_lines), "Empty line"
+
+    TagTable().intern_all(tags, get_ids=False)
+    BitTable().intern_all(bits, get_ids=False)
+    if modes[0] is not None:
+        return tags[0], None, modes[0]
+
+    return tags[0], frozenset(bits), None
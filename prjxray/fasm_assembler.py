@@ -1,4 +1,7 @@
+import os
+import tempfile
 import fasm
+import numpy as np
 from prjxray import bitstream
 
 
@@ -181,3 +184,446 @@ class FasmAssembler(object):
                 for frame in range(bits.base_address,
                                    bits.base_address + bits.frames):
                     self.frames_in_use.add(frame)
+
+
+class ProvenanceLog(object):
+    """ Append only log of (bit position, line reference) entries.
+
+    Entries are kept in fixed size numpy chunks.  If max_memory (bytes) is
+    given and the in memory chunks exceed it, the chunks are spilled to a
+    temporary file in spill_dir.
+
+    """
+
+    DTYPE = np.dtype([('position', '<i8'), ('line_ref', '<i8')])
+
+    def __init__(self, max_memory=None, spill_dir=None, chunk_size=1 << 16):
+        self.max_memory = max_memory
+        self.spill_dir = spill_dir
+        self.chunk_size = chunk_size
+
+        self.chunk = np.empty(chunk_size, dtype=self.DTYPE)
+        self.chunk_count = 0
+        self.chunks = []
+
+        self.spill_file = None
+        self.spilled_count = 0
+
+    def memory_used(self):
+        return (len(self.chunks) + 1) * self.chunk_size * self.DTYPE.itemsize
+
+    def append(self, positions, line_ref):
+        start = 0
+        while start < len(positions):
+            count = min(
+                len(positions) - start, self.chunk_size - self.chunk_count)
+            entries = self.chunk[self.chunk_count:self.chunk_count + count]
+            entries['position'] = positions[start:start + count]
+            entries['line_ref'] = line_ref
+
+            self.chunk_count += count
+            start += count
+
+            if self.chunk_count == self.chunk_size:
+                self.chunks.append(self.chunk)
+                self.chunk = np.empty(self.chunk_size, dtype=self.DTYPE)
+                self.chunk_count = 0
+
+                if self.max_memory is not None and self.memory_used(
+                ) > self.max_memory:
+                    self.spill()
+
+    def spill(self):
+        """ Move all full chunks to the spill file. """
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+
+        self.spill_file.seek(0, os.SEEK_END)
+        for chunk in self.chunks:
+            self.spill_file.write(chunk.tobytes())
+            self.spilled_count += len(chunk)
+
+        self.chunks = []
+
+    def iter_chunks(self):
+        if self.spill_file is not None:
+            self.spill_file.flush()
+            for start in range(0, self.spilled_count, self.chunk_size):
+                self.spill_file.seek(start * self.DTYPE.itemsize)
+                yield np.frombuffer(
+                    self.spill_file.read(
+                        min(self.chunk_size, self.spilled_count - start) *
+                        self.DTYPE.itemsize),
+                    dtype=self.DTYPE)
+
+        for chunk in self.chunks:
+            yield chunk
+
+        yield self.chunk[:self.chunk_count]
+
+    def find(self, position):
+        """ Return line reference of the first entry for position, or None. """
+        for chunk in self.iter_chunks():
+            idx = np.flatnonzero(chunk['position'] == position)
+            if len(idx):
+                return int(chunk['line_ref'][idx[0]])
+
+        return None
+
+
+class VectorFasmAssembler(FasmAssembler):
+    """ FasmAssembler backed by preallocated numpy frame arrays.
+
+    Instead of a dict entry per touched bit, frame data is kept in a
+    (n_frames, FRAME_WORD_COUNT) uint32 array of values, plus a parallel mask
+    of bits that have been explicitly set or cleared.  The bits of each
+    feature are applied as one batched scatter.
+
+    To report FasmInconsistentBits, the first line touching each bit is
+    recorded in a ProvenanceLog, which is only searched when a conflict is
+    found.
+
+    """
+
+    def __init__(self, db):
+        super(VectorFasmAssembler, self).__init__(db)
+
+        frame_ranges = []
+        for bits_info in self.grid.iter_all_frames():
+            frame_ranges.append(
+                np.arange(
+                    bits_info.bits.base_address,
+                    bits_info.bits.base_address + bits_info.bits.frames,
+                    dtype=np.int64))
+
+        if frame_ranges:
+            self.frame_addresses = np.unique(np.concatenate(frame_ranges))
+        else:
+            self.frame_addresses = np.zeros(0, dtype=np.int64)
+
+        shape = (len(self.frame_addresses), bitstream.FRAME_WORD_COUNT)
+        self.values = self.allocate_frame_array(shape)
+        self.mask = self.allocate_frame_array(shape)
+        self.rows_in_use = np.zeros(len(self.frame_addresses), dtype=np.bool_)
+
+        self.lines = []
+        self.line_indices = {}
+        self.bit_log = self.create_provenance_log()
+
+    def allocate_frame_array(self, shape):
+        return np.zeros(shape, dtype=np.uint32)
+
+    def create_provenance_log(self):
+        return ProvenanceLog()
+
+    def frame_rows(self, frame_addrs):
+        """ Return row indices into the frame arrays for frame_addrs. """
+        rows = np.searchsorted(self.frame_addresses, frame_addrs)
+        valid = rows < len(self.frame_addresses)
+        valid[valid] = self.frame_addresses[rows[valid]] == frame_addrs[valid]
+        if not np.all(valid):
+            raise FasmLookupError(
+                'Frame addresses {} are not part of the grid'.format(
+                    ', '.join(
+                        '0x{:08x}'.format(int(addr))
+                        for addr in frame_addrs[~valid])))
+
+        return rows
+
+    def line_ref(self, line):
+        """ Return integer reference to line for the provenance log. """
+        if line not in self.line_indices:
+            self.line_indices[line] = len(self.lines)
+            self.lines.append(line)
+
+        return self.line_indices[line]
+
+    def line_text(self, line_ref):
+        """ Return line text of a line reference from line_ref. """
+        return self.lines[line_ref]
+
+    def bit_key(self, row, word, bit):
+        """ Return (frame, word, bit) key as used in FasmInconsistentBits. """
+        return (int(self.frame_addresses[row]), int(word), int(bit))
+
+    def line_of_bit(self, row, word, bit):
+        """ Return the line that first touched the bit. """
+        position = (int(row) * bitstream.FRAME_WORD_COUNT +
+                    int(word)) * bitstream.WORD_SIZE_BITS + int(bit)
+        line_ref = self.bit_log.find(position)
+        assert line_ref is not None, self.bit_key(row, word, bit)
+        return self.line_text(line_ref)
+
+    def apply_bits(self, rows, words, bits, isset, line, unique=None):
+        """ Set or clear bits at (rows, words, bits) according to isset.
+
+        unique: True if the caller knows no bit appears twice, None to check.
+
+        Raises FasmInconsistentBits if any bit was previously set to the
+        opposite value.
+
+        """
+        positions = (
+            rows * bitstream.FRAME_WORD_COUNT +
+            words) * bitstream.WORD_SIZE_BITS + bits
+        if unique is None:
+            unique = len(np.unique(positions)) == len(positions)
+
+        if not unique:
+            # A feature that touches the same bit more than once, apply one
+            # bit at a time so a self conflict is reported as such.
+            for idx in range(len(positions)):
+                self.apply_bits(
+                    rows[idx:idx + 1],
+                    words[idx:idx + 1],
+                    bits[idx:idx + 1],
+                    isset[idx:idx + 1],
+                    line,
+                    unique=True)
+            return
+
+        bit_masks = np.left_shift(np.uint32(1), bits.astype(np.uint32))
+
+        touched = (self.mask[rows, words] & bit_masks) != 0
+        current = (self.values[rows, words] & bit_masks) != 0
+
+        conflicts = np.flatnonzero(touched & (current != isset))
+        if len(conflicts):
+            idx = conflicts[0]
+            key = self.bit_key(rows[idx], words[idx], bits[idx])
+            other_line = self.line_of_bit(rows[idx], words[idx], bits[idx])
+            if isset[idx]:
+                raise FasmInconsistentBits(
+                    'FASM line "{}" wanted to set bit {} but was cleared by FASM line "{}"'
+                    .format(line, key, other_line))
+            else:
+                raise FasmInconsistentBits(
+                    'FASM line "{}" wanted to clear bit {} but was set by FASM line "{}"'
+                    .format(line, key, other_line))
+
+        new_bits = ~touched
+        if not np.any(new_bits):
+            return
+
+        self.bit_log.append(positions[new_bits], self.line_ref(line))
+
+        # Positions are unique, so plain fancy indexing assignment is safe.
+        self.mask[rows, words] |= bit_masks
+        set_bits = new_bits & isset
+        self.values[rows[set_bits], words[set_bits]] |= bit_masks[set_bits]
+
+    def frame_set(self, frame_addr, word_addr, bit_index, line):
+        '''Set given bit in given frame address and word'''
+        self.frame_update(frame_addr, word_addr, bit_index, True, line)
+
+    def frame_clear(self, frame_addr, word_addr, bit_index, line):
+        '''Clear given bit in given frame address and word'''
+        self.frame_update(frame_addr, word_addr, bit_index, False, line)
+
+    def frame_update(self, frame_addr, word_addr, bit_index, isset, line):
+        assert bit_index is not None
+
+        self.apply_bits(
+            self.frame_rows(np.array([frame_addr], dtype=np.int64)),
+            np.array([word_addr], dtype=np.int64),
+            np.array([bit_index], dtype=np.int64),
+            np.array([isset], dtype=np.bool_), line)
+
+    def mark_frames_in_use(self, bits):
+        """ Mark all frames of a tile's Bits as in use. """
+        start = int(np.searchsorted(self.frame_addresses, bits.base_address))
+        # All frames of a tile are in frame_addresses, so they are contiguous.
+        self.rows_in_use[start:start + bits.frames] = True
+
+    def enable_feature(self, tile, feature, address, line):
+        gridinfo = self.grid.gridinfo_at_tilename(tile)
+        segbits = self.grid.get_tile_segbits_at_tilename(tile)
+
+        self.seen_tile.add(tile)
+
+        db_k = '%s.%s' % (gridinfo.tile_type, feature)
+
+        try:
+            bits_and_feature_bits = segbits.feature_to_feature_bits(
+                gridinfo.bits, db_k, address)
+        except KeyError:
+            raise FasmLookupError(
+                "Segment DB %s, key %s not found from line '%s'" %
+                (gridinfo.tile_type, db_k, line))
+
+        if bits_and_feature_bits is None:
+            return
+
+        bits, feature_bits = bits_and_feature_bits
+        if len(feature_bits.isset) == 0:
+            return
+
+        # Only the tile position is added to the precompiled bits.
+        self.apply_bits(
+            self.frame_rows(bits.base_address + feature_bits.word_columns),
+            bits.offset + feature_bits.word_indices,
+            feature_bits.bit_indices,
+            feature_bits.isset,
+            line,
+            unique=feature_bits.unique)
+
+        self.mark_frames_in_use(gridinfo.bits[feature_bits.block_type])
+
+    def mark_roi_frames(self, roi):
+        for tile in roi.gen_tiles():
+            gridinfo = self.grid.gridinfo_at_tilename(tile)
+
+            for block_type in gridinfo.bits:
+                self.mark_frames_in_use(gridinfo.bits[block_type])
+
+    def get_frames(self, sparse=False):
+        if not sparse:
+            rows = np.arange(len(self.frame_addresses))
+        else:
+            # Same as FasmAssembler, any frame of a tile setting a bit, and
+            # any frame with an explicitly set or cleared bit is output.
+            rows = np.flatnonzero(self.rows_in_use | self.mask.any(axis=1))
+
+        return dict(
+            zip(
+                self.frame_addresses[rows].tolist(),
+                self.values[rows].tolist()))
+
+
+# Lines of a FASM file parsed per fasm.parse_fasm_string call.
+FASM_BLOCK_LINES = 4096
+
+
+def read_fasm_blocks(filename, block_lines=FASM_BLOCK_LINES):
+    """ Yields (line numbers, text) blocks of the lines of a FASM file.
+
+    Blank and comment only lines are dropped, so fasm.parse_fasm_string(text)
+    returns one FasmLine per entry of line numbers.  Blocks hold at most
+    block_lines lines.
+
+    """
+    line_numbers = []
+    texts = []
+    with open(filename) as f:
+        for line_number, text in enumerate(f, start=1):
+            stripped = text.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+
+            line_numbers.append(line_number)
+            texts.append(stripped)
+            if len(texts) >= block_lines:
+                yield line_numbers, '\n'.join(texts) + '\n'
+                line_numbers = []
+                texts = []
+
+    if texts:
+        yield line_numbers, '\n'.join(texts) + '\n'
+
+
+class StreamingFasmAssembler(VectorFasmAssembler):
+    """ VectorFasmAssembler that parses FASM files in blocks of lines.
+
+    Each block of block_lines lines is parsed with one
+    fasm.parse_fasm_string call, so memory stays bounded without paying the
+    parser set up cost per line.
+
+    Line provenance is kept as line numbers into the FASM file rather than
+    line strings.  The line is re-read from the file only when a conflict is
+    reported.
+
+    max_memory: Optional memory ceiling in bytes.  If the frame arrays alone
+                exceed half of it, they are backed by a temporary file in
+                spill_dir.  The provenance log is spilled to spill_dir once it
+                exceeds the remainder.
+
+    """
+
+    def __init__(
+            self,
+            db,
+            max_memory=None,
+            spill_dir=None,
+            block_lines=FASM_BLOCK_LINES):
+        self.max_memory = max_memory
+        self.block_lines = block_lines
+        self.spill_dir = spill_dir
+        self.frame_array_memory = 0
+
+        super(StreamingFasmAssembler, self).__init__(db)
+
+        self.filename = None
+        self.current_line_number = None
+
+    def allocate_frame_array(self, shape):
+        nbytes = np.dtype(np.uint32).itemsize * shape[0] * shape[1]
+
+        # Both the values and the mask arrays are allocated with this shape.
+        if self.max_memory is None or 2 * nbytes <= self.max_memory // 2:
+            self.frame_array_memory += nbytes
+            return np.zeros(shape, dtype=np.uint32)
+
+        return np.memmap(
+            tempfile.TemporaryFile(dir=self.spill_dir),
+            dtype=np.uint32,
+            mode='w+',
+            shape=shape)
+
+    def create_provenance_log(self):
+        max_memory = None
+        if self.max_memory is not None:
+            max_memory = max(0, self.max_memory - self.frame_array_memory)
+
+        return ProvenanceLog(max_memory=max_memory, spill_dir=self.spill_dir)
+
+    def line_ref(self, line):
+        """ Line references >= 1 are line numbers within self.filename.
+
+        Lines that did not come from the file (e.g. extra_features) are
+        stored as text, and referenced by negative numbers.
+
+        """
+        if self.current_line_number is not None:
+            return self.current_line_number
+
+        return -1 - super(StreamingFasmAssembler, self).line_ref(line)
+
+    def line_text(self, line_ref):
+        if line_ref < 0:
+            return super(StreamingFasmAssembler, self).line_text(-1 - line_ref)
+
+        with open(self.filename) as f:
+            for line_number, text in enumerate(f, start=1):
+                if line_number == line_ref:
+                    break
+            else:
+                assert False, (self.filename, line_ref)
+
+        for line in fasm.parse_fasm_string(text):
+            if line.set_feature:
+                line_strs = tuple(fasm.fasm_line_to_string(line))
+                assert len(line_strs) == 1
+                return line_strs[0]
+
+        assert False, (self.filename, line_ref, text)
+
+    def parse_fasm_filename(self, filename, extra_features=[]):
+        self.filename = filename
+
+        missing_features = []
+        for line_numbers, block in read_fasm_blocks(filename,
+                                                    self.block_lines):
+            lines = list(fasm.parse_fasm_string(block))
+            assert len(lines) == len(line_numbers), (filename, line_numbers[0])
+
+            for line_number, line in zip(line_numbers, lines):
+                self.current_line_number = line_number
+                self.add_fasm_line(line, missing_features)
+
+        self.current_line_number = None
+
+        for line in extra_features:
+            self.add_fasm_line(line, missing_features)
+
+        if missing_features:
+            raise FasmLookupError('\n'.join(missing_features))
@@ -1,3 +1,4 @@
+import multiprocessing
 import re
 import fasm
 from prjxray import bitstream
@@ -28,6 +29,76 @@ def mk_fasm(tile_name, feature):
         comment=None)
 
 
+def unknown_bits_fasm_lines(frame, remaining_bits):
+    """ Yield warning and annotation FasmLine's for bits that were not
+    converted to features. """
+    yield fasm.FasmLine(
+        set_feature=None,
+        annotations=None,
+        comment=" In frame 0x{:08x} {} bits were not converted.".format(
+            frame,
+            len(remaining_bits),
+        ))
+
+    for bit in remaining_bits:
+        frame_offset = frame % bitstream.FRAME_ALIGNMENT
+        aligned_frame = frame - frame_offset
+        wordidx = bit // bitstream.WORD_SIZE_BITS
+        bitidx = bit % bitstream.WORD_SIZE_BITS
+
+        annotations = []
+        annotations.append(
+            fasm.Annotation(
+                'unknown_bit', '{:08x}_{}_{}'.format(frame, wordidx, bitidx)))
+        annotations.append(
+            fasm.Annotation(
+                'unknown_segment', '0x{:08x}'.format(aligned_frame)))
+        annotations.append(
+            fasm.Annotation(
+                'unknown_segbit', '{:02d}_{:02d}'.format(frame_offset, bit)))
+        yield fasm.FasmLine(
+            set_feature=None,
+            annotations=tuple(annotations),
+            comment=None,
+        )
+
+
+# Per process state of parallel disassembly workers.
+_worker_disassembler = None
+_worker_bitdata = None
+
+
+def _init_worker(db_args, bitdata):
+    from prjxray.db import Database
+
+    global _worker_disassembler
+    global _worker_bitdata
+
+    db_root, cache_file, compact_grid = db_args
+    _worker_disassembler = FasmDisassembler(
+        Database(db_root, cache_file=cache_file, compact_grid=compact_grid))
+    _worker_bitdata = bitdata
+
+
+def _find_features_in_tiles(args):
+    """ Worker function, returns (fasm lines, solved_bitdata) for tiles. """
+    tiles, verbose = args
+
+    fasm_lines = []
+    solved_bitdata = bitstream.BitData()
+    for tile, block_type, bits in tiles:
+        fasm_lines.extend(
+            _worker_disassembler.find_features_in_tile(
+                tile,
+                block_type,
+                bits,
+                solved_bitdata,
+                _worker_bitdata,
+                verbose=verbose))
+
+    return fasm_lines, solved_bitdata
+
+
 class FasmDisassembler(object):
     """ Given a Project X-ray data, outputs FasmLine tuples for bits set. """
 
@@ -78,15 +149,19 @@ class FasmDisassembler(object):
         for ones_matched, feature in tile_segbits.match_bitdata(block_type,
                                                                 bits, bitdata):
             for frame, bit in ones_matched:
-                if frame not in solved_bitdata:
-                    solved_bitdata[frame] = set()
-                solved_bitdata[frame].add(bit)
+                solved_bitdata.add_bit(frame, bit)
 
             yield mk_fasm(tile_name=tile_name, feature=feature)
 
     def find_features_in_bitstream(self, bitdata, verbose=False):
-        solved_bitdata = {}
-        frames = set(bitdata.keys())
+        """ Yields FasmLine's for the features set in bitdata.
+
+        bitdata is a bitstream.BitData (load_bitdata output is converted).
+
+        """
+        bitdata = bitstream.BitData.from_bitdata(bitdata)
+        solved_bitdata = bitstream.BitData()
+        frames = set(bitdata)
         tiles_checked = set()
 
         emitted_features = set()
@@ -94,10 +169,6 @@ class FasmDisassembler(object):
         while len(frames) > 0:
             frame = frames.pop()
 
-            # Skip frames that were emptied in a previous iteration.
-            if not bitdata[frame]:
-                continue
-
             # Iterate over all tiles that use this frame.
             for bits_info in self.segment_map.segment_info_for_frame(frame):
                 # Don't examine a tile twice
@@ -105,13 +176,8 @@ class FasmDisassembler(object):
                     continue
 
                 # Check if this frame has any data for the relevant tile.
-                any_column = False
-                for word_idx in range(bits_info.bits.words):
-                    if word_idx + bits_info.bits.offset in bitdata[frame][0]:
-                        any_column = True
-                        break
-
-                if not any_column:
+                if not bitdata.has_words(frame, bits_info.bits.offset,
+                                         bits_info.bits.words):
                     continue
 
                 tiles_checked.add((bits_info.tile, bits_info.block_type))
@@ -123,46 +189,117 @@ class FasmDisassembler(object):
                         emitted_features.add(fasm_line)
                         yield fasm_line
 
-            remaining_bits = bitdata[frame][1]
-            if frame in solved_bitdata:
-                remaining_bits -= solved_bitdata[frame]
+            remaining_bits = list(
+                bitstream.iter_set_bits(
+                    bitdata.frame_bitmap(frame)
+                    & ~solved_bitdata.frame_bitmap(frame)))
 
             if len(remaining_bits) > 0 and verbose:
                 # Some bits were not decoded, add warning and annotations to
                 # FASM.
-                yield fasm.FasmLine(
-                    set_feature=None,
-                    annotations=None,
-                    comment=" In frame 0x{:08x} {} bits were not converted.".
-                    format(
-                        frame,
-                        len(remaining_bits),
-                    ))
-
-                for bit in remaining_bits:
-                    frame_offset = frame % bitstream.FRAME_ALIGNMENT
-                    aligned_frame = frame - frame_offset
-                    wordidx = bit // bitstream.WORD_SIZE_BITS
-                    bitidx = bit % bitstream.WORD_SIZE_BITS
-
-                    annotations = []
-                    annotations.append(
-                        fasm.Annotation(
-                            'unknown_bit', '{:08x}_{}_{}'.format(
-                                frame, wordidx, bitidx)))
-                    annotations.append(
-                        fasm.Annotation(
-                            'unknown_segment',
-                            '0x{:08x}'.format(aligned_frame)))
-                    annotations.append(
-                        fasm.Annotation(
-                            'unknown_segbit', '{:02d}_{:02d}'.format(
-                                frame_offset, bit)))
-                    yield fasm.FasmLine(
-                        set_feature=None,
-                        annotations=tuple(annotations),
-                        comment=None,
-                    )
+                for fasm_line in unknown_bits_fasm_lines(frame,
+                                                         remaining_bits):
+                    yield fasm_line
+
+    def tiles_with_data(self, bitdata):
+        """ Return sorted list of (tile, block_type, bits) with data in bitdata.
+        """
+        tiles = {}
+        for frame, frame_bits_info in \
+                self.segment_map.segment_info_for_frames(sorted(bitdata)):
+            for bits_info in frame_bits_info:
+                key = (bits_info.tile, bits_info.block_type)
+                if key in tiles:
+                    continue
+
+                if bitdata.has_words(frame, bits_info.bits.offset,
+                                     bits_info.bits.words):
+                    tiles[key] = bits_info.bits
+
+        return [
+            (tile, block_type, bits)
+            for (tile, block_type), bits in sorted(
+                tiles.items(),
+                key=lambda item: (
+                    self.grid.tile_key(item[0][0]), item[0][1].value))
+        ]
+
+    def find_features_in_bitstream_parallel(
+            self, bitdata, processes=None, verbose=False):
+        """ Parallel version of find_features_in_bitstream.
+
+        Tiles with data are partitioned in grid order across a process pool.
+        Forked workers inherit this disassembler, with the segbits of the
+        tile types in use already loaded.  With other start methods, each
+        worker opens its own (read-only) Database with the same arguments as
+        self.db, so using a database cache is recommended.
+
+        Returns the same set of FasmLine's as find_features_in_bitstream, in a
+        deterministic order: features in grid order, followed by unknown bits
+        in frame order.
+
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        bitdata = bitstream.BitData.from_bitdata(bitdata)
+
+        tiles = self.tiles_with_data(bitdata)
+
+        # Several chunks per process to even out the load.
+        chunk_size = max(1, len(tiles) // (processes * 4))
+        chunks = [
+            (tiles[idx:idx + chunk_size], verbose)
+            for idx in range(0, len(tiles), chunk_size)
+        ]
+
+        global _worker_disassembler
+        global _worker_bitdata
+
+        if multiprocessing.get_start_method() == 'fork':
+            for tile_type in set(self.grid.gridinfo_at_tilename(tile).tile_type
+                                 for tile, _, _ in tiles):
+                self.db.get_tile_segbits(tile_type)
+
+            _worker_disassembler = self
+            _worker_bitdata = bitdata
+            pool = multiprocessing.Pool(processes=processes)
+        else:
+            cache_file = None
+            if self.db.cache is not None:
+                cache_file = self.db.cache.fname
+            db_args = (self.db.db_root, cache_file, self.db.compact_grid)
+
+            pool = multiprocessing.Pool(
+                processes=processes,
+                initializer=_init_worker,
+                initargs=(db_args, bitdata))
+        try:
+            results = pool.map(_find_features_in_tiles, chunks)
+        finally:
+            pool.close()
+            pool.join()
+            _worker_disassembler = None
+            _worker_bitdata = None
+
+        emitted_features = set()
+        solved_bitdata = bitstream.BitData()
+        for fasm_lines, chunk_solved_bitdata in results:
+            for fasm_line in fasm_lines:
+                if fasm_line not in emitted_features:
+                    emitted_features.add(fasm_line)
+                    yield fasm_line
+
+            solved_bitdata |= chunk_solved_bitdata
+
+        if not verbose:
+            return
+
+        remaining_bitdata = bitdata - solved_bitdata
+        for frame in sorted(remaining_bitdata):
+            for fasm_line in unknown_bits_fasm_lines(
+                    frame, remaining_bitdata.frame_bits(frame)):
+                yield fasm_line
 
     def is_zero_feature(self, feature):
         parts = feature.split('.')
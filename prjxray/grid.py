@@ -1,4 +1,3 @@
-from prjxray import segment_map
 from prjxray.grid_types import BlockType, GridLoc, GridInfo, BitAlias, Bits, BitsInfo
 from prjxray.tile_segbits_alias import TileSegbitsAlias
 
@@ -55,6 +54,13 @@ class Grid(object):
         x, y = zip(*self.loc.keys())
         self._dims = (min(x), max(x), min(y), max(y))
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Database is not pickled, see prjxray.db_cache.
+        del state['db']
+        state.pop('_site_instances', None)
+        return state
+
     def tiles(self):
         """ Return list of tiles. """
         return self.tileinfo.keys()
@@ -83,6 +89,12 @@ class Grid(object):
     def gridinfo_at_tilename(self, tilename):
         return self.tileinfo[tilename]
 
+    def iter_sites(self):
+        """ Yields (site, tile) of every site in the grid. """
+        for tile, tileinfo in self.tileinfo.items():
+            for site in tileinfo.sites:
+                yield site, tile
+
     def iter_all_frames(self):
         for tile, tileinfo in self.tileinfo.items():
             for block_type, bits in tileinfo.bits.items():
@@ -93,8 +105,45 @@ class Grid(object):
                 )
 
     def get_segment_map(self):
+        from prjxray import segment_map
+
+        cache = getattr(self.db, 'cache', None)
+        if cache is not None and cache.has_section('segment_map/meta'):
+            return segment_map.SegmentMap.from_cache(cache)
+
         return segment_map.SegmentMap(self)
 
+    def get_site_instances(self):
+        """ Returns the SiteInstances table of this grid.
+
+        The table is built once per grid, or loaded from the database cache.
+
+        """
+        from prjxray import site_instances
+
+        if getattr(self, '_site_instances', None) is None:
+            cache = getattr(self.db, 'cache', None)
+            if cache is not None and cache.has_section(
+                    'site_instances/tile_names'):
+                self._site_instances = site_instances.SiteInstances.from_cache(
+                    cache)
+            else:
+                self._site_instances = site_instances.SiteInstances(self)
+
+        return self._site_instances
+
+    def get_instance_sites(self, tilename):
+        """ Yields the Site's of tilename, see Tile.get_instance_sites. """
+        gridinfo = self.gridinfo_at_tilename(tilename)
+        tile = self.db.get_tile_type(gridinfo.tile_type)
+
+        site_instances = self.get_site_instances()
+        if site_instances.is_valid(tilename):
+            return site_instances.get_instance_sites(tilename, tile)
+
+        # Not resolved by the table, let Tile report why.
+        return tile.get_instance_sites(gridinfo)
+
     def tile_key(self, tilename):
         gridinfo = self.gridinfo_at_tilename(tilename)
         loc = self.loc_of_tilename(tilename)
@@ -0,0 +1,372 @@
+""" Graph of the nodes of a part, built from tileconn.json.
+
+A node is a set of wires (in different tiles) that are electrically
+connected.  prjxray.connections.Connections yields the individual wire to wire
+connections of tileconn.json, which then have to be merged into nodes.
+NodeGraph does the same with integer arrays:
+
+ - Every (tile, wire) pair gets a dense wire id.  Tiles are sorted by name,
+   and the wires of a tile are numbered in sorted wire name order of its tile
+   type, so wire id = tile_wire_base[tile] + index of wire in tile type.
+ - The connections of each tileconn.json entry are computed for all tiles of
+   the tile type at once.
+ - Wires are merged into nodes with an array based union-find.
+
+Wire pairs of tileconn.json with a wire that is missing from its tile type
+can not be part of the graph.  They are listed in missing_wire_pairs, as
+(tile type a, wire a, tile type b, wire b) tuples.
+
+The result is a CSR table of node to wires (node_indptr, node_wires) and a
+table of wire to node (wire_node).  All columns can be written to a cache file
+(see prjxray.db_cache), which is memory mapped when read back.
+
+"""
+import pickle
+import numpy as np
+
+from prjxray import db_cache
+
+# Names of the numpy columns of a NodeGraph.
+COLUMNS = (
+    'tile_names',
+    'tile_type',
+    'tile_wire_base',
+    'type_wire_indptr',
+    'type_wire_names',
+    'wire_node',
+    'node_indptr',
+    'node_wires',
+)
+
+
+def union_find(num_elements, a, b):
+    """ Merge the sets containing a[i] and b[i] for every i.
+
+    Returns array of the representative element of the set of each element,
+    which is the smallest element in the set.
+
+    Rather than processing one pair at a time, every iteration hooks the root
+    of the larger representative of each pair to the smaller one, followed by
+    pointer jumping until every element points to its root.
+
+    >>> union_find(6, np.array([0, 4, 3]), np.array([2, 5, 4])).tolist()
+    [0, 1, 0, 3, 3, 3]
+
+    """
+    parent = np.arange(num_elements, dtype=np.int64)
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+
+    while len(a) > 0:
+        root_a = parent[a]
+        root_b = parent[b]
+        low = np.minimum(root_a, root_b)
+        high = np.maximum(root_a, root_b)
+
+        # Pairs already in the same set are done.
+        merge = low != high
+        if not merge.any():
+            break
+
+        a = a[merge]
+        b = b[merge]
+        np.minimum.at(parent, high[merge], low[merge])
+
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    return parent
+
+
+def encode_names(names):
+    return np.array([name.encode('ascii') for name in names], dtype=np.bytes_)
+
+
+class NodeGraph(object):
+    """ Nodes of a Database, see module documentation. """
+
+    def __init__(self, columns, meta):
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+        self.tile_type_names = meta['tile_type_names']
+        self.missing_wire_pairs = meta['missing_wire_pairs']
+
+        # Tile type index to dict of wire name to wire index, built on request.
+        self._type_wire_index = {}
+
+    @staticmethod
+    def from_database(db):
+        """ Build NodeGraph from Database db. """
+        db._read_tilegrid()
+        db._read_tileconn()
+        tilegrid = db.tilegrid
+
+        tile_names = sorted(tilegrid.keys())
+        tile_type_names = sorted(
+            set(tilegrid[tile]['type'] for tile in tile_names))
+        tile_type_index = dict(
+            (tile_type, idx) for idx, tile_type in enumerate(tile_type_names))
+
+        type_wires = []
+        for tile_type in tile_type_names:
+            tile_dbs = db.tile_types.get(tile_type)
+            if tile_dbs is None or tile_dbs.tile_type is None:
+                type_wires.append([])
+            else:
+                type_wires.append(
+                    sorted(db.get_tile_type(tile_type).get_wires()))
+
+        type_wire_count = np.array(
+            [len(wires) for wires in type_wires], dtype=np.int64)
+        type_wire_indptr = np.zeros(len(type_wires) + 1, dtype=np.int64)
+        type_wire_indptr[1:] = np.cumsum(type_wire_count)
+
+        ntiles = len(tile_names)
+        tile_type = np.array(
+            [tile_type_index[tilegrid[tile]['type']] for tile in tile_names],
+            dtype=np.int32)
+        grid_x = np.array(
+            [tilegrid[tile]['grid_x'] for tile in tile_names], dtype=np.int64)
+        grid_y = np.array(
+            [tilegrid[tile]['grid_y'] for tile in tile_names], dtype=np.int64)
+
+        tile_wire_base = np.zeros(ntiles + 1, dtype=np.int64)
+        tile_wire_base[1:] = np.cumsum(type_wire_count[tile_type])
+        num_wires = int(tile_wire_base[-1])
+
+        # Dense (x, y) table of tile index, -1 if unpopulated.
+        x_min, y_min = int(grid_x.min()), int(grid_y.min())
+        loc_table = np.full(
+            (int(grid_x.max()) - x_min + 1, int(grid_y.max()) - y_min + 1),
+            -1,
+            dtype=np.int64)
+        loc_table[grid_x - x_min, grid_y - y_min] = np.arange(ntiles)
+
+        type_wire_index = [
+            dict((wire, idx)
+                 for idx, wire in enumerate(wires))
+            for wires in type_wires
+        ]
+
+        wire_a = []
+        wire_b = []
+        missing_wire_pairs = set()
+        for conn in db.tileconn:
+            type_name_a, type_name_b = conn['tile_types']
+            if type_name_a not in tile_type_index or \
+                    type_name_b not in tile_type_index:
+                continue
+
+            type_a = tile_type_index[type_name_a]
+            type_b = tile_type_index[type_name_b]
+
+            # Wire pairs where both wires exist in their tile types, the
+            # others can not be part of the graph.
+            pairs = []
+            for pair in conn['wire_pairs']:
+                idx_a = type_wire_index[type_a].get(pair[0])
+                idx_b = type_wire_index[type_b].get(pair[1])
+                if idx_a is None or idx_b is None:
+                    missing_wire_pairs.add(
+                        (type_name_a, pair[0], type_name_b, pair[1]))
+                else:
+                    pairs.append((idx_a, idx_b))
+
+            if not pairs:
+                continue
+
+            tiles_a = np.flatnonzero(tile_type == type_a)
+            target_x = grid_x[tiles_a] + conn['grid_deltas'][0] - x_min
+            target_y = grid_y[tiles_a] + conn['grid_deltas'][1] - y_min
+            in_grid = (target_x >= 0) & (target_x < loc_table.shape[0]) & (
+                target_y >= 0) & (
+                    target_y < loc_table.shape[1])
+
+            tiles_a = tiles_a[in_grid]
+            tiles_b = loc_table[target_x[in_grid], target_y[in_grid]]
+            valid = tiles_b != -1
+            tiles_a = tiles_a[valid]
+            tiles_b = tiles_b[valid]
+            valid = tile_type[tiles_b] == type_b
+            tiles_a = tiles_a[valid]
+            tiles_b = tiles_b[valid]
+
+            pairs = np.array(pairs, dtype=np.int64)
+            wire_a.append(
+                (
+                    tile_wire_base[tiles_a][:, np.newaxis] +
+                    pairs[np.newaxis, :, 0]).ravel())
+            wire_b.append(
+                (
+                    tile_wire_base[tiles_b][:, np.newaxis] +
+                    pairs[np.newaxis, :, 1]).ravel())
+
+        if wire_a:
+            wire_a = np.concatenate(wire_a)
+            wire_b = np.concatenate(wire_b)
+        else:
+            wire_a = np.zeros(0, dtype=np.int64)
+            wire_b = np.zeros(0, dtype=np.int64)
+
+        roots = union_find(num_wires, wire_a, wire_b)
+        _, wire_node = np.unique(roots, return_inverse=True)
+        wire_node = wire_node.astype(np.int64).ravel()
+
+        num_nodes = int(wire_node.max()) + 1 if num_wires else 0
+        node_wires = np.argsort(wire_node, kind='stable').astype(np.int64)
+        node_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        node_indptr[1:] = np.cumsum(
+            np.bincount(wire_node, minlength=num_nodes))
+
+        columns = {
+            'tile_names':
+            encode_names(tile_names),
+            'tile_type':
+            tile_type,
+            'tile_wire_base':
+            tile_wire_base,
+            'type_wire_indptr':
+            type_wire_indptr,
+            'type_wire_names':
+            encode_names([wire for wires in type_wires for wire in wires]),
+            'wire_node':
+            wire_node,
+            'node_indptr':
+            node_indptr,
+            'node_wires':
+            node_wires,
+        }
+
+        meta = {
+            'tile_type_names': tile_type_names,
+            'missing_wire_pairs': sorted(missing_wire_pairs),
+        }
+
+        return NodeGraph(columns, meta)
+
+    @staticmethod
+    def from_cache(cache):
+        """ Build NodeGraph from columns stored in a DatabaseCache. """
+        columns = dict((name, cache.get_array(name)) for name in COLUMNS)
+        return NodeGraph(columns, cache.load('meta'))
+
+    def gen_sections(self):
+        """ Yields (name, data) sections for prjxray.db_cache. """
+        for name in COLUMNS:
+            yield name, getattr(self, name)
+
+        yield 'meta', pickle.dumps(
+            {
+                'tile_type_names': self.tile_type_names,
+                'missing_wire_pairs': self.missing_wire_pairs,
+            },
+            protocol=pickle.HIGHEST_PROTOCOL)
+
+    def num_wires(self):
+        return len(self.wire_node)
+
+    def num_nodes(self):
+        return len(self.node_indptr) - 1
+
+    def tile_index(self, tile):
+        """ Return the index of tile, raise KeyError if not present. """
+        key = tile.encode('ascii')
+        idx = int(np.searchsorted(self.tile_names, key))
+        if idx >= len(self.tile_names) or self.tile_names[idx] != key:
+            raise KeyError(tile)
+
+        return idx
+
+    def wire_index(self, tile_type_idx):
+        """ Return dict of wire name to wire index of tile type index. """
+        if tile_type_idx not in self._type_wire_index:
+            start = int(self.type_wire_indptr[tile_type_idx])
+            end = int(self.type_wire_indptr[tile_type_idx + 1])
+            self._type_wire_index[tile_type_idx] = dict(
+                (self.type_wire_names[idx].decode('ascii'), idx - start)
+                for idx in range(start, end))
+
+        return self._type_wire_index[tile_type_idx]
+
+    def wire_id(self, tile, wire):
+        """ Return wire id of (tile, wire), raise KeyError if not present. """
+        tile_idx = self.tile_index(tile)
+        wire_idx = self.wire_index(int(self.tile_type[tile_idx]))[wire]
+        return int(self.tile_wire_base[tile_idx]) + wire_idx
+
+    def wire_name(self, wire_id):
+        """ Return (tile, wire) of wire id. """
+        tile_idx = int(
+            np.searchsorted(self.tile_wire_base, wire_id, side='right')) - 1
+        tile_type_idx = int(self.tile_type[tile_idx])
+        name_idx = int(self.type_wire_indptr[tile_type_idx]) + (
+            wire_id - int(self.tile_wire_base[tile_idx]))
+
+        return (
+            self.tile_names[tile_idx].decode('ascii'),
+            self.type_wire_names[name_idx].decode('ascii'))
+
+    def node_of_wire(self, wire_id):
+        """ Return node id of wire id. """
+        return int(self.wire_node[wire_id])
+
+    def node_id(self, tile, wire):
+        """ Return node id of (tile, wire). """
+        return self.node_of_wire(self.wire_id(tile, wire))
+
+    def wires_of_node(self, node):
+        """ Return array of the wire ids in node. """
+        return self.node_wires[self.node_indptr[node]:self.node_indptr[node +
+                                                                       1]]
+
+    def node_wire_names(self, node):
+        """ Return list of (tile, wire) in node. """
+        return [
+            self.wire_name(int(wire_id))
+            for wire_id in self.wires_of_node(node)
+        ]
+
+    def iter_nodes(self, min_wires=1):
+        """ Yields (node id, list of (tile, wire)) of nodes.
+
+        Only nodes with at least min_wires wires are returned.
+
+        """
+        sizes = np.diff(self.node_indptr)
+        for node in np.flatnonzero(sizes >= min_wires):
+            yield int(node), self.node_wire_names(int(node))
+
+
+def default_cache_file(db):
+    """ Return the default location of the node graph cache of Database db.
+
+    The node graph is stored next to the database cache, None if db does not
+    use a cache.
+
+    """
+    if db.cache is None:
+        return None
+
+    return db.cache.fname + '.nodes'
+
+
+def open_node_graph(db, fname=None):
+    """ Returns NodeGraph of Database db, stored in cache file fname.
+
+    The cache file is (re)built if it is missing or stale.  If fname is None,
+    default_cache_file is used.  Without a cache file, the NodeGraph is built
+    in memory.
+
+    """
+    if fname is None:
+        fname = default_cache_file(db)
+    if fname is None:
+        return NodeGraph.from_database(db)
+
+    cache = db_cache.open_cache_file(
+        db.db_root, fname, lambda: NodeGraph.from_database(db).gen_sections())
+    return NodeGraph.from_cache(cache)
@@ -1,8 +1,21 @@
 import sqlite3
 import progressbar
 import pyjson5 as json5
+import multiprocessing
 import os.path
 
+# Number of rows per executemany call while building the database.
+INSERT_BATCH_SIZE = 10000
+
+# Settings used while building the database.  The database is rebuilt from
+# scratch if the build is interrupted, so durability is not needed.
+BUILD_PRAGMAS = (
+    'PRAGMA journal_mode = WAL;',
+    'PRAGMA synchronous = OFF;',
+    'PRAGMA cache_size = -262144;',
+    'PRAGMA temp_store = MEMORY;',
+)
+
 
 def create_tables(conn):
     c = conn.cursor()
@@ -30,47 +43,93 @@ def create_tables(conn):
     conn.commit()
 
 
+def read_node_file(fname):
+    """ Returns (node name, tuple of wire names) of a node JSON5 file. """
+    with open(fname) as f:
+        node_wires = json5.load(f)
+
+    return node_wires['node'], tuple(
+        wire['wire'] for wire in node_wires['wires'])
+
+
+def tile_name_from_file(tile_file):
+    # build/specimen_001/tile_DSP_L_X34Y145.json5
+    root, _ = os.path.splitext(os.path.basename(tile_file))
+    return root[5:]
+
+
 class NodeLookup(object):
     def __init__(self, database):
         self.conn = sqlite3.connect(database)
 
-    def build_database(self, nodes, tiles):
-        create_tables(self.conn)
+    def build_database(self, nodes, tiles, processes=None):
+        """ Build database from node JSON5 files and tiles from read_root_csv.
 
+        Node files are parsed by a pool of processes (cpu_count() if processes
+        is None, no pool if processes is 1), and rows are inserted in batches
+        within a single transaction.  Indices are created once all rows are
+        present.
+
+        """
         c = self.conn.cursor()
-        tile_names = []
-        for tile_type in tiles:
-            for tile in tiles[tile_type]:
-                tile_names.append(tile)
+        for pragma in BUILD_PRAGMAS:
+            c.execute(pragma)
+
+        create_tables(self.conn)
 
         tile_pkeys = {}
-        for tile_file in progressbar.progressbar(tile_names):
-            # build/specimen_001/tile_DSP_L_X34Y145.json5
-            root, _ = os.path.splitext(os.path.basename(tile_file))
-            tile = root[5:]
-            c.execute("INSERT INTO tile(name) VALUES (?);", (tile, ))
-            tile_pkeys[tile] = c.lastrowid
+        for tile_type in tiles:
+            for tile_file in tiles[tile_type]:
+                tile = tile_name_from_file(tile_file)
+                tile_pkeys[tile] = len(tile_pkeys) + 1
+
+        c.executemany(
+            "INSERT INTO tile(pkey, name) VALUES (?, ?);",
+            ((pkey, tile) for tile, pkey in tile_pkeys.items()))
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        pool = None
+        if processes > 1:
+            pool = multiprocessing.Pool(processes=processes)
+            node_iter = pool.imap(read_node_file, nodes, chunksize=64)
+        else:
+            node_iter = map(read_node_file, nodes)
 
         nodes_processed = set()
-        for node in progressbar.progressbar(nodes):
-            with open(node) as f:
-                node_wires = json5.load(f)
-                assert node_wires['node'] not in nodes_processed
-                nodes_processed.add(node_wires['node'])
-
-                c.execute(
-                    "INSERT INTO node(name) VALUES (?);",
-                    (node_wires['node'], ))
-                node_pkey = c.lastrowid
-
-                for wire in node_wires['wires']:
-                    tile = wire['wire'].split('/')[0]
-
-                    tile_pkey = tile_pkeys[tile]
-                    c.execute(
-                        """
-INSERT INTO wire(name, tile_pkey, node_pkey) VALUES (?, ?, ?);""",
-                        (wire['wire'], tile_pkey, node_pkey))
+        node_rows = []
+        wire_rows = []
+
+        def flush():
+            c.executemany(
+                "INSERT INTO node(pkey, name) VALUES (?, ?);", node_rows)
+            c.executemany(
+                """
+INSERT INTO wire(name, tile_pkey, node_pkey) VALUES (?, ?, ?);""", wire_rows)
+            del node_rows[:]
+            del wire_rows[:]
+
+        try:
+            for node, wires in progressbar.progressbar(node_iter,
+                                                       max_value=len(nodes)):
+                assert node not in nodes_processed
+                nodes_processed.add(node)
+                node_pkey = len(nodes_processed)
+
+                node_rows.append((node_pkey, node))
+                for wire in wires:
+                    tile = wire.split('/')[0]
+                    wire_rows.append((wire, tile_pkeys[tile], node_pkey))
+
+                if len(wire_rows) >= INSERT_BATCH_SIZE:
+                    flush()
+
+            flush()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
 
         self.conn.commit()
 
@@ -99,6 +158,47 @@ SELECT wire.name FROM wire
         for row in c:
             yield row[0][len(tile) + 1:]
 
+    def site_pin_nodes_to_wires(self, tile_nodes):
+        """ Batched version of site_pin_node_to_wires.
+
+        tile_nodes is an iterable of (tile, node).  Returns dict of
+        (tile, node) to list of wires, for the pairs that have wires.
+
+        """
+        c = self.conn.cursor()
+        c.execute(
+            """
+CREATE TEMP TABLE IF NOT EXISTS tile_node_query(
+    tile_name TEXT,
+    node_name TEXT
+    );""")
+        c.execute("DELETE FROM tile_node_query;")
+        c.executemany(
+            "INSERT INTO tile_node_query(tile_name, node_name) VALUES (?, ?);",
+            (
+                (tile, node)
+                for tile, node in set(tile_nodes)
+                if node is not None))
+
+        c.execute(
+            """
+SELECT tile_node_query.tile_name, tile_node_query.node_name, wire.name
+FROM tile_node_query
+    INNER JOIN tile ON tile.name = tile_node_query.tile_name
+    INNER JOIN node ON node.name = tile_node_query.node_name
+    INNER JOIN wire
+        ON wire.tile_pkey = tile.pkey AND wire.node_pkey = node.pkey
+ORDER BY wire.pkey;
+""")
+
+        wires = {}
+        for tile, node, wire in c:
+            wires.setdefault((tile, node), []).append(wire[len(tile) + 1:])
+
+        # End the transaction opened by filling the query table.
+        self.conn.commit()
+        return wires
+
     def wires_for_tile(self, tile):
         c = self.conn.cursor()
         c.execute(
@@ -110,3 +210,36 @@ SELECT wire.name FROM wire
 """, (tile, ))
         for row in c:
             yield row[0][len(tile) + 1:]
+
+    def wires_for_tiles(self, tiles):
+        """ Batched version of wires_for_tile.
+
+        Returns dict of tile to list of wires, for the tiles that have wires.
+
+        """
+        c = self.conn.cursor()
+        c.execute(
+            """
+CREATE TEMP TABLE IF NOT EXISTS tile_query(
+    tile_name TEXT
+    );""")
+        c.execute("DELETE FROM tile_query;")
+        c.executemany(
+            "INSERT INTO tile_query(tile_name) VALUES (?);",
+            ((tile, ) for tile in set(tiles)))
+
+        c.execute(
+            """
+SELECT tile.name, wire.name FROM tile_query
+    INNER JOIN tile ON tile.name = tile_query.tile_name
+    INNER JOIN wire ON wire.tile_pkey = tile.pkey
+ORDER BY wire.pkey;
+""")
+
+        wires = {}
+        for tile, wire in c:
+            wires.setdefault(tile, []).append(wire[len(tile) + 1:])
+
+        # End the transaction opened by filling the query table.
+        self.conn.commit()
+        return wires
@@ -0,0 +1,372 @@
+""" Node level routing graph and router.
+
+The routing graph has one vertex per node of prjxray.node_graph.NodeGraph and
+one edge per programmable PIP.  A PIP is a segbits feature
+"<tile type>.<dst wire>.<src wire>" whose wires are connected by a PIP of the
+tile type.  All edges are stored in integer arrays, as a CSR table of source
+node to edges (edge_indptr), with the destination node, tile and PIP of every
+edge.
+
+Routing is an iterative A* search over the graph, where every PIP costs 1.
+Every PIP is in a tile of both nodes it connects, so a PIP into a node gets at
+most the size of that node's grid bounding box (width + height) closer to the
+destination.  Only nodes that are both driven by and drive a PIP can be in the
+middle of a route, so the heuristic is the distance between the bounding boxes
+of a node and the destination node, divided by the largest size of such a
+node.
+
+Global nodes (ex: clock spines), which span a large part of the grid, are left
+out of that size, or the heuristic would be useless.  A route through a global
+node costs at least one PIP into its last global node plus the distance from
+there to the destination, so the heuristic is capped at the smallest such cost
+over all global nodes.  This keeps the heuristic admissible (and consistent),
+and the routes minimal in number of PIPs.
+
+The graph can be written to a cache file (see prjxray.db_cache), which is
+memory mapped when read back.
+
+"""
+import heapq
+import pickle
+import numpy as np
+
+from prjxray import db_cache
+
+# Names of the numpy columns of a RoutingGraph.
+COLUMNS = (
+    'node_bbox',
+    'global_nodes',
+    'edge_indptr',
+    'edge_dst',
+    'edge_tile',
+    'edge_pip',
+    'pip_names',
+)
+
+# Nodes spanning more than 1 / GLOBAL_SPAN_DIVISOR of the grid are global.
+GLOBAL_SPAN_DIVISOR = 4
+
+
+class RoutingError(Exception):
+    pass
+
+
+def read_pip_features(fname, tile_type, pips):
+    """ Yields (dst wire, src wire) of the PIP features of a segbits file.
+
+    pips is the set of (dst wire, src wire) PIPs of tile type, other features
+    are ignored.
+
+    """
+    with open(fname) as f:
+        for l in f:
+            l = l.strip()
+            if not l:
+                continue
+
+            parts = l.split(' ')[0].split('.')
+            if len(parts) != 3 or parts[0] != tile_type:
+                continue
+
+            if (parts[1], parts[2]) in pips:
+                yield parts[1], parts[2]
+
+
+class RoutingGraph(object):
+    """ PIP graph between the nodes of a NodeGraph, see module documentation.
+    """
+
+    def __init__(self, nodes, columns, meta):
+        self.nodes = nodes
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+        self.local_span = meta['local_span']
+        self.global_bbox = self.node_bbox[self.global_nodes]
+
+        # Python lists of the CSR table, built on first search.
+        self._adjacency = None
+
+    @staticmethod
+    def from_database(db, nodes):
+        """ Build RoutingGraph of Database db, with NodeGraph nodes. """
+        db._read_tilegrid()
+
+        tile_names = [name.decode('ascii') for name in nodes.tile_names]
+        grid_x = np.array(
+            [db.tilegrid[tile]['grid_x'] for tile in tile_names],
+            dtype=np.int32)
+        grid_y = np.array(
+            [db.tilegrid[tile]['grid_y'] for tile in tile_names],
+            dtype=np.int32)
+
+        num_nodes = nodes.num_nodes()
+        node_bbox = np.zeros((num_nodes, 4), dtype=np.int32)
+        if num_nodes > 0:
+            wire_tile = np.repeat(
+                np.arange(len(tile_names)), np.diff(nodes.tile_wire_base))
+            node_tiles = wire_tile[nodes.node_wires]
+            starts = nodes.node_indptr[:-1]
+            node_bbox[:, 0] = np.minimum.reduceat(grid_x[node_tiles], starts)
+            node_bbox[:, 1] = np.minimum.reduceat(grid_y[node_tiles], starts)
+            node_bbox[:, 2] = np.maximum.reduceat(grid_x[node_tiles], starts)
+            node_bbox[:, 3] = np.maximum.reduceat(grid_y[node_tiles], starts)
+
+        pip_names = []
+        edge_src = []
+        edge_dst = []
+        edge_tile = []
+        edge_pip = []
+        for tile_type_idx, tile_type in enumerate(nodes.tile_type_names):
+            tile_dbs = db.tile_types.get(tile_type)
+            if tile_dbs is None or tile_dbs.segbits is None or \
+                    tile_dbs.tile_type is None:
+                continue
+
+            tile_type_obj = db.get_tile_type(tile_type)
+            pips = set(
+                (pip.net_to, pip.net_from) for pip in tile_type_obj.get_pips())
+            features = sorted(
+                set(read_pip_features(tile_dbs.segbits, tile_type, pips)))
+            if not features:
+                continue
+
+            wire_index = nodes.wire_index(tile_type_idx)
+            dst_wires = np.array(
+                [wire_index[dst] for dst, _ in features], dtype=np.int64)
+            src_wires = np.array(
+                [wire_index[src] for _, src in features], dtype=np.int64)
+            pip_ids = np.arange(
+                len(pip_names), len(pip_names) + len(features), dtype=np.int32)
+            pip_names.extend('{}.{}'.format(dst, src) for dst, src in features)
+
+            tiles = np.flatnonzero(nodes.tile_type == tile_type_idx)
+            base = nodes.tile_wire_base[tiles][:, np.newaxis]
+            edge_src.append(nodes.wire_node[base + src_wires].ravel())
+            edge_dst.append(nodes.wire_node[base + dst_wires].ravel())
+            edge_tile.append(np.repeat(tiles, len(features)).astype(np.int32))
+            edge_pip.append(np.tile(pip_ids, len(tiles)))
+
+        def concatenate(arrays, dtype):
+            if arrays:
+                return np.concatenate(arrays).astype(dtype)
+            return np.zeros(0, dtype=dtype)
+
+        edge_src = concatenate(edge_src, np.int64)
+        order = np.argsort(edge_src, kind='stable')
+        edge_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        edge_indptr[1:] = np.cumsum(np.bincount(edge_src, minlength=num_nodes))
+
+        edge_dst = concatenate(edge_dst, np.int64)[order]
+        local_span, global_nodes = routing_bounds(
+            node_bbox, edge_indptr, edge_dst)
+
+        columns = {
+            'node_bbox':
+            node_bbox,
+            'global_nodes':
+            global_nodes,
+            'edge_indptr':
+            edge_indptr,
+            'edge_dst':
+            edge_dst,
+            'edge_tile':
+            concatenate(edge_tile, np.int32)[order],
+            'edge_pip':
+            concatenate(edge_pip, np.int32)[order],
+            'pip_names':
+            np.array(
+                [name.encode('ascii') for name in pip_names], dtype=np.bytes_),
+        }
+
+        return RoutingGraph(nodes, columns, {'local_span': local_span})
+
+    @staticmethod
+    def from_cache(nodes, cache):
+        """ Build RoutingGraph from columns stored in a DatabaseCache. """
+        columns = dict((name, cache.get_array(name)) for name in COLUMNS)
+        return RoutingGraph(nodes, columns, cache.load('meta'))
+
+    def gen_sections(self):
+        """ Yields (name, data) sections for prjxray.db_cache. """
+        for name in COLUMNS:
+            yield name, getattr(self, name)
+
+        yield 'meta', pickle.dumps(
+            {
+                'local_span': self.local_span,
+            },
+            protocol=pickle.HIGHEST_PROTOCOL)
+
+    def num_edges(self):
+        return len(self.edge_dst)
+
+    def pip_name(self, edge):
+        """ Return name of the PIP of edge, "<tile>.<dst wire>.<src wire>". """
+        return '{}.{}'.format(
+            self.nodes.tile_names[self.edge_tile[edge]].decode('ascii'),
+            self.pip_names[self.edge_pip[edge]].decode('ascii'))
+
+    def _get_adjacency(self):
+        if self._adjacency is None:
+            self._adjacency = (
+                self.edge_indptr.tolist(), self.edge_dst.tolist(),
+                self.node_bbox.tolist())
+
+        return self._adjacency
+
+    def find_path(self, src_node, dst_node, blocked_nodes=()):
+        """ Returns list of edges of a minimal path from src_node to dst_node.
+
+        The path does not use any node in blocked_nodes.  Raises RoutingError
+        if there is no such path.
+
+        """
+        edge_indptr, edge_dst, node_bbox = self._get_adjacency()
+        if src_node in blocked_nodes or dst_node in blocked_nodes:
+            raise RoutingError(
+                'Node {} or {} is already in use'.format(src_node, dst_node))
+
+        dst_x0, dst_y0, dst_x1, dst_y1 = node_bbox[dst_node]
+        span = max(self.local_span, 1)
+
+        # Bound on the cost of any route through a global node.
+        global_cost = None
+        if len(self.global_bbox):
+            x0, y0, x1, y1 = self.global_bbox.T
+            distance = np.maximum(np.maximum(dst_x0 - x1, x0 - dst_x1), 0) + \
+                np.maximum(np.maximum(dst_y0 - y1, y0 - dst_y1), 0)
+            global_cost = 1 + -(-int(distance.min()) // span)
+
+        def heuristic(node):
+            x0, y0, x1, y1 = node_bbox[node]
+            distance = max(dst_x0 - x1, x0 - dst_x1, 0) + max(
+                dst_y0 - y1, y0 - dst_y1, 0)
+            cost = -(-distance // span)
+            if global_cost is not None and cost > global_cost:
+                return global_cost
+            return cost
+
+        cost = {src_node: 0}
+        prev_edge = {src_node: None}
+        heap = [(heuristic(src_node), 0, src_node)]
+        while heap:
+            _, node_cost, node = heapq.heappop(heap)
+            if node == dst_node:
+                break
+
+            if node_cost > cost[node]:
+                continue
+
+            next_cost = node_cost + 1
+            for edge in range(edge_indptr[node], edge_indptr[node + 1]):
+                next_node = edge_dst[edge]
+                if next_node in blocked_nodes:
+                    continue
+
+                if next_cost < cost.get(next_node, next_cost + 1):
+                    cost[next_node] = next_cost
+                    prev_edge[next_node] = edge
+                    heapq.heappush(
+                        heap, (
+                            next_cost + heuristic(next_node), next_cost,
+                            next_node))
+        else:
+            raise RoutingError(
+                'Could not find route from node {} to node {}'.format(
+                    src_node, dst_node))
+
+        path = []
+        node = dst_node
+        while prev_edge[node] is not None:
+            edge = prev_edge[node]
+            path.append(edge)
+            # The source of an edge is the CSR row it is in.
+            node = int(np.searchsorted(self.edge_indptr, edge,
+                                       side='right')) - 1
+        path.reverse()
+        return path
+
+    def route(self, pairs, blocked_nodes=()):
+        """ Route each (src, dst) in pairs, where src and dst are (tile, wire).
+
+        Pairs are routed in order, and routes do not share nodes with earlier
+        routes or blocked_nodes (a set of node ids).  Returns list of the PIP
+        names (see pip_name) of each route.
+
+        """
+        blocked_nodes = set(blocked_nodes)
+        routes = []
+        for src, dst in pairs:
+            src_node = self.nodes.node_id(*src)
+            dst_node = self.nodes.node_id(*dst)
+
+            path = self.find_path(src_node, dst_node, blocked_nodes)
+
+            blocked_nodes.add(src_node)
+            blocked_nodes.update(int(self.edge_dst[edge]) for edge in path)
+            routes.append([self.pip_name(edge) for edge in path])
+
+        return routes
+
+
+def routing_bounds(node_bbox, edge_indptr, edge_dst):
+    """ Returns (local_span, global_nodes) of the heuristic of find_path.
+
+    Only nodes with PIPs both into and out of them are considered.  Nodes
+    larger than 1 / GLOBAL_SPAN_DIVISOR of the size of the grid are global,
+    global_nodes is an array of their ids.  local_span is the largest size of
+    the other nodes.
+
+    """
+    num_nodes = len(node_bbox)
+    if num_nodes == 0:
+        return 0, np.zeros(0, dtype=np.int64)
+
+    spans = node_bbox[:, 2] - node_bbox[:, 0] + node_bbox[:, 3] - \
+        node_bbox[:, 1]
+    grid_span = int(
+        node_bbox[:, 2].max() - node_bbox[:, 0].min() + node_bbox[:, 3].max() -
+        node_bbox[:, 1].min())
+
+    routing = (np.bincount(edge_dst, minlength=num_nodes) > 0) & (
+        np.diff(edge_indptr) > 0)
+    is_global = routing & (spans * GLOBAL_SPAN_DIVISOR > grid_span)
+    local = routing & ~is_global
+
+    local_span = int(spans[local].max()) if local.any() else 0
+    return local_span, np.flatnonzero(is_global).astype(np.int64)
+
+
+def default_cache_file(db):
+    """ Return the default location of the routing graph cache of Database db.
+
+    The routing graph is stored next to the database cache, None if db does
+    not use a cache.
+
+    """
+    if db.cache is None:
+        return None
+
+    return db.cache.fname + '.routing'
+
+
+def open_routing_graph(db, fname=None, node_graph_fname=None):
+    """ Returns RoutingGraph of Database db, stored in cache file fname.
+
+    The cache file is (re)built if it is missing or stale.  If fname is None,
+    default_cache_file is used.  Without a cache file, the RoutingGraph is
+    built in memory.  node_graph_fname is passed to Database.node_graph.
+
+    """
+    if fname is None:
+        fname = default_cache_file(db)
+
+    nodes = db.node_graph(node_graph_fname)
+    if fname is None:
+        return RoutingGraph.from_database(db, nodes)
+
+    cache = db_cache.open_cache_file(
+        db.db_root, fname,
+        lambda: RoutingGraph.from_database(db, nodes).gen_sections())
+    return RoutingGraph.from_cache(nodes, cache)
@@ -0,0 +1,215 @@
+""" Reading and writing of segdata files, the input of segmatch.
+
+segdata files are written by prjxray.segmaker.Segmaker, one per tile type and
+specimen.  Two formats exist:
+
+Text format (segdata_*.txt), one entry per line:
+
+  seg 00020880_048
+  bit 30_00
+  tag CLB.SLICE_X0.AFF.DMUX.CY 1
+
+Binary format (segdata_*.bin), all integers little endian:
+
+  8 bytes  - Magic, SEGDATA_MAGIC
+  4 bytes  - Format version, SEGDATA_VERSION
+  4 bytes  - Number of bit names, B
+  4 bytes  - Number of tag names, T
+  4 bytes  - Number of segments
+  B names  - Bit vocabulary, sorted.  Each name is a 2 byte length followed by
+             the ASCII name.
+  T names  - Tag vocabulary, sorted, same encoding.
+  Segments - Each segment is its name, followed by 3 bitsets:
+             - bits set in the segment (B bits)
+             - tags with value 1 (T bits)
+             - tags with value 0 (T bits)
+             A bitset of N bits is stored as ceil(N / 64) 8 byte words, bit i
+             of the set is bit i % 64 of word i // 64.
+
+Both formats are read by tools/segmatch and by read_segdata.
+
+"""
+from collections import namedtuple
+import struct
+
+SEGDATA_MAGIC = b'PRJXSEGD'
+SEGDATA_VERSION = 1
+
+HEADER = struct.Struct('<8sIIII')
+NAME_LENGTH = struct.Struct('<H')
+""" Segment - Contents of one segment of a segdata file.
+
+name - Segment name, ex: 00020880_048.
+bits - Set of the bit names set in the segment, ex: 30_00.
+tags - Dict of tag name to value (0 or 1).
+
+"""
+Segment = namedtuple('Segment', 'name bits tags')
+
+
+def bitset_size(num_entries):
+    """ Returns number of bytes of a bitset of num_entries entries. """
+    return (num_entries + 63) // 64 * 8
+
+
+def encode_bitset(indices, num_entries):
+    value = 0
+    for idx in indices:
+        value |= 1 << idx
+
+    return value.to_bytes(bitset_size(num_entries), 'little')
+
+
+def decode_bitset(data, names):
+    """ Returns list of names of the entries set in bitset data. """
+    value = int.from_bytes(data, 'little')
+    result = []
+    while value:
+        low_bit = value & -value
+        result.append(names[low_bit.bit_length() - 1])
+        value ^= low_bit
+
+    return result
+
+
+def write_name(f, name):
+    data = name.encode('ascii')
+    f.write(NAME_LENGTH.pack(len(data)))
+    f.write(data)
+
+
+def write_segdata_bin(f, segments):
+    """ Write segments in binary format to binary file object f.
+
+    segments is an iterable of Segment (or equivalent tuples).  Segments are
+    written in the given order.
+
+    """
+    segments = list(segments)
+
+    bit_names = sorted(set(bit for seg in segments for bit in seg.bits))
+    tag_names = sorted(set(tag for seg in segments for tag in seg.tags))
+    bit_ids = dict((name, idx) for idx, name in enumerate(bit_names))
+    tag_ids = dict((name, idx) for idx, name in enumerate(tag_names))
+
+    f.write(
+        HEADER.pack(
+            SEGDATA_MAGIC, SEGDATA_VERSION, len(bit_names), len(tag_names),
+            len(segments)))
+    for name in bit_names:
+        write_name(f, name)
+    for name in tag_names:
+        write_name(f, name)
+
+    for seg in segments:
+        write_name(f, seg.name)
+        f.write(
+            encode_bitset((bit_ids[bit] for bit in seg.bits), len(bit_names)))
+        f.write(
+            encode_bitset(
+                (tag_ids[tag] for tag, value in seg.tags.items() if value),
+                len(tag_names)))
+        f.write(
+            encode_bitset(
+                (tag_ids[tag] for tag, value in seg.tags.items() if not value),
+                len(tag_names)))
+
+
+def is_segdata_bin(fname):
+    """ Returns True if fname is a binary segdata file. """
+    with open(fname, 'rb') as f:
+        return f.read(len(SEGDATA_MAGIC)) == SEGDATA_MAGIC
+
+
+class SegdataReader(object):
+    """ Sequential reader of an in memory binary segdata file. """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size):
+        if self.offset + size > len(self.data):
+            raise ValueError('Truncated segdata file')
+
+        data = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def read_name(self):
+        length, = NAME_LENGTH.unpack(self.read(NAME_LENGTH.size))
+        return bytes(self.read(length)).decode('ascii')
+
+
+def read_segdata_bin(f):
+    """ Yields Segment for each segment of binary segdata file object f. """
+    reader = SegdataReader(memoryview(f.read()))
+
+    magic, version, num_bits, num_tags, num_segments = HEADER.unpack(
+        reader.read(HEADER.size))
+    if magic != SEGDATA_MAGIC:
+        raise ValueError('Not a binary segdata file')
+    if version != SEGDATA_VERSION:
+        raise ValueError(
+            'segdata version {}, expected {}'.format(version, SEGDATA_VERSION))
+
+    bit_names = [reader.read_name() for _ in range(num_bits)]
+    tag_names = [reader.read_name() for _ in range(num_tags)]
+
+    for _ in range(num_segments):
+        name = reader.read_name()
+        bits = decode_bitset(reader.read(bitset_size(num_bits)), bit_names)
+        tags = {}
+        for tag in decode_bitset(reader.read(bitset_size(num_tags)),
+                                 tag_names):
+            tags[tag] = 1
+        for tag in decode_bitset(reader.read(bitset_size(num_tags)),
+                                 tag_names):
+            tags[tag] = 0
+
+        yield Segment(name=name, bits=set(bits), tags=tags)
+
+
+def read_segdata_txt(f):
+    """ Yields Segment for each segment of text segdata file object f. """
+    segment = None
+    for l in f:
+        l = l.strip()
+        if not l:
+            continue
+
+        parts = l.split()
+        if parts[0] == 'seg':
+            if segment is not None:
+                yield segment
+            segment = Segment(name=parts[1], bits=set(), tags={})
+        elif parts[0] == 'bit':
+            segment.bits.add(parts[1])
+        elif parts[0] == 'tag':
+            assert parts[2] in ('0', '1'), l
+            segment.tags[parts[1]] = int(parts[2])
+        else:
+            assert False, l
+
+    if segment is not None:
+        yield segment
+
+
+def read_segdata(fname):
+    """ Returns list of Segment of segdata file fname, in either format. """
+    if is_segdata_bin(fname):
+        with open(fname, 'rb') as f:
+            return list(read_segdata_bin(f))
+    else:
+        with open(fname) as f:
+            return list(read_segdata_txt(f))
+
+
+def write_segdata_txt(f, segments):
+    """ Write segments in text format to text file object f. """
+    for seg in segments:
+        print('seg %s' % seg.name, file=f)
+        for bit in sorted(seg.bits):
+            print('bit %s' % bit, file=f)
+        for tag, value in sorted(seg.tags.items()):
+            print('tag %s %d' % (tag, value), file=f)
@@ -10,14 +10,23 @@ bit 31_49
 tag CLB.SLICE_X0.AFF.DMUX.CY 1
 tag CLB.SLICE_X0.BFF.DMUX.BX 0
 
-tilegrid.json provides tile addresses
+The grid of the database (see prjxray.grid) provides tile addresses
 '''
 
-import os, json, re
+import functools
+import os, re
+from prjxray import bitstream
+from prjxray import segdata as segdata_file
 from prjxray import util
+from prjxray.grid_types import BlockType
 
 BLOCK_TYPES = set(('CLB_IO_CLK', 'BLOCK_RAM', 'CFG_CLB'))
 
+# Segment bits are kept as integers, frame << SEGBIT_FRAME_SHIFT | bit, and
+# only formatted as "%02d_%02d" % (frame, bit) when written.
+SEGBIT_FRAME_SHIFT = 16
+SEGBIT_BIT_MASK = (1 << SEGBIT_FRAME_SHIFT) - 1
+
 
 def recurse_sum(x):
     '''Count number of nested iterable occurances'''
@@ -38,6 +47,80 @@ def json_hex2i(s):
     return int(s[2:], 16)
 
 
+def segbit_name(segbit):
+    '''Format segment bit integer as segdata bit name
+
+    >>> segbit_name(3 << SEGBIT_FRAME_SHIFT | 45)
+    '03_45'
+    '''
+    return "%02d_%02d" % (
+        segbit >> SEGBIT_FRAME_SHIFT, segbit & SEGBIT_BIT_MASK)
+
+
+@functools.lru_cache(maxsize=None)
+def normalize_tile_type(tile_type):
+    '''
+    Simplify names by simplifying like:
+    -CLBLM_L => CLB
+    -CENTER_INTER_R => CENTER_INTER
+    -CLK_HROW_TOP_R => CLK_HROW
+    -LIOB33 => IOB33
+    '''
+    tile_type_norm = re.sub("(_TOP|_BOT|LL|LM)?_[LR]$", "", tile_type)
+
+    if tile_type_norm in ['LIOB33', 'RIOB33']:
+        tile_type_norm = 'IOB33'
+
+    return tile_type_norm
+
+
+@functools.lru_cache(maxsize=None)
+def normalize_tag_name(name):
+    '''Drop .SLICEM. / .SLICEL. from site tag names'''
+    # XXX: does this come from name?
+    name = ('.' + name).replace(".SLICEM.", ".").replace(".SLICEL.", ".")
+    return name[1:]
+
+
+def site_parity(digits, site):
+    assert digits.isdigit(), "Invalid name in %s" % site
+    return int(digits[-1]) % 2
+
+
+def sitekey(site):
+    '''
+    Return name of site used in tags, relative to its tile.
+
+    Simplify names like:
+    -SLICE_X12Y102 => SLICE_X0
+    -SLICE_X13Y102 => SLICE_X1
+    -RAMB18_X0Y41 => RAMB18_Y1
+    -IOB_X0Y12 => IOB_Y0
+    Most other sites are unique within their tile, and use the site prefix.
+
+    >>> sitekey('SLICE_X13Y102'), sitekey('RAMB18_X0Y41'), sitekey('DSP48_X0Y2')
+    ('SLICE_X1', 'RAMB18_Y1', 'DSP48')
+    '''
+    site_prefix = site.split('_')[0]
+
+    if site_prefix == 'SLICE':
+        assert site.startswith('SLICE_X'), "Invalid name in %s" % site
+        x, sep, _ = site[len('SLICE_X'):].partition('Y')
+        assert sep, "Invalid name in %s" % site
+        return "SLICE_X%d" % site_parity(x, site)
+    elif site_prefix == 'RAMB18':
+        assert site.startswith('RAMB18_X'), "Invalid name in %s" % site
+        return "RAMB18_Y%d" % site_parity(site[site.rindex('Y') + 1:], site)
+    elif site_prefix == 'IOB':
+        assert '_X' in site, site
+        return "%s_Y%d" % (
+            site[:site.rindex('_X')],
+            site_parity(site[site.rindex('Y') + 1:], site))
+    else:
+        # TODO: maybe verify against DB?
+        return site_prefix
+
+
 def add_site_group_zero(segmk, site, prefix, vals, zero_val, val):
     '''
     Correctly add tags for a multi-bit enumerated value
@@ -99,10 +182,9 @@ class Segmaker:
 
     def index_sites(self):
         self.verbose and print("Indexing sites")
-        self.sites = {}
-        for tilename, tiledata in self.grid.items():
-            for site in tiledata["sites"]:
-                self.sites[site] = tilename
+        self.sites = dict(self.grid.iter_sites())
+        # site to sitekey(site), filled as sites are compiled
+        self.site_keys = {}
         self.verbose and print("Sites indexed")
 
     def set_def_bt(self, block_type):
@@ -112,45 +194,35 @@ class Segmaker:
         self.def_bt = block_type
 
     def load_grid(self):
-        '''Load self.grid holding tile addresses'''
-        with open(os.path.join(self.db_root, "tilegrid.json"), "r") as f:
-            self.grid = json.load(f)
-        assert "segments" not in self.grid, "Old format tilegrid.json"
+        '''
+        Load self.grid holding tile addresses
+
+        self.grid is a prjxray.grid.Grid, or a CompactGrid backed by the
+        memory mapped database cache when XRAY_DATABASE_CACHE is set (see
+        util.get_database).
+        '''
+        self.grid = util.get_database(self.db_root).grid()
 
     def load_bits(self, bitsfile):
         '''Load self.bits holding the bits that occured in the bitstream'''
         '''
         Format:
-        self.bits[base_frame][bit_wordidx] = set()
-        Where elements are (bit_frame, bit_wordidx, bit_bitidx))
-        bit_frame is a relatively large number forming the FDRI address
-        base_frame is a truncated bit_frame address of related FDRI addresses
-        0 <= bit_wordidx <= 100
-        0 <= bit_bitidx < 31
+        self.bits is a bitstream.BitData
+        Bits of a tile are found through the frames sharing its base_frame,
+        see BitData.frames_in_base
 
         Sample bits input
         bit_00020500_000_08
         bit_00020500_000_14
         bit_00020500_000_17
         '''
-        self.bits = dict()
         print("Loading bits from %s." % bitsfile)
         with open(bitsfile, "r") as f:
-            for line in f:
-                # ex: bit_00020500_000_17
-                line = line.split("_")
-                bit_frame = int(line[1], 16)
-                bit_wordidx = int(line[2], 10)
-                bit_bitidx = int(line[3], 10)
-                base_frame = bit_frame & ~0x7f
-
-                self.bits.setdefault(base_frame, dict()).setdefault(
-                    bit_wordidx, set()).add(
-                        (bit_frame, bit_wordidx, bit_bitidx))
+            self.bits = bitstream.BitData.load(f)
         if self.verbose:
             print(
                 'Loaded bits: %u bits in %u base frames' %
-                (recurse_sum(self.bits), len(self.bits)))
+                (self.bits.count_bits(), len(self.bits.base_frames())))
 
     def add_site_tag(self, site, name, value):
         '''
@@ -179,201 +251,152 @@ class Segmaker:
             'segmaker add tag: tile %s tag %s = %s' % (tile, name, value))
         self.tile_tags.setdefault(tile, dict())[name] = value
 
-    def compile(self, bitfilter=None):
+    def get_sitekey(self, site):
+        if site not in self.site_keys:
+            self.site_keys[site] = sitekey(site)
+            self.verbose and print(
+                'site %s w/ %s prefix => tag %s' %
+                (site, site.split('_')[0], self.site_keys[site]))
+
+        return self.site_keys[site]
+
+    def segment_bits(self, bitj, bitfilter=None):
+        '''
+        Return list of the bits set within the segment of bitj
+
+        Bits are integers, see SEGBIT_FRAME_SHIFT.
+        bitj: grid_types.Bits of the segment
+        '''
+        base_frame = bitj.base_address
+        first_bit = bitj.offset * bitstream.WORD_SIZE_BITS
+        mask = bitstream.word_mask(bitj.offset, bitj.words)
+
+        bits = []
+        for bit_frame in self.bits.frames_in_base(base_frame):
+            bitname_frame = bit_frame - base_frame
+
+            # Skip bits above the frame limit.
+            if bitname_frame >= bitj.frames:
+                break
+
+            window = (self.bits.frame_bitmap(bit_frame) & mask) >> first_bit
+            frame_key = bitname_frame << SEGBIT_FRAME_SHIFT
+            for bitname_bit in bitstream.iter_set_bits(window):
+                # some bits are hard to de-correlate
+                # allow force dropping some bits from search space for practicality
+                if bitfilter is None or bitfilter(bitname_frame, bitname_bit):
+                    bits.append(frame_key | bitname_bit)
+
+        return bits
+
+    def compile(self, bitfilter=None, skip_untagged=False):
+        '''
+        Build self.segments_by_type from the bits and tags
+
+        bitfilter: optional function (frame, bit) returning False for bits to
+                   drop from the search space
+        skip_untagged: only visit the tiles that have tags, rather than every
+                       tile in the grid.  Segments are only created for tagged
+                       tiles either way, but then self.segments_by_type only
+                       lists the tile types that have tags.
+        '''
         print("Compiling segment data.")
         tags_used = set()
         sites_used = set()
         tile_types_found = set()
 
         self.segments_by_type = dict()
+        '''
+        segments is a group related to a specific tile type (ex: CLBLM_L)
+        It is composed of bits (possible bits) and tags (observed instances)
+        segments[segname]["bits"] is a list of bits, see segment_bits
+        segments[segname]["tags"][tag] = value, where tag is a tuple of the
+        tag name parts, joined with "." by write()
 
-        def add_segbits(segments, segname, tiledata, bitfilter=None):
-            '''
-            Add and populate segments[segname]["bits"]
-            Gives all of the bits that could exist for the space we are exploring
-            Also add segments[segname]["tags"], but don't fill
-
-            segments is a group related to a specific tile type (ex: CLBLM_L)
-            It is composed of bits (possible bits) and tags (observed instances)
-            segments[segname]["bits"].add(bitname)
-            segments[segname]["tags"][tag] = value
-
-            segname: FDRI address + word offset string
-            tiledata: tilegrid info for this tile
-            '''
-            assert segname not in segments
-            segment = segments.setdefault(
-                segname,
-                {
-                    "bits": set(),
+        segname: FDRI address + word offset string
+        '''
+
+        def getseg(segments, segname, bitj):
+            if segname not in segments:
+                segments[segname] = {
+                    "bits": self.segment_bits(bitj, bitfilter=bitfilter),
                     "tags": dict(),
                     # verify new entries match this
-                    "offset": bitj["offset"],
-                    "words": bitj["words"],
-                    "frames": bitj["frames"],
-                })
-
-            base_frame = json_hex2i(bitj["baseaddr"])
-            for wordidx in range(bitj["offset"],
-                                 bitj["offset"] + bitj["words"]):
-                if base_frame not in self.bits:
-                    continue
-                if wordidx not in self.bits[base_frame]:
-                    continue
-                for bit_frame, bit_wordidx, bit_bitidx in self.bits[
-                        base_frame][wordidx]:
-                    bitname_frame = bit_frame - base_frame
-                    bitname_bit = 32 * (
-                        bit_wordidx - bitj["offset"]) + bit_bitidx
-
-                    # Skip bits above the frame limit.
-                    if bitname_frame >= bitj["frames"]:
-                        continue
-
-                    # some bits are hard to de-correlate
-                    # allow force dropping some bits from search space for practicality
-                    if bitfilter is None or bitfilter(bitname_frame,
-                                                      bitname_bit):
-                        bitname = "%02d_%02d" % (bitname_frame, bitname_bit)
-                        segment["bits"].add(bitname)
-
-            return segment
-
+                    "offset": bitj.offset,
+                    "words": bitj.words,
+                    "frames": bitj.frames,
+                }
+            else:
+                segment = segments[segname]
+                assert segment["offset"] == bitj.offset
+                assert segment["words"] == bitj.words
+                assert segment["frames"] == bitj.frames
+
+            return segments[segname]
+
+        if skip_untagged:
+            tiles = set(self.tile_tags.keys())
+            tiles.update(self.sites[site] for site in self.site_tags)
+            grid_tiles = set(self.grid.tiles())
+            tiles = sorted(tile for tile in tiles if tile in grid_tiles)
+        else:
+            tiles = self.grid.tiles()
         '''
         XXX: wouldn't it be better to iterate over tags? Easy to drop tags
         For now, add a check that all tags are used
         '''
-        for tilename, tiledata in self.grid.items():
-
-            def getseg(segname):
-                if not segname in segments:
-                    return add_segbits(
-                        segments, segname, tiledata, bitfilter=bitfilter)
-                else:
-                    segment = segments[segname]
-                    assert segment["offset"] == bitj["offset"]
-                    assert segment["words"] == bitj["words"]
-                    assert segment["frames"] == bitj["frames"]
-                    return segment
-
-            def add_tilename_tags():
-                self.verbose and print("Tile %s: check tags" % tilename)
-                segment = getseg(segname)
-
-                for name, value in self.tile_tags[tilename].items():
-                    tags_used.add((tilename, name))
-                    tag = "%s.%s" % (tile_type_norm, name)
-                    segment["tags"][tag] = value
-
-            def add_site_tags():
-                site_prefix = site.split('_')[0]
-
-                def name_slice():
-                    '''
-                    Simplify SLICE names like:
-                    -SLICE_X12Y102 => SLICE_X0
-                    -SLICE_X13Y102 => SLICE_X1
-                    '''
-                    if re.match(r"SLICE_X[0-9]*[02468]Y", site):
-                        return "SLICE_X0"
-                    elif re.match(r"SLICE_X[0-9]*[13579]Y", site):
-                        return "SLICE_X1"
-                    else:
-                        assert False, "Invalid name in %s" % site
-
-                def name_bram18():
-                    # RAMB18_X0Y41
-                    if re.match(r"^RAMB18_X.*Y[0-9]*[02468]$", site):
-                        return "RAMB18_Y0"
-                    elif re.match(r"^RAMB18_X.*Y[0-9]*[13579]$", site):
-                        return "RAMB18_Y1"
-                    else:
-                        assert False, "Invalid name in %s" % site
-
-                def name_y0y1():
-                    # RAMB18_X0Y41
-                    m = re.match(r"^(.*)_X.*Y[0-9]*[02468]$", site)
-                    if m:
-                        return "%s_Y0" % m.group(1)
-
-                    m = re.match(r"^(.*)_X.*Y[0-9]*[13579]$", site)
-                    if m:
-                        return "%s_Y1" % m.group(1)
-
-                    assert 0, site
-
-                def name_default():
-                    # most sites are unique within their tile
-                    # TODO: maybe verify against DB?
-                    return site_prefix
-
-                sitekey = {
-                    'SLICE': name_slice,
-                    'RAMB18': name_bram18,
-                    'IOB': name_y0y1,
-                }.get(site_prefix, name_default)()
-                self.verbose and print(
-                    'site %s w/ %s prefix => tag %s' %
-                    (site, site_prefix, sitekey))
-
-                for name, value in self.site_tags[site].items():
-                    self.verbose and print("Site %s: check tags" % site)
-
-                    tags_used.add((site, name))
-                    tag = "%s.%s.%s" % (tile_type_norm, sitekey, name)
-                    # XXX: does this come from name?
-                    tag = tag.replace(".SLICEM.", ".")
-                    tag = tag.replace(".SLICEL.", ".")
-                    segment = getseg(segname)
-                    segment["tags"][tag] = value
-                sites_used.add(site)
-
-            tile_type = tiledata["type"]
+        def_bt = BlockType(self.def_bt)
+        for tilename in tiles:
+            gridinfo = self.grid.gridinfo_at_tilename(tilename)
+            tile_type = gridinfo.tile_type
             tile_types_found.add(tile_type)
             segments = self.segments_by_type.setdefault(tile_type, dict())
-            '''
-            Simplify names by simplifying like:
-            -CLBLM_L => CLB
-            -CENTER_INTER_R => CENTER_INTER
-            -CLK_HROW_TOP_R => CLK_HROW
-            -LIOB33 => IOB33
-            '''
-            tile_type_norm = re.sub("(_TOP|_BOT|LL|LM)?_[LR]$", "", tile_type)
-
-            if tile_type_norm in ['LIOB33', 'RIOB33']:
-                tile_type_norm = 'IOB33'
+            tile_type_norm = normalize_tile_type(tile_type)
 
             # ignore dummy tiles (ex: VBRK)
-            if len(tiledata['bits']) == 0:
+            if len(gridinfo.bits) == 0:
                 if self.verbose:
-                    for site in tiledata["sites"]:
+                    for site in gridinfo.sites:
                         assert site not in self.site_tags, "Site %s does not have bitstream info" % site
                 this_tile_tags = len(self.tile_tags.get(tilename, {}))
                 assert this_tile_tags == 0, "Tile %s does not have bitstream info but %s tags" % (
                     tilename, this_tile_tags)
                 continue
-            elif len(tiledata['bits']) == 1:
-                bitj = list(tiledata['bits'].values())[0]
+            elif len(gridinfo.bits) == 1:
+                bitj = list(gridinfo.bits.values())[0]
             else:
-                assert self.def_bt in tiledata[
-                    'bits'], 'Default block not present: %s' % self.def_bt
-                bitj = tiledata['bits'][self.def_bt]
+                assert def_bt in gridinfo.bits, (
+                    'Default block not present: %s' % self.def_bt)
+                bitj = gridinfo.bits[def_bt]
 
             # NOTE: multiple tiles may have the same base addr + offset
-            segname = "%s_%03d" % (
-                # truncate 0x to leave hex string
-                bitj["baseaddr"][2:],
-                bitj["offset"])
+            # Formatted like the tilegrid.json baseaddr, without 0x.
+            segname = "%08X_%03d" % (bitj.base_address, bitj.offset)
 
             # process tile name tags
             if tilename in self.tile_tags:
-                add_tilename_tags()
+                self.verbose and print("Tile %s: check tags" % tilename)
+                segment = getseg(segments, segname, bitj)
+
+                for name, value in self.tile_tags[tilename].items():
+                    tags_used.add((tilename, name))
+                    segment["tags"][(tile_type_norm, name)] = value
 
             # process site name tags
-            for site in tiledata["sites"]:
+            for site in gridinfo.sites:
                 if site not in self.site_tags:
                     continue
-                add_site_tags()
+
+                site_key = self.get_sitekey(site)
+                for name, value in self.site_tags[site].items():
+                    self.verbose and print("Site %s: check tags" % site)
+
+                    tags_used.add((site, name))
+                    segment = getseg(segments, segname, bitj)
+                    segment["tags"][(
+                        tile_type_norm, site_key,
+                        normalize_tag_name(name))] = value
+                sites_used.add(site)
 
         n_site_tags = recurse_sum(self.site_tags)
         n_tile_tags = recurse_sum(self.tile_tags)
@@ -390,28 +413,51 @@ class Segmaker:
         assert ntags == len(tags_used), "Unused tags, %s used out of %s" % (
             len(tags_used), ntags)
 
-    def write(self, suffix=None, roi=False, allow_empty=False):
+    def gen_segments(self, segtype):
+        '''Yields segdata.Segment of each segment of segtype, sorted by name'''
+        segments = self.segments_by_type[segtype]
+        for segname, segdata in sorted(segments.items()):
+            yield segdata_file.Segment(
+                name=segname,
+                bits=set(segbit_name(bit) for bit in segdata["bits"]),
+                tags=dict(
+                    (".".join(tag), tagval)
+                    for tag, tagval in segdata["tags"].items()))
+
+    def write(self, suffix=None, roi=False, allow_empty=False, binary=None):
+        '''
+        Write segdata_<tile type>[_<suffix>].txt for each tile type
+
+        binary: write the binary format (see prjxray.segdata) to
+                segdata_<tile type>[_<suffix>].bin instead.  Defaults to
+                XRAY_SEGDATA_BINARY=Y.
+        '''
         assert self.segments_by_type, 'No data to write'
 
+        if binary is None:
+            binary = os.getenv('XRAY_SEGDATA_BINARY', 'N') == 'Y'
+
         if not allow_empty:
             assert sum(
                 [len(segments) for segments in self.segments_by_type.values()
                  ]) != 0, "Didn't  generate any segments"
 
+        extension = "bin" if binary else "txt"
         for segtype in self.segments_by_type.keys():
             if suffix is not None:
-                filename = "segdata_%s_%s.txt" % (segtype.lower(), suffix)
+                filename = "segdata_%s_%s.%s" % (
+                    segtype.lower(), suffix, extension)
             else:
-                filename = "segdata_%s.txt" % (segtype.lower())
+                filename = "segdata_%s.%s" % (segtype.lower(), extension)
 
             segments = self.segments_by_type[segtype]
             if segments:
                 print("Writing %s." % filename)
-                with open(filename, "w") as f:
-                    for segname, segdata in sorted(segments.items()):
-                        # seg 00020300_010
-                        print("seg %s" % segname, file=f)
-                        for bitname in sorted(segdata["bits"]):
-                            print("bit %s" % bitname, file=f)
-                        for tagname, tagval in sorted(segdata["tags"].items()):
-                            print("tag %s %d" % (tagname, tagval), file=f)
+                if binary:
+                    with open(filename, "wb") as f:
+                        segdata_file.write_segdata_bin(
+                            f, self.gen_segments(segtype))
+                else:
+                    with open(filename, "w") as f:
+                        segdata_file.write_segdata_txt(
+                            f, self.gen_segments(segtype))
@@ -0,0 +1,578 @@
+""" Correlation of segdata tags with segment bits, as tools/segmatch does.
+
+For every tag, the candidate bits are the bits that are set in every segment
+where the tag is 1 and clear in every segment where the tag is 0.  Segdata of
+all specimens is loaded into boolean matrices, with one row per segment:
+
+ - bits  - segments x bits, bit set in the segment.
+ - tags1 - segments x tags, tag is 1 in the segment.
+ - tags0 - segments x tags, tag is 0 in the segment.
+
+The product tags1.T @ bits counts, per tag and bit, the segments where the tag
+is 1 and the bit is set, so the bits set in all of them are those where the
+count equals the number of segments with the tag 1.  Likewise tags0.T @ bits is
+non-zero for the bits set in any segment where the tag is 0.
+
+Output lines (see format_solution) are identical to the lines of
+tools/segmatch, so the .rdb files can be fed to dbfixup and mergedb as before.
+solve_groups solves independent groups of segdata files, usually one per
+tile type, in parallel.
+
+"""
+from collections import namedtuple
+import multiprocessing
+import os
+import os.path
+import pickle
+
+import numpy as np
+
+from prjxray import segdata
+
+# Default of the -c option of tools/segmatch.
+DEFAULT_CANDIDATE_THRESHOLD = 4
+
+# Suffix of the tags added for inverted tag values (-i option).
+INV_SUFFIX = '__INV'
+
+# Version of the SegmatchState file format.
+STATE_VERSION = 1
+""" TagSolution - Correlation result of one tag.
+
+tag        - Tag name.
+count1     - Number of segments where the tag is 1.
+count0     - Number of segments where the tag is 0.
+candidates - Sorted list of the names of the candidate bits.
+
+"""
+TagSolution = namedtuple('TagSolution', 'tag count1 count0 candidates')
+
+
+class Segmatch(object):
+    """ Segments of one or more segdata files, solved together. """
+
+    def __init__(self, invert_tags=False):
+        self.invert_tags = invert_tags
+        self.bit_ids = {}
+        self.tag_ids = {}
+        self.segment_bits = []
+        self.segment_tags1 = []
+        self.segment_tags0 = []
+
+    def bit_id(self, bit):
+        if bit not in self.bit_ids:
+            self.bit_ids[bit] = len(self.bit_ids)
+        return self.bit_ids[bit]
+
+    def tag_id(self, tag):
+        if tag not in self.tag_ids:
+            self.tag_ids[tag] = len(self.tag_ids)
+        return self.tag_ids[tag]
+
+    def add_segment(self, segment):
+        """ Add a prjxray.segdata.Segment. """
+        tags1 = []
+        tags0 = []
+        for tag, value in segment.tags.items():
+            (tags1 if value else tags0).append(self.tag_id(tag))
+            if self.invert_tags:
+                (tags0 if value else tags1).append(
+                    self.tag_id(tag + INV_SUFFIX))
+
+        self.segment_bits.append([self.bit_id(bit) for bit in segment.bits])
+        self.segment_tags1.append(tags1)
+        self.segment_tags0.append(tags0)
+
+    def add_segments(self, segments):
+        for segment in segments:
+            self.add_segment(segment)
+
+    def add_file(self, fname):
+        """ Add the segments of segdata file fname, text or binary. """
+        self.add_segments(segdata.read_segdata(fname))
+
+    def num_segments(self):
+        return len(self.segment_bits)
+
+    def bit_names(self):
+        """ Returns list of bit names, indexed by bit id. """
+        names = [None] * len(self.bit_ids)
+        for bit, bit_id in self.bit_ids.items():
+            names[bit_id] = bit
+        return names
+
+    def tag_names(self):
+        """ Returns list of tag names, indexed by tag id. """
+        names = [None] * len(self.tag_ids)
+        for tag, tag_id in self.tag_ids.items():
+            names[tag_id] = tag
+        return names
+
+    def matrices(self):
+        """ Returns (bits, tags1, tags0) boolean matrices, see module doc. """
+        num_segments = self.num_segments()
+        bits = np.zeros((num_segments, len(self.bit_ids)), dtype=bool)
+        tags1 = np.zeros((num_segments, len(self.tag_ids)), dtype=bool)
+        tags0 = np.zeros((num_segments, len(self.tag_ids)), dtype=bool)
+
+        for matrix, rows in ((bits, self.segment_bits), (tags1,
+                                                         self.segment_tags1),
+                             (tags0, self.segment_tags0)):
+            lengths = [len(row) for row in rows]
+            row_idx = np.repeat(np.arange(num_segments), lengths)
+            col_idx = np.fromiter(
+                (col for row in rows for col in row),
+                dtype=np.int64,
+                count=sum(lengths))
+            matrix[row_idx, col_idx] = True
+
+        assert not np.any(tags1 & tags0)
+        return bits, tags1, tags0
+
+    def reduce(self):
+        """ Returns (and_bits, or_bits, count1, count0), indexed by tag id.
+
+        and_bits is the tags x bits AND of the bits of the segments where the
+        tag is 1 (all bits if there are none), or_bits the OR of the bits of
+        the segments where the tag is 0.  count1 and count0 are the number of
+        segments where the tag is 1 and 0.
+
+        """
+        bits, tags1, tags0 = self.matrices()
+        count1 = tags1.sum(axis=0)
+        count0 = tags0.sum(axis=0)
+
+        bits = bits.astype(np.int64)
+        # Tags without segments compare 0 == 0, so get all bits.
+        and_bits = (tags1.T.astype(np.int64) @ bits) == count1[:, None]
+        or_bits = (tags0.T.astype(np.int64) @ bits) > 0
+
+        return and_bits, or_bits, count1, count0
+
+    def solve(self):
+        """ Returns list of TagSolution, in tag id order. """
+        return solutions_from_reduction(
+            self.tag_names(), self.bit_names(), *self.reduce())
+
+
+def unpack_bits(packed, num_bits):
+    """ Inverse of np.packbits(bits, axis=1) for bits with num_bits columns.
+    """
+    return np.unpackbits(packed, axis=1)[:, :num_bits].astype(bool)
+
+
+def solutions_from_reduction(
+        tag_names, bit_names, and_bits, or_bits, count1, count0):
+    """ Returns list of TagSolution, see Segmatch.reduce. """
+    bit_names = np.array(bit_names, dtype=object)
+    candidates = and_bits & ~or_bits
+
+    solutions = []
+    for tag_idx, tag in enumerate(tag_names):
+        solutions.append(
+            TagSolution(
+                tag=tag,
+                count1=int(count1[tag_idx]),
+                count0=int(count0[tag_idx]),
+                candidates=sorted(bit_names[candidates[tag_idx]])))
+
+    return solutions
+
+
+def format_solution(
+        solution,
+        candidate_threshold=DEFAULT_CANDIDATE_THRESHOLD,
+        min_samples=0,
+        min_total=0):
+    """ Returns the segmatch output line of a TagSolution.
+
+    candidate_threshold, min_samples and min_total are the -c, -m and -M
+    options of tools/segmatch.
+
+    >>> format_solution(TagSolution('A', 2, 3, ['00_01']))
+    'A 00_01'
+    >>> format_solution(TagSolution('B', 2, 0, ['00_01', '00_02']))
+    'B <const1> 00_01 00_02'
+    >>> format_solution(TagSolution('C', 0, 5, []), min_samples=1)
+    'C <m1 0> <const0>'
+    >>> format_solution(TagSolution('D', 2, 3, ['00_01', '00_02']), 1)
+    'D <2 candidates>'
+
+    """
+    line = solution.tag
+
+    if solution.count1 < min_samples:
+        line += ' <m1 %d>' % solution.count1
+
+    if solution.count0 < min_samples:
+        line += ' <m0 %d>' % solution.count0
+
+    if solution.count1 + solution.count0 < min_total:
+        line += ' <M %d %d>' % (solution.count1, solution.count0)
+
+    if not solution.count1:
+        return line + ' <const0>'
+
+    if not solution.count0:
+        line += ' <const1>'
+
+    num_candidates = len(solution.candidates)
+    if candidate_threshold < 0 or 0 < num_candidates <= candidate_threshold:
+        for bit in solution.candidates:
+            line += ' ' + bit
+    else:
+        line += ' <%d candidates>' % num_candidates
+
+    return line
+
+
+def write_segbits(f, solutions, **kwargs):
+    """ Write sorted output lines of solutions to text file object f.
+
+    kwargs are passed to format_solution.
+
+    """
+    for line in sorted(
+            format_solution(solution, **kwargs) for solution in solutions):
+        print(line, file=f)
+
+
+def write_mask(f, segmatch):
+    """ Write all bits seen by segmatch, as the -k option of tools/segmatch.
+    """
+    for bit in sorted(segmatch.bit_ids):
+        print('bit %s' % bit, file=f)
+
+
+def solve_files(fnames, invert_tags=False):
+    """ Returns (Segmatch, list of TagSolution) of segdata files fnames. """
+    segmatch = Segmatch(invert_tags=invert_tags)
+    for fname in fnames:
+        segmatch.add_file(fname)
+
+    return segmatch, segmatch.solve()
+
+
+class StaleStateError(Exception):
+    """ A segdata file included in a SegmatchState changed or disappeared. """
+    pass
+
+
+def file_stamp(fname):
+    stat = os.stat(fname)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def is_solved(solution, **format_args):
+    """ Returns True if the output line of solution has no <...> marker. """
+    return '<' not in format_solution(solution, **format_args)
+
+
+class SegmatchState(object):
+    """ Incremental version of Segmatch.
+
+    Rather than the segments, only the result of Segmatch.reduce is kept,
+    which can be updated with the segments of new segdata files: and_bits is
+    ANDed with and_bits of the new segments, or_bits ORed with their or_bits
+    and the counts added.  The state is saved to a file between runs, along
+    with the size and mtime of each segdata file included, so that int_loop
+    iterations only read the specimens of the current iteration.
+
+    """
+
+    def __init__(self, invert_tags=False):
+        self.invert_tags = invert_tags
+        self.bit_ids = {}
+        self.tag_ids = {}
+        self.and_bits = np.ones((0, 0), dtype=bool)
+        self.or_bits = np.zeros((0, 0), dtype=bool)
+        self.count1 = np.zeros(0, dtype=np.int64)
+        self.count0 = np.zeros(0, dtype=np.int64)
+        self.total_segments = 0
+        self.files = {}
+
+        # List of (number of files, number of segments, number of solved
+        # tags, number of tags) after each update.
+        self.history = []
+
+    def num_segments(self):
+        return self.total_segments
+
+    def bit_names(self):
+        names = [None] * len(self.bit_ids)
+        for bit, bit_id in self.bit_ids.items():
+            names[bit_id] = bit
+        return names
+
+    def tag_names(self):
+        names = [None] * len(self.tag_ids)
+        for tag, tag_id in self.tag_ids.items():
+            names[tag_id] = tag
+        return names
+
+    def resize(self):
+        """ Grow the tables to the current number of bits and tags. """
+        num_tags, num_bits = self.and_bits.shape
+        new_tags = len(self.tag_ids) - num_tags
+        new_bits = len(self.bit_ids) - num_bits
+
+        # New tags have no segments yet, so AND over no segments (all bits).
+        self.and_bits = np.concatenate(
+            (self.and_bits, np.ones((new_tags, num_bits), dtype=bool)))
+        self.or_bits = np.concatenate(
+            (self.or_bits, np.zeros((new_tags, num_bits), dtype=bool)))
+        self.count1 = np.concatenate(
+            (self.count1, np.zeros(new_tags, dtype=np.int64)))
+        self.count0 = np.concatenate(
+            (self.count0, np.zeros(new_tags, dtype=np.int64)))
+
+        # New bits were clear in all previous segments.
+        new_columns = np.zeros((len(self.tag_ids), new_bits), dtype=bool)
+        new_columns[self.count1 == 0] = True
+        self.and_bits = np.concatenate((self.and_bits, new_columns), axis=1)
+        self.or_bits = np.concatenate(
+            (self.or_bits, np.zeros_like(new_columns)), axis=1)
+
+    def add_segmatch(self, segmatch):
+        """ Add the segments of a Segmatch. """
+        assert segmatch.invert_tags == self.invert_tags
+        and_bits, or_bits, count1, count0 = segmatch.reduce()
+
+        bit_map = np.array(
+            [
+                self.bit_ids.setdefault(bit, len(self.bit_ids))
+                for bit in segmatch.bit_names()
+            ],
+            dtype=np.int64)
+        tag_map = np.array(
+            [
+                self.tag_ids.setdefault(tag, len(self.tag_ids))
+                for tag in segmatch.tag_names()
+            ],
+            dtype=np.int64)
+        self.resize()
+
+        # Bits not seen by segmatch are clear in all of its segments.
+        new_and = np.zeros((len(tag_map), len(self.bit_ids)), dtype=bool)
+        new_and[:, bit_map] = and_bits
+        new_and[count1 == 0] = True
+        new_or = np.zeros_like(new_and)
+        new_or[:, bit_map] = or_bits
+
+        self.and_bits[tag_map] &= new_and
+        self.or_bits[tag_map] |= new_or
+        self.count1[tag_map] += count1
+        self.count0[tag_map] += count0
+        self.total_segments += segmatch.num_segments()
+
+    def add_files(self, fnames, **format_args):
+        """ Add the segdata files of fnames not yet in the state.
+
+        fnames must include all files already in the state, unchanged,
+        otherwise StaleStateError is raised.  format_args are passed to
+        format_solution to decide which tags are solved.
+
+        Returns (list of new files, list of newly solved tags).
+
+        """
+        stamps = dict((fname, file_stamp(fname)) for fname in fnames)
+        for fname, stamp in self.files.items():
+            if stamps.get(fname) != stamp:
+                raise StaleStateError(fname)
+
+        new_files = sorted(set(stamps) - set(self.files))
+        if not new_files:
+            return new_files, []
+
+        solved_before = set(self.solved_tags(**format_args))
+
+        segmatch = Segmatch(invert_tags=self.invert_tags)
+        for fname in new_files:
+            segmatch.add_file(fname)
+            self.files[fname] = stamps[fname]
+        self.add_segmatch(segmatch)
+
+        solved = self.solved_tags(**format_args)
+        self.history.append(
+            (
+                len(self.files), self.total_segments, len(solved),
+                len(self.tag_ids)))
+
+        return new_files, sorted(set(solved) - solved_before)
+
+    def solve(self):
+        """ Returns list of TagSolution, in tag id order. """
+        return solutions_from_reduction(
+            self.tag_names(), self.bit_names(), self.and_bits, self.or_bits,
+            self.count1, self.count0)
+
+    def solved_tags(self, **format_args):
+        return [
+            solution.tag
+            for solution in self.solve()
+            if is_solved(solution, **format_args)
+        ]
+
+    def save(self, fname):
+        num_bits = len(self.bit_ids)
+        state = {
+            'version': STATE_VERSION,
+            'invert_tags': self.invert_tags,
+            'bit_names': self.bit_names(),
+            'tag_names': self.tag_names(),
+            'and_bits': np.packbits(self.and_bits, axis=1),
+            'or_bits': np.packbits(self.or_bits, axis=1),
+            'num_bits': num_bits,
+            'count1': self.count1,
+            'count0': self.count0,
+            'num_segments': self.total_segments,
+            'files': self.files,
+            'history': self.history,
+        }
+
+        tmp_fname = fname + '.tmp'
+        with open(tmp_fname, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, fname)
+
+    @staticmethod
+    def load(fname):
+        with open(fname, 'rb') as f:
+            state = pickle.load(f)
+
+        if state['version'] != STATE_VERSION:
+            raise StaleStateError(fname)
+
+        self = SegmatchState(invert_tags=state['invert_tags'])
+        self.bit_ids = dict(
+            (bit, bit_id) for bit_id, bit in enumerate(state['bit_names']))
+        self.tag_ids = dict(
+            (tag, tag_id) for tag_id, tag in enumerate(state['tag_names']))
+        self.and_bits = unpack_bits(state['and_bits'], state['num_bits'])
+        self.or_bits = unpack_bits(state['or_bits'], state['num_bits'])
+        self.count1 = state['count1']
+        self.count0 = state['count0']
+        self.total_segments = state['num_segments']
+        self.files = state['files']
+        self.history = state['history']
+        return self
+
+
+def solve_incremental(state_file, fnames, invert_tags=False, **format_args):
+    """ Update state_file with fnames and solve.
+
+    The state is rebuilt from all of fnames if state_file does not exist, was
+    written with different invert_tags, or a file already included changed.
+
+    Returns (SegmatchState, list of TagSolution, list of new files, list of
+    newly solved tags).
+
+    """
+    try:
+        if not os.path.exists(state_file):
+            raise StaleStateError(state_file)
+        state = SegmatchState.load(state_file)
+        if state.invert_tags != invert_tags:
+            raise StaleStateError(state_file)
+        new_files, newly_solved = state.add_files(fnames, **format_args)
+    except StaleStateError:
+        state = SegmatchState(invert_tags=invert_tags)
+        new_files, newly_solved = state.add_files(fnames, **format_args)
+
+    state.save(state_file)
+    return state, state.solve(), new_files, newly_solved
+
+
+def solve_group(args):
+    segbits_file, mask_file, fnames, invert_tags, incremental, format_args = args
+
+    newly_solved = None
+    if incremental:
+        segmatch, solutions, _, newly_solved = solve_incremental(
+            segbits_file + '.state',
+            fnames,
+            invert_tags=invert_tags,
+            **format_args)
+    else:
+        segmatch, solutions = solve_files(fnames, invert_tags=invert_tags)
+
+    with open(segbits_file, 'w') as f:
+        write_segbits(f, solutions, **format_args)
+
+    if mask_file is not None:
+        with open(mask_file, 'w') as f:
+            write_mask(f, segmatch)
+
+    return segbits_file, segmatch.num_segments(), len(solutions), newly_solved
+
+
+def group_by_segment_type(fnames):
+    """ Group segdata files by segment type.
+
+    The segment type is the file name without the segdata_ prefix and the
+    extension, i.e. tile type and suffix as written by Segmaker.write.
+
+    >>> group_by_segment_type(['a/segdata_int_l.txt', 'b/segdata_int_l.bin',
+    ...                        'a/segdata_clbll_l.txt'])
+    {'clbll_l': ['a/segdata_clbll_l.txt'], 'int_l': ['a/segdata_int_l.txt', 'b/segdata_int_l.bin']}
+
+    """
+    groups = {}
+    for fname in fnames:
+        segtype, _ = os.path.splitext(os.path.basename(fname))
+        assert segtype.startswith('segdata_'), fname
+        groups.setdefault(segtype[len('segdata_'):], []).append(fname)
+
+    return dict(sorted(groups.items()))
+
+
+def solve_groups(
+        groups,
+        output_dir,
+        mask=False,
+        invert_tags=False,
+        incremental=False,
+        processes=None,
+        **format_args):
+    """ Solve each group of segdata files in its own process.
+
+    groups is a dict of segment type to list of segdata files, see
+    group_by_segment_type.  Writes output_dir/segbits_<segment type>.rdb (and
+    output_dir/mask_<segment type>.db if mask is set) for each group.  The
+    largest groups are started first.
+
+    If incremental is set, each group keeps a SegmatchState next to its
+    segbits file (segbits_<segment type>.rdb.state), see solve_incremental.
+
+    Yields (segbits file, number of segments, number of tags, list of newly
+    solved tags or None if not incremental) as groups complete.
+
+    """
+    work = []
+    for segtype, fnames in sorted(groups.items(
+    ), key=lambda item: -sum(os.path.getsize(fname) for fname in item[1])):
+        segbits_file = os.path.join(output_dir, 'segbits_%s.rdb' % segtype)
+        mask_file = None
+        if mask:
+            mask_file = os.path.join(output_dir, 'mask_%s.db' % segtype)
+        work.append(
+            (
+                segbits_file, mask_file, fnames, invert_tags, incremental,
+                format_args))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(work))
+
+    if processes <= 1:
+        for result in map(solve_group, work):
+            yield result
+        return
+
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(solve_group, work):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -1,20 +1,201 @@
-from intervaltree import IntervalTree, Interval
-from prjxray import bitstream
+""" Map from frame address to the tile blocks that use that frame.
+
+The frame ranges of all tile blocks ([base_address, base_address + frames))
+are split at every range boundary into elementary intervals.  Every frame
+within an elementary interval is used by the same set of tile blocks, so a
+lookup is a binary search in the sorted interval boundaries, followed by a
+slice of a CSR table of interval to tile blocks.
+
+All state lives in numpy columns, which can be stored in the database cache
+(see prjxray.db_cache).  BitsInfo tuples are only built when requested.
+
+"""
+import bisect
+import pickle
+import numpy as np
+
+from prjxray.grid_types import BlockType, Bits, BitsInfo
+
+# Column order of the block types.
+BLOCK_TYPES = tuple(BlockType)
+
+# Names of the numpy columns of a SegmentMap.
+COLUMNS = (
+    'tile_names',
+    'block_type',
+    'base_address',
+    'frames',
+    'offset',
+    'words',
+    'edges',
+    'indptr',
+    'indices',
+)
+
+
+def build_columns(grid):
+    """ Returns (columns, meta) of the SegmentMap of grid. """
+    entries = sorted(
+        grid.iter_all_frames(),
+        key=lambda bits_info: (
+            bits_info.bits.base_address, bits_info.tile,
+            BLOCK_TYPES.index(bits_info.block_type)))
+
+    base_address = np.array(
+        [bits_info.bits.base_address for bits_info in entries], dtype=np.int64)
+    frames = np.array(
+        [bits_info.bits.frames for bits_info in entries], dtype=np.int32)
+    begin = base_address
+    end = base_address + frames
+
+    edges = np.unique(np.concatenate((begin, end)))
+
+    # Elementary intervals covered by each entry are [first, last).
+    first = np.searchsorted(edges, begin)
+    last = np.searchsorted(edges, end)
+    lengths = last - first
+
+    entry_ids = np.repeat(np.arange(len(entries), dtype=np.int32), lengths)
+    starts = np.cumsum(lengths) - lengths
+    interval_ids = np.arange(len(entry_ids)) - np.repeat(
+        starts - first, lengths)
+
+    order = np.lexsort((entry_ids, interval_ids))
+    indices = entry_ids[order]
+    indptr = np.zeros(max(len(edges) - 1, 0) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(
+        np.bincount(interval_ids, minlength=len(indptr) - 1))
+
+    aliases = {}
+    for entry, bits_info in enumerate(entries):
+        if bits_info.bits.alias is not None:
+            aliases[entry] = bits_info.bits.alias
+
+    columns = {
+        'tile_names':
+        np.array(
+            [bits_info.tile.encode('ascii') for bits_info in entries],
+            dtype=np.bytes_),
+        'block_type':
+        np.array(
+            [BLOCK_TYPES.index(bits_info.block_type) for bits_info in entries],
+            dtype=np.int8),
+        'base_address':
+        base_address,
+        'frames':
+        frames,
+        'offset':
+        np.array(
+            [bits_info.bits.offset for bits_info in entries], dtype=np.int32),
+        'words':
+        np.array(
+            [bits_info.bits.words for bits_info in entries], dtype=np.int32),
+        'edges':
+        edges,
+        'indptr':
+        indptr,
+        'indices':
+        indices,
+    }
+
+    return columns, {'aliases': aliases}
 
 
 class SegmentMap(object):
-    def __init__(self, grid):
-        self.segment_tree = IntervalTree()
-
-        for bits_info in grid.iter_all_frames():
-            self.segment_tree.add(
-                Interval(
-                    begin=bits_info.bits.base_address,
-                    end=bits_info.bits.base_address + bits_info.bits.frames,
-                    data=bits_info,
+    def __init__(self, grid, columns=None, meta=None):
+        """ Create SegmentMap for grid.
+
+        If columns and meta are given (see from_cache), grid is not used.
+
+        """
+        if columns is None:
+            columns, meta = build_columns(grid)
+
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+        self.aliases = meta['aliases']
+
+        # Python list of the interval boundaries, bisect on a list is faster
+        # than np.searchsorted for single lookups.
+        self._edges = self.edges.tolist()
+
+        # Entry to BitsInfo, built on request.
+        self._bits_info = {}
+
+    @staticmethod
+    def from_cache(cache, prefix='segment_map/'):
+        """ Build SegmentMap from columns stored in a DatabaseCache. """
+        columns = dict(
+            (name, cache.get_array(prefix + name)) for name in COLUMNS)
+        return SegmentMap(None, columns, cache.load(prefix + 'meta'))
+
+    def gen_sections(self):
+        """ Yields (name, data) sections for prjxray.db_cache. """
+        for name in COLUMNS:
+            yield name, getattr(self, name)
+
+        yield 'meta', pickle.dumps(
+            {
+                'aliases': self.aliases
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def bits_info(self, entry):
+        """ Return BitsInfo of entry. """
+        if entry not in self._bits_info:
+            self._bits_info[entry] = BitsInfo(
+                block_type=BLOCK_TYPES[self.block_type[entry]],
+                tile=self.tile_names[entry].decode('ascii'),
+                bits=Bits(
+                    base_address=int(self.base_address[entry]),
+                    frames=int(self.frames[entry]),
+                    offset=int(self.offset[entry]),
+                    words=int(self.words[entry]),
+                    alias=self.aliases.get(entry),
                 ))
 
+        return self._bits_info[entry]
+
+    def entries_for_frame(self, frame):
+        """ Return array of the entries that use frame. """
+        interval = bisect.bisect_right(self._edges, frame) - 1
+        if interval < 0 or interval >= len(self._edges) - 1:
+            return self.indices[0:0]
+
+        return self.indices[self.indptr[interval]:self.indptr[interval + 1]]
+
     def segment_info_for_frame(self, frame):
         """ Return all bits info that match frame address. """
-        for frame in self.segment_tree[frame]:
-            yield frame.data
+        for entry in self.entries_for_frame(frame):
+            yield self.bits_info(int(entry))
+
+    def entries_for_frames(self, frames):
+        """ Batch version of entries_for_frame.
+
+        Returns (frame_idx, entries) arrays, where entries[i] uses frame
+        frames[frame_idx[i]].  Pairs are ordered by frame_idx.
+
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        intervals = np.searchsorted(self.edges, frames, side='right') - 1
+        valid = (intervals >= 0) & (intervals < len(self.edges) - 1)
+
+        starts = np.zeros(len(frames), dtype=np.int64)
+        lengths = np.zeros(len(frames), dtype=np.int64)
+        starts[valid] = self.indptr[intervals[valid]]
+        lengths[valid] = self.indptr[intervals[valid] + 1] - starts[valid]
+
+        frame_idx = np.repeat(np.arange(len(frames)), lengths)
+        offsets = np.arange(len(frame_idx)) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths)
+        return frame_idx, self.indices[starts[frame_idx] + offsets]
+
+    def segment_info_for_frames(self, frames):
+        """ Yields (frame, list of BitsInfo) for each frame in frames. """
+        frames = list(frames)
+        frame_idx, entries = self.entries_for_frames(frames)
+        splits = np.searchsorted(frame_idx, np.arange(1, len(frames)))
+        for frame, frame_entries in zip(frames, np.split(entries, splits)):
+            yield frame, [
+                self.bits_info(int(entry)) for entry in frame_entries
+            ]
@@ -0,0 +1,318 @@
+""" Table of the instance sites of every tile in a grid.
+
+Tile.get_instance_sites resolves the prototype sites of a tile type to the
+site instances of one tile, calling lib.find_origin_coordinate (which parses
+every site name of the tile) for every site, and scanning all sites of the
+tile when the computed name is not present.  Doing that for every tile of the
+grid is quadratic in the number of sites per tile.
+
+SiteInstances resolves all tiles of a tile type at once with numpy, and stores
+the result in a CSR table: the instance sites of tile_names[i] are rows
+indptr[i]:indptr[i + 1], in the order of Tile.get_sites().
+
+Tiles where Tile.get_instance_sites would fail one of its assertions are
+marked as not valid, and are left to Tile.get_instance_sites (see
+Grid.get_instance_sites), so the error is still raised for that tile only.
+
+All state lives in numpy columns, which can be stored in the database cache
+(see prjxray.db_cache).
+
+"""
+import numpy as np
+
+from prjxray import lib
+from prjxray.tile import Site
+
+# Names of the numpy columns of a SiteInstances.
+COLUMNS = (
+    'tile_names',
+    'valid',
+    'indptr',
+    'site_names',
+    'site_x',
+    'site_y',
+)
+
+
+def site_keys(tile, prefix, x, y, dims):
+    """ Encode (tile, prefix, x, y) arrays as a single int64 array.
+
+    dims are the (prefixes, x, y) sizes, coordinates are less than dims.
+
+    """
+    num_prefixes, size_x, size_y = dims
+    return ((tile * num_prefixes + prefix) * size_x + x) * size_y + y
+
+
+def resolve_tile_type(tile, tiles_sites):
+    """ Resolve the instance sites of all tiles of one tile type.
+
+    tile is the Tile of the tile type, tiles_sites the GridInfo.sites dicts
+    of the tiles.
+
+    Returns (valid, site_names, site_x, site_y), site_names, site_x and
+    site_y have one row per tile and one column per prototype site.
+
+    """
+    proto_sites = tile.get_sites()
+    num_tiles = len(tiles_sites)
+    num_sites = len(proto_sites)
+
+    prefixes = {}
+    site_types = {}
+    for site in proto_sites:
+        prefixes.setdefault(site.prefix, len(prefixes))
+        site_types.setdefault(site.type, len(site_types))
+
+    # Parse the site names of the grid once.
+    valid = np.ones(num_tiles, dtype=bool)
+    g_tile = []
+    g_prefix = []
+    g_x = []
+    g_y = []
+    g_type = []
+    g_names = []
+    for tile_idx, sites in enumerate(tiles_sites):
+        if len(sites) != num_sites:
+            valid[tile_idx] = False
+
+        for site_name, site_type in sites.items():
+            coordinate = lib.SITE_COORDINATE_PATTERN.match(site_name)
+            if coordinate is None:
+                valid[tile_idx] = False
+                continue
+
+            g_tile.append(tile_idx)
+            g_prefix.append(
+                prefixes.setdefault(coordinate.group(1), len(prefixes)))
+            g_x.append(int(coordinate.group(2)))
+            g_y.append(int(coordinate.group(3)))
+            g_type.append(site_types.setdefault(site_type, len(site_types)))
+            g_names.append(site_name)
+
+    g_tile = np.array(g_tile, dtype=np.int64)
+    g_prefix = np.array(g_prefix, dtype=np.int64)
+    g_x = np.array(g_x, dtype=np.int64)
+    g_y = np.array(g_y, dtype=np.int64)
+    g_type = np.array(g_type, dtype=np.int64)
+    g_rows = np.arange(len(g_names))
+
+    # Origin of each prefix within each tile, (0, 0) if the prefix has no
+    # sites in the tile (see lib.find_origin_coordinate).
+    num_prefixes = len(prefixes)
+    has_prefix = np.zeros((num_tiles, num_prefixes), dtype=bool)
+    has_prefix[g_tile, g_prefix] = True
+    no_site = np.iinfo(np.int64).max
+    origin_x = np.full((num_tiles, num_prefixes), no_site, dtype=np.int64)
+    origin_y = np.full((num_tiles, num_prefixes), no_site, dtype=np.int64)
+    np.minimum.at(origin_x, (g_tile, g_prefix), g_x)
+    np.minimum.at(origin_y, (g_tile, g_prefix), g_y)
+    origin_x[~has_prefix] = 0
+    origin_y[~has_prefix] = 0
+
+    # Sites of each type within each tile, used when the computed site name
+    # is not present.  Only used if there is exactly one site of the type.
+    num_types = len(site_types)
+    type_count = np.zeros((num_tiles, num_types), dtype=np.int64)
+    np.add.at(type_count, (g_tile, g_type), 1)
+    type_row = np.full((num_tiles, num_types), -1, dtype=np.int64)
+    np.maximum.at(type_row, (g_tile, g_type), g_rows)
+
+    # Largest coordinate of the grid sites and of the computed sites.
+    proto_x = max([site.x for site in proto_sites], default=0)
+    proto_y = max([site.y for site in proto_sites], default=0)
+    size_x = max(proto_x + origin_x.max(initial=0), g_x.max(initial=0)) + 1
+    size_y = max(proto_y + origin_y.max(initial=0), g_y.max(initial=0)) + 1
+    dims = (num_prefixes, size_x, size_y)
+    keys = site_keys(g_tile, g_prefix, g_x, g_y, dims)
+    key_order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[key_order]
+
+    tiles = np.arange(num_tiles, dtype=np.int64)
+    site_x = np.zeros((num_tiles, num_sites), dtype=np.int64)
+    site_y = np.zeros((num_tiles, num_sites), dtype=np.int64)
+    site_rows = np.full((num_tiles, num_sites), -1, dtype=np.int64)
+    for site_idx, site in enumerate(proto_sites):
+        prefix = prefixes[site.prefix]
+        site_type = site_types[site.type]
+        x = site.x + origin_x[:, prefix]
+        y = site.y + origin_y[:, prefix]
+        site_x[:, site_idx] = x
+        site_y[:, site_idx] = y
+
+        rows = np.full(num_tiles, -1, dtype=np.int64)
+        if len(sorted_keys):
+            candidates = site_keys(tiles, prefix, x, y, dims)
+            pos = np.minimum(
+                np.searchsorted(sorted_keys, candidates),
+                len(sorted_keys) - 1)
+            match = sorted_keys[pos] == candidates
+            rows[match] = key_order[pos[match]]
+
+        use_type = (rows < 0) & (type_count[:, site_type] == 1)
+        rows[use_type] = type_row[use_type, site_type]
+
+        found = rows >= 0
+        valid &= found
+        valid[found] &= g_type[rows[found]] == site_type
+        site_rows[:, site_idx] = rows
+
+    # Every site of the tile must be used exactly once.
+    if num_sites > 1:
+        valid &= np.all(
+            np.diff(np.sort(site_rows, axis=1), axis=1) != 0, axis=1)
+
+    names = np.array(g_names + [''], dtype=object)
+    site_names = names[site_rows]
+    return valid, site_names, site_x, site_y
+
+
+def build_columns(grid):
+    """ Returns columns of the SiteInstances of grid. """
+    tiles_by_type = {}
+    for tilename in grid.tiles():
+        gridinfo = grid.gridinfo_at_tilename(tilename)
+        tiles_by_type.setdefault(gridinfo.tile_type, []).append(
+            (tilename, gridinfo.sites))
+
+    tile_names = []
+    valid = []
+    num_sites = []
+    site_names = []
+    site_x = []
+    site_y = []
+    for tile_type, tiles in sorted(tiles_by_type.items()):
+        tile_dbs = grid.db.tile_types.get(tile_type)
+        if tile_dbs is None or tile_dbs.tile_type is None:
+            continue
+
+        tile = grid.db.get_tile_type(tile_type)
+        type_valid, type_names, type_x, type_y = resolve_tile_type(
+            tile, [sites for _, sites in tiles])
+
+        tile_names.extend(tilename for tilename, _ in tiles)
+        valid.append(type_valid)
+        num_sites.append(np.full(len(tiles), type_names.shape[1]))
+        site_names.append(type_names.ravel())
+        site_x.append(type_x.ravel())
+        site_y.append(type_y.ravel())
+
+    def concatenate(arrays, dtype):
+        if arrays:
+            return np.concatenate(arrays).astype(dtype)
+        return np.zeros(0, dtype=dtype)
+
+    valid = concatenate(valid, bool)
+    num_sites = concatenate(num_sites, np.int64)
+    starts = np.zeros(len(num_sites) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum(num_sites)
+    site_names = concatenate(site_names, object)
+    site_x = concatenate(site_x, np.int32)
+    site_y = concatenate(site_y, np.int32)
+
+    # Sort the tiles by name for tile_index, keeping their site rows.
+    order = sorted(range(len(tile_names)), key=lambda idx: tile_names[idx])
+    order = np.array(order, dtype=np.int64)
+    counts = num_sites[order]
+    indptr = np.zeros(len(order) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(counts)
+    site_rows = np.repeat(starts[order], counts) + (
+        np.arange(indptr[-1]) - np.repeat(indptr[:-1], counts))
+
+    return {
+        'tile_names':
+        np.array(
+            [tile_names[idx].encode('ascii') for idx in order],
+            dtype=np.bytes_),
+        'valid':
+        valid[order],
+        'indptr':
+        indptr,
+        'site_names':
+        np.array(
+            [name.encode('ascii') for name in site_names[site_rows]],
+            dtype=np.bytes_),
+        'site_x':
+        site_x[site_rows],
+        'site_y':
+        site_y[site_rows],
+    }
+
+
+class SiteInstances(object):
+    def __init__(self, grid, columns=None):
+        """ Create SiteInstances for grid.
+
+        If columns are given (see from_cache), grid is not used.
+
+        """
+        if columns is None:
+            columns = build_columns(grid)
+
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+    @staticmethod
+    def from_cache(cache, prefix='site_instances/'):
+        """ Build SiteInstances from columns stored in a DatabaseCache. """
+        return SiteInstances(
+            None,
+            dict((name, cache.get_array(prefix + name)) for name in COLUMNS))
+
+    def gen_sections(self):
+        """ Yields (name, data) sections for prjxray.db_cache. """
+        for name in COLUMNS:
+            yield name, getattr(self, name)
+
+    def tile_index(self, tilename):
+        """ Return the index of tilename, or None if it is not in the table.
+        """
+        key = tilename.encode('ascii')
+        idx = int(np.searchsorted(self.tile_names, key))
+        if idx >= len(self.tile_names) or self.tile_names[idx] != key:
+            return None
+
+        return idx
+
+    def is_valid(self, tilename):
+        """ Returns True if the instance sites of tilename are in the table.
+        """
+        idx = self.tile_index(tilename)
+        return idx is not None and bool(self.valid[idx])
+
+    def instance_site(self, tilename, site_index):
+        """ Returns (site name, x, y) of prototype site site_index of tilename.
+
+        site_index is the index of the prototype site in Tile.get_sites().
+
+        """
+        idx = self.tile_index(tilename)
+        if idx is None or not self.valid[idx]:
+            raise KeyError(tilename)
+
+        row = self.indptr[idx] + site_index
+        assert row < self.indptr[idx + 1], (tilename, site_index)
+        return (
+            self.site_names[row].decode('ascii'), int(self.site_x[row]),
+            int(self.site_y[row]))
+
+    def get_instance_sites(self, tilename, tile):
+        """ Yields the Site's of tilename, see Tile.get_instance_sites.
+
+        tile is the Tile of the tile type of tilename.
+
+        """
+        idx = self.tile_index(tilename)
+        if idx is None or not self.valid[idx]:
+            raise KeyError(tilename)
+
+        start = self.indptr[idx]
+        for row, site in enumerate(tile.get_sites(), start):
+            yield Site(
+                name=self.site_names[row].decode('ascii'),
+                prefix=site.prefix,
+                type=site.type,
+                x=int(self.site_x[row]),
+                y=int(self.site_y[row]),
+                site_pins=site.site_pins,
+            )
@@ -32,6 +32,14 @@ wire - Wire name within the tile.  This name is site instance specific.
 SitePin = namedtuple('SitePin', 'name wire')
 
 WireInfo = namedtuple('WireInfo', 'pips sites')
+""" WireIndex - Per wire lookup tables of a tile, see Tile._build_wire_index.
+
+uphill - [non-pseudo, pseudo] dicts of wire to indices of PIPs driving it.
+downhill - [non-pseudo, pseudo] dicts of wire to indices of PIPs it drives.
+sites - Dict of wire to (site name, site pin name) tuples.
+
+"""
+WireIndex = namedtuple('WireIndex', 'uphill downhill sites')
 
 
 class Tile(object):
@@ -79,7 +87,7 @@ class Tile(object):
             self.sites = tuple(yield_sites(tile_type['sites']))
             self.pips = tuple(yield_pips(tile_type['pips']))
 
-        self.wire_info = {}
+        self.wire_index = None
 
     def get_wires(self):
         """Returns a set of wire names present in this tile."""
@@ -101,27 +109,79 @@ class Tile(object):
 
         return self.pips_by_name[name]
 
+    def _build_wire_index(self):
+        """ Index the PIPs and site pins of each wire in one pass. """
+        if self.wire_index is not None:
+            return self.wire_index
+
+        wires = set(self.wires)
+
+        def empty():
+            return dict((wire, []) for wire in wires)
+
+        # For uphill and downhill PIPs, [non-pseudo, pseudo] wire to PIP index
+        uphill = [empty(), empty()]
+        downhill = [empty(), empty()]
+        for idx, pip in enumerate(self.pips):
+            if pip.net_to in wires:
+                uphill[pip.is_pseudo][pip.net_to].append(idx)
+            if pip.net_from in wires:
+                downhill[pip.is_pseudo][pip.net_from].append(idx)
+
+        sites = empty()
+        for site in self.sites:
+            for site_pin in site.site_pins:
+                if site_pin.wire in wires:
+                    sites[site_pin.wire].append((site.name, site_pin.name))
+
+        self.wire_index = WireIndex(
+            uphill=uphill, downhill=downhill, sites=sites)
+        return self.wire_index
+
+    def _pip_indices(self, indexes, wires, allow_pseudo):
+        """ PIP indices of wires from indexes, in tile PIP order.
+
+        Wires not in this tile have no PIPs.
+        """
+        pseudo = (False, True) if allow_pseudo else (False, )
+        return sorted(
+            set(
+                idx for index in indexes for is_pseudo in pseudo
+                for wire in wires for idx in index[is_pseudo].get(wire, ())))
+
     def get_wire_info(self, target_wire, allow_pseudo=False):
-        if len(self.wire_info) == 0:
-            for wire in self.wires:
-                pips = list()
-                sites = list()
-
-                for site in self.sites:
-                    for site_pin in site.site_pins:
-                        if site_pin.wire == wire:
-                            sites.append((site.name, site_pin.name))
-
-                for pip in self.pips:
-                    pseudo_filter = (not pip.is_pseudo) or allow_pseudo
-                    if (wire == pip.net_to
-                            or wire == pip.net_from) and pseudo_filter:
-                        pips.append(pip.name)
-
-                assert wire not in self.wire_info
-                self.wire_info[wire] = WireInfo(pips=pips, sites=sites)
-
-        return self.wire_info[target_wire]
+        """ Returns WireInfo of target_wire.
+
+        pips are the names of PIPs to or from the wire, sites are
+        (site name, site pin name) tuples of site pins on the wire.
+        """
+        wire_index = self._build_wire_index()
+        pips = self._pip_indices(
+            (wire_index.uphill, wire_index.downhill), [target_wire],
+            allow_pseudo)
+        return WireInfo(
+            pips=[self.pips[idx].name for idx in pips],
+            sites=list(wire_index.sites[target_wire]))
+
+    def get_wire_infos(self, wires, allow_pseudo=False):
+        """ Returns dict of wire name to WireInfo for each wire in wires. """
+        return dict(
+            (wire, self.get_wire_info(wire, allow_pseudo=allow_pseudo))
+            for wire in wires)
+
+    def get_uphill_pips(self, wires, allow_pseudo=False):
+        """ Returns list of Pip's driving any of wires, in tile PIP order. """
+        return [
+            self.pips[idx] for idx in self._pip_indices(
+                (self._build_wire_index().uphill, ), wires, allow_pseudo)
+        ]
+
+    def get_downhill_pips(self, wires, allow_pseudo=False):
+        """ Returns list of Pip's driven by any of wires, in tile PIP order. """
+        return [
+            self.pips[idx] for idx in self._pip_indices(
+                (self._build_wire_index().downhill, ), wires, allow_pseudo)
+        ]
 
     def get_instance_sites(self, grid_info):
         """ get_sites returns abstract sites for all tiles of type.
@@ -0,0 +1,286 @@
+""" Check that no two tiles of a grid use the same configuration bit.
+
+Every bit of every tile is an entry (frame address, bit within the frame,
+owner key), where the owner key orders entries by tile (in grid.tiles() order)
+and then by the order of the bit in the segbits of the tile type.  Entries are
+built with numpy for all tiles of a tile type at once.
+
+Frame addresses are split by clock region (block type, top/bottom and row, see
+frame_region), which never share frames, so each region is checked on its
+own, in parallel.  Within a region, the frames used are given dense indices
+and a bitmap of (frames x FRAME_BITS) bits records the owner of every bit: the
+first entry by owner key.  Every entry of a different tile than the owner of
+its bit is a collision.
+
+Collisions are reported like a sequential check of the tiles would: only the
+collisions of the first tile that collides with an earlier tile are returned.
+
+"""
+from collections import namedtuple
+import multiprocessing
+
+import numpy as np
+
+# Words in a 7-series configuration frame.
+FRAME_WORDS = 101
+FRAME_BITS = 32 * FRAME_WORDS
+
+# Frame address bits below the row field, see frame_region.
+REGION_SHIFT = 17
+""" Collision - A bit used by two tiles.
+
+address - Frame address of the bit.
+bitaddr - Bit within the frame.
+had - "tile.feature" of the first tile using the bit.
+got - "tile.feature" of the colliding tile.
+
+"""
+Collision = namedtuple('Collision', 'address bitaddr had got')
+""" TileOverlap - Result of check_tile_overlap.
+
+tiles_checked - Number of tiles that use any bit.
+bits - Number of bits used by the checked tiles.
+collisions - List of Collision's, sorted by (address, bitaddr).  Empty if
+             no bit is used by more than one tile.
+
+"""
+TileOverlap = namedtuple('TileOverlap', 'tiles_checked bits collisions')
+
+
+def frame_region(address):
+    """ Returns the clock region (block type, top/bottom, row) of address.
+
+    >>> hex(frame_region(0x00400100))
+    '0x20'
+    >>> frame_region(0x00020000) == frame_region(0x00000000)
+    False
+
+    """
+    return address >> REGION_SHIFT
+
+
+def tile_type_mask(segbits, tags):
+    """ Returns the bits used by a tile type.
+
+    segbits is TileSegbits.segbits, tags a dict of tag to tag id that new tags
+    are added to.
+
+    Returns (block_types, block, word_column, word_bit, tag).  block_types is
+    the list of block types used, the arrays have one entry per bit, with
+    block indexing into block_types.  Only the first tag of every bit is
+    kept, in segbits order.
+
+    """
+    block_types = []
+    seen = set()
+    entries = []
+    for block_type in segbits:
+        block = len(block_types)
+        block_types.append(block_type)
+        for tag, bits in segbits[block_type].items():
+            tag_id = tags.setdefault(tag, len(tags))
+            for bit in bits:
+                key = (block, bit.word_column, bit.word_bit)
+                if key not in seen:
+                    seen.add(key)
+                    entries.append(key + (tag_id, ))
+
+    columns = np.array(entries, dtype=np.int64).reshape(-1, 4).T
+    return (block_types, ) + tuple(columns)
+
+
+def check_tile_bits(tile_name, tile_bits, block_types, max_word_column):
+    """ Same checks as checkdb.gen_tile_bits for the bits of a tile. """
+    for block_type, word_column in zip(block_types, max_word_column):
+        assert block_type in tile_bits, "block type %s is not present in current tile" % block_type
+
+        frames = tile_bits[block_type].frames
+        assert word_column <= frames, "ERROR: bit out of bound --> tile: %s; word_column = %s; frames = %s" % (
+            tile_name, word_column, frames)
+
+
+def build_entries(db, grid, verbose=False):
+    """ Returns the bits of all tiles of grid.
+
+    Returns (tile_names, tags, tiles_checked, frames, bitaddrs, keys, tag_ids),
+    where the arrays have one entry per bit.  keys are
+    (tile index << 32) | (bit index within the tile), the tile index indexes
+    tile_names.
+
+    """
+    tile_names = []
+    tiles_by_type = {}
+    for tile_idx, tile_name in enumerate(grid.tiles()):
+        tile_names.append(tile_name)
+        tile_info = grid.gridinfo_at_tilename(tile_name)
+        tiles_by_type.setdefault(tile_info.tile_type, []).append(
+            (tile_idx, tile_name, tile_info.bits))
+
+    tags = {}
+    tiles_checked = 0
+    frames = []
+    bitaddrs = []
+    keys = []
+    tag_ids = []
+    for tile_type, tiles in tiles_by_type.items():
+        segbits = db.get_tile_segbits(tile_type).segbits
+        if len(segbits) == 0:
+            continue
+
+        block_types, block, word_column, word_bit, tag = tile_type_mask(
+            segbits, tags)
+        if len(block) == 0:
+            continue
+
+        max_word_column = [
+            word_column[block == idx].max(initial=0)
+            for idx in range(len(block_types))
+        ]
+        for _, tile_name, tile_bits in tiles:
+            check_tile_bits(tile_name, tile_bits, block_types, max_word_column)
+            verbose and print(
+                "Checking %s, type %s, bits: %s" %
+                (tile_name, tile_type, len(block)))
+
+        # (tiles x block types) base addresses and first bit of the blocks.
+        tile_blocks = [
+            [tile_bits[block_type]
+             for block_type in block_types]
+            for _, _, tile_bits in tiles
+        ]
+        base_address = np.array(
+            [[bits.base_address for bits in blocks] for blocks in tile_blocks],
+            dtype=np.int64)
+        bitbase = 32 * np.array(
+            [[bits.offset for bits in blocks] for blocks in tile_blocks],
+            dtype=np.int64)
+        tile_idx = np.array([tile[0] for tile in tiles], dtype=np.int64)
+
+        frames.append((base_address[:, block] + word_column).ravel())
+        bitaddrs.append((bitbase[:, block] + word_bit).ravel())
+        keys.append(
+            ((tile_idx[:, np.newaxis] << 32) + np.arange(len(block))).ravel())
+        tag_ids.append(np.tile(tag, len(tiles)))
+        tiles_checked += len(tiles)
+
+    def concatenate(arrays):
+        if arrays:
+            return np.concatenate(arrays)
+        return np.zeros(0, dtype=np.int64)
+
+    tag_names = [None] * len(tags)
+    for tag, tag_id in tags.items():
+        tag_names[tag_id] = tag
+
+    return (
+        tile_names, tag_names, tiles_checked, concatenate(frames),
+        concatenate(bitaddrs), concatenate(keys), concatenate(tag_ids))
+
+
+def check_region(args):
+    """ Check the entries of one clock region.
+
+    args is (frames, bitaddrs, keys) of the entries in the region.
+
+    Returns (bits, conflicts, owners), where bits is the number of bits
+    used, and conflicts are the entries of a different tile than the owner of
+    their bit, owners the owning entries.
+
+    """
+    frames, bitaddrs, keys = args
+
+    frame_addresses, frame_idx = np.unique(frames, return_inverse=True)
+    frame_bits = max(FRAME_BITS, int(bitaddrs.max(initial=0)) + 1)
+    position = frame_idx.reshape(-1) * frame_bits + bitaddrs
+
+    # Entries ranked by owner key, the owner of a bit is the lowest rank.
+    order = np.argsort(keys, kind='stable')
+    rank = np.empty(len(keys), dtype=np.int32)
+    rank[order] = np.arange(len(keys), dtype=np.int32)
+
+    no_owner = len(keys)
+    owner_rank = np.full(
+        len(frame_addresses) * frame_bits, no_owner, dtype=np.int32)
+    np.minimum.at(owner_rank, position, rank)
+    bits = int(np.count_nonzero(owner_rank != no_owner))
+
+    owners = order[owner_rank[position]]
+    conflicts = np.flatnonzero((keys[owners] >> 32) != (keys >> 32))
+    return bits, conflicts, owners[conflicts]
+
+
+def check_tile_overlap(db, processes=None, verbose=False):
+    """ Returns TileOverlap of the tiles of db.
+
+    Clock regions are checked in parallel by processes processes, default
+    all cores.  With processes=1 no process pool is used.
+
+    """
+    grid = db.grid()
+    tile_names, tag_names, tiles_checked, frames, bitaddrs, keys, tag_ids = build_entries(
+        db, grid, verbose=verbose)
+
+    # Split the entries by clock region.
+    region = frame_region(frames)
+    entry_order = np.argsort(region, kind='stable')
+    splits = np.flatnonzero(np.diff(region[entry_order])) + 1
+    regions = np.split(entry_order, splits) if len(entry_order) else []
+    jobs = [
+        (frames[entries], bitaddrs[entries], keys[entries])
+        for entries in regions
+    ]
+
+    if processes == 1 or len(jobs) <= 1:
+        results = map(check_region, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(check_region, jobs)
+
+    try:
+        bits = 0
+        conflicts = []
+        owners = []
+        for entries, (region_bits, region_conflicts,
+                      region_owners) in zip(regions, results):
+            bits += region_bits
+            conflicts.append(entries[region_conflicts])
+            owners.append(entries[region_owners])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if not conflicts or not sum(len(c) for c in conflicts):
+        return TileOverlap(
+            tiles_checked=tiles_checked, bits=bits, collisions=[])
+
+    conflicts = np.concatenate(conflicts)
+    owners = np.concatenate(owners)
+
+    # The first tile to collide with an earlier tile.  It can use a bit more
+    # than once, report the first use of each bit.
+    conflict_tiles = keys[conflicts] >> 32
+    first = conflict_tiles == conflict_tiles.min()
+    conflicts = conflicts[first]
+    owners = owners[first]
+
+    def name(entry):
+        return "%s.%s" % (
+            tile_names[keys[entry] >> 32], tag_names[tag_ids[entry]])
+
+    collisions = {}
+    for entry, owner in sorted(zip(conflicts, owners),
+                               key=lambda pair: keys[pair[0]]):
+        bit = (int(frames[entry]), int(bitaddrs[entry]))
+        if bit not in collisions:
+            collisions[bit] = Collision(
+                address=bit[0],
+                bitaddr=bit[1],
+                had=name(owner),
+                got=name(entry))
+
+    return TileOverlap(
+        tiles_checked=tiles_checked,
+        bits=bits,
+        collisions=[collisions[bit] for bit in sorted(collisions)])
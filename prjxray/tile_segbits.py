@@ -1,5 +1,6 @@
 from collections import namedtuple
 from prjxray import bitstream
+from prjxray import db_reader
 from prjxray.grid import BlockType
 import enum
 import functools
@@ -12,21 +13,31 @@ class PsuedoPipType(enum.Enum):
 
 
 def read_ppips(f):
-    ppips = {}
-
-    for l in f:
-        l = l.strip()
-        if not l:
-            continue
-
-        feature, ppip_type = l.split(' ')
+    entries = db_reader.parse_lines(f.read().splitlines(), db_reader.PPIPS)
 
+    ppips = {}
+    for feature, _, ppip_type in entries.items():
         ppips[feature] = PsuedoPipType(ppip_type)
 
     return ppips
 
 
 Bit = namedtuple('Bit', 'word_column word_bit isset')
+""" FeatureBits - Precompiled bits of a feature, relative to the tile.
+
+Arrays are in segbits order.
+
+block_type - BlockType of the bits.
+word_columns - Frame offset of each bit relative to Bits.base_address.
+word_indices - Word of each bit relative to Bits.offset.
+bit_indices - Bit within the word of each bit.
+isset - True if bit is set, False if bit is cleared.
+unique - True if no bit appears more than once.
+
+"""
+FeatureBits = namedtuple(
+    'FeatureBits',
+    'block_type word_columns word_indices bit_indices isset unique')
 
 
 def parsebit(val):
@@ -47,20 +58,27 @@ def parsebit(val):
 
 
 def read_segbits(f):
-    segbits = {}
-
-    for l in f:
-        # CLBLM_L.SLICEL_X1.ALUT.INIT[10] 29_14
-        l = l.strip()
-
-        if not l:
-            continue
+    entries = db_reader.parse_lines(f.read().splitlines())
+    table = entries.bits
 
-        parts = l.split(' ')
+    # One Bit per distinct bit of the file.
+    bits = [
+        Bit(word_column=word_column, word_bit=word_bit, isset=isset)
+        for word_column, word_bit, isset in zip(
+            table.word_column, table.word_bit, table.isset)
+    ]
 
-        assert len(parts) > 1
+    segbits = {}
+    tag_names = entries.tags.names
+    indptr = entries.indptr.tolist()
+    bit_ids = entries.bit_ids.tolist()
+    for idx, tag_id in enumerate(entries.tag_ids.tolist()):
+        # CLBLM_L.SLICEL_X1.ALUT.INIT[10] 29_14
+        assert indptr[idx + 1] > indptr[idx], entries.lines[idx]
 
-        segbits[parts[0]] = [parsebit(val) for val in parts[1:]]
+        segbits[tag_names[tag_id]] = [
+            bits[bit] for bit in bit_ids[indptr[idx]:indptr[idx + 1]]
+        ]
 
     return segbits
 
@@ -71,6 +89,12 @@ class TileSegbits(object):
         self.ppips = {}
         self.feature_addresses = {}
 
+        # BlockType -> inverted bit index, see get_bit_index.
+        self.bit_index = {}
+
+        # (feature, address) -> FeatureBits, see get_feature_bits.
+        self.feature_bits = {}
+
         if tile_db.ppips is not None:
             with open(tile_db.ppips) as f:
                 self.ppips = read_ppips(f)
@@ -99,42 +123,84 @@ class TileSegbits(object):
                     self.feature_addresses[base_feature][int(
                         feature[sidx + 1:eidx])] = (block_type, feature)
 
-    def match_bitdata(self, block_type, bits, bitdata, match_filter=None):
-        """ Return matching features for tile bits data (grid.Bits) and bitdata.
+    def get_bit_index(self, block_type):
+        """ Return inverted bit index for block_type.
 
-        See bitstream.load_bitdata for details on bitdata structure.
+        Returns (features, bit_index, clear_only), where:
+         - features is a list of (feature, segbit) in segbits order.
+         - bit_index is a map of word_column to a map of word_bit to a list of
+           indices into features of features that set that bit.
+         - clear_only is a list of indices into features of features that do
+           not set any bit, and so must always be checked.
 
         """
+        if block_type not in self.bit_index:
+            features = list(self.segbits[block_type].items())
+            bit_index = {}
+            clear_only = []
 
-        if block_type not in self.segbits:
-            return
+            for feature_idx, (feature, segbit) in enumerate(features):
+                any_set = False
+                for bit in segbit:
+                    if bit.isset:
+                        any_set = True
+                        bit_index.setdefault(bit.word_column, {}).setdefault(
+                            bit.word_bit, []).append(feature_idx)
+
+                if not any_set:
+                    clear_only.append(feature_idx)
+
+            self.bit_index[block_type] = features, bit_index, clear_only
 
-        for feature, segbit in self.segbits[block_type].items():
-            match = True
-            skip = False
-            for query_bit in segbit:
-                if match_filter is not None and not match_filter(block_type,
-                                                                 query_bit):
-                    skip = True
-                    break
+        return self.bit_index[block_type]
 
-                frame = bits.base_address + query_bit.word_column
-                bitidx = bits.offset * bitstream.WORD_SIZE_BITS + query_bit.word_bit
+    def match_segbit(self, block_type, bits, bitdata, segbit, match_filter):
+        """ Returns True if every bit in segbit matches bitdata. """
+        for query_bit in segbit:
+            if match_filter is not None and not match_filter(block_type,
+                                                             query_bit):
+                return False
 
-                if frame not in bitdata:
-                    match = not query_bit.isset
-                    if match:
-                        continue
-                    else:
-                        break
+            frame = bits.base_address + query_bit.word_column
+            bitidx = bits.offset * bitstream.WORD_SIZE_BITS + query_bit.word_bit
 
-                found_bit = bitidx in bitdata[frame][1]
-                match = found_bit == query_bit.isset
+            if bitdata.has_bit(frame, bitidx) != query_bit.isset:
+                return False
 
-                if not match:
-                    break
+        return True
+
+    def match_bitdata(self, block_type, bits, bitdata, match_filter=None):
+        """ Return matching features for tile bits data (grid.Bits) and bitdata.
+
+        bitdata is a bitstream.BitData.
+
+        Only features that set at least one of the bits set in bitdata (or
+        features that do not set any bits) are checked, see get_bit_index.
+
+        """
 
-            if not match or skip:
+        if block_type not in self.segbits:
+            return
+
+        features, bit_index, clear_only = self.get_bit_index(block_type)
+        bit_base = bits.offset * bitstream.WORD_SIZE_BITS
+
+        candidates = set(clear_only)
+        for word_column, column_index in bit_index.items():
+            frame = bits.base_address + word_column
+
+            # Only the bits of the frame that are in column_index matter.
+            window = (bitdata.frame_bitmap(frame) >> bit_base) & (
+                (1 << (max(column_index) + 1)) - 1)
+            for word_bit in bitstream.iter_set_bits(window):
+                feature_idxs = column_index.get(word_bit)
+                if feature_idxs is not None:
+                    candidates.update(feature_idxs)
+
+        for feature_idx in sorted(candidates):
+            feature, segbit = features[feature_idx]
+            if not self.match_segbit(block_type, bits, bitdata, segbit,
+                                     match_filter):
                 continue
 
             def inner():
@@ -154,18 +220,72 @@ class TileSegbits(object):
             isset=bit.isset,
         )
 
-    def feature_to_bits(self, bits_map, feature, address=0):
-        if feature in self.ppips:
-            return
+    def lookup_feature(self, feature, address=0):
+        """ Return (block_type, segbits feature) for feature and address.
+
+        Raises KeyError if feature is not present.
 
+        """
         for block_type in self.segbits:
             if address == 0 and feature in self.segbits[block_type]:
-                for bit in self.segbits[block_type][feature]:
-                    yield block_type, self.map_bit_to_frame(
-                        block_type, bits_map[block_type], bit)
-                return
+                return block_type, feature
+
+        return self.feature_addresses[feature][address]
 
-        block_type, feature = self.feature_addresses[feature][address]
+    def feature_to_bits(self, bits_map, feature, address=0):
+        if feature in self.ppips:
+            return
+
+        block_type, feature = self.lookup_feature(feature, address)
         for bit in self.segbits[block_type][feature]:
             yield block_type, self.map_bit_to_frame(
                 block_type, bits_map[block_type], bit)
+
+    def get_feature_bits(self, feature, address=0):
+        """ Return FeatureBits for feature, or None for pseudo pips.
+
+        FeatureBits are compiled on first use.  Raises KeyError if feature is
+        not present.
+
+        """
+        key = (feature, address)
+        if key not in self.feature_bits:
+            self.feature_bits[key] = self.compile_feature_bits(
+                feature, address)
+
+        return self.feature_bits[key]
+
+    def compile_feature_bits(self, feature, address):
+        import numpy as np
+
+        if feature in self.ppips:
+            return None
+
+        block_type, feature = self.lookup_feature(feature, address)
+        segbit = self.segbits[block_type][feature]
+
+        word_columns = np.array(
+            [bit.word_column for bit in segbit], dtype=np.int64)
+        word_bits = np.array([bit.word_bit for bit in segbit], dtype=np.int64)
+
+        return FeatureBits(
+            block_type=block_type,
+            word_columns=word_columns,
+            word_indices=word_bits // bitstream.WORD_SIZE_BITS,
+            bit_indices=word_bits % bitstream.WORD_SIZE_BITS,
+            isset=np.array([bit.isset for bit in segbit], dtype=np.bool_),
+            unique=len(set((bit.word_column, bit.word_bit)
+                           for bit in segbit)) == len(segbit),
+        )
+
+    def feature_to_feature_bits(self, bits_map, feature, address=0):
+        """ Return (Bits, FeatureBits) for feature, or None for pseudo pips.
+
+        Bits is the entry of bits_map the FeatureBits are relative to.
+
+        """
+        feature_bits = self.get_feature_bits(feature, address)
+        if feature_bits is None:
+            return None
+
+        return bits_map[feature_bits.block_type], feature_bits
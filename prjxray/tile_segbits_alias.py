@@ -104,3 +104,8 @@ class TileSegbitsAlias(object):
         for block_type, bit in self.tile_segbits.feature_to_bits(
                 self.alias_bits_map, alias_feature, address):
             yield block_type, bit
+
+    def feature_to_feature_bits(self, bits_map, feature, address=0):
+        alias_feature = self.map_feature_to_segbits(feature)
+        return self.tile_segbits.feature_to_feature_bits(
+            self.alias_bits_map, alias_feature, address)
@@ -2,6 +2,7 @@ import math
 import os
 import random
 import re
+from . import db_reader
 from .roi import Roi
 
 
@@ -70,11 +71,28 @@ def slice_xy():
     return ((ms[0], ms[2] + 1), (ms[1], ms[3] + 1))
 
 
-def get_roi():
+def get_database(db_root=None):
+    """ Returns Database of db_root (default get_db_root()).
+
+    If XRAY_DATABASE_CACHE is set, the Database uses a cache file in that
+    directory and a CompactGrid, so the grid columns are read-only views of
+    the memory mapped cache file.  These are shared by every process (e.g.
+    parallel fuzzer specimens) that uses the same cache, rather than being
+    parsed from tilegrid.json by each of them.
+
+    """
     from .db import Database
+
+    if db_root is None:
+        db_root = get_db_root()
+
+    return Database(
+        db_root, compact_grid=bool(os.getenv('XRAY_DATABASE_CACHE')))
+
+
+def get_roi():
     (x1, x2), (y1, y2) = roi_xy()
-    db = Database(get_db_root())
-    return Roi(db=db, x1=x1, x2=x2, y1=y1, y2=y2)
+    return Roi(db=get_database(), x1=x1, x2=x2, y1=y1, y2=y2)
 
 
 def gen_sites_xy(site_types):
@@ -116,34 +134,17 @@ def db_root_arg(parser):
 
 
 def parse_db_line(line):
-    '''Return tag name, bit values (if any), mode (if any)'''
-    parts = line.split()
-    # Ex: CLBLL_L.SLICEL_X0.AMUX.A5Q
-    assert len(parts), "Empty line"
-    tag = parts[0]
-    if tag == 'bit':
-        raise ValueError("Wanted bits db but got mask db")
-    assert re.match(r'[A-Z0-9_.]+',
-                    tag), "Invalid tag name: %s, line: %s" % (tag, line)
-    orig_bits = line.replace(tag + " ", "")
-    # <0 candidates> etc
-    # Ex: INT_L.BYP_BOUNCE5.BYP_ALT5 always
-    if "<" in orig_bits or "always" == orig_bits:
-        return tag, None, orig_bits
-
-    bits = frozenset(parts[1:])
-    # Ex: CLBLL_L.SLICEL_X0.AOUTMUX.A5Q !30_06 !30_08 !30_11 30_07
-    for bit in bits:
-        # 19_39
-        # 100_319
-        assert re.match(r'[!]*[0-9]+_[0-9]+', bit), "Invalid bit: %s" % bit
-    return tag, bits, None
+    '''Return tag name, bit values (if any), mode (if any)
+
+    See db_reader, which should be used to parse whole files.
+    '''
+    return db_reader.parse_db_line(line)
 
 
 def parse_db_lines(fn):
-    with open(fn, "r") as f:
-        for line in f:
-            yield line, parse_db_line(line)
+    '''Yields (line, (tag, bits, mode)) of each entry of fn'''
+    entries = db_reader.read_db(fn)
+    return zip(entries.lines, entries.items())
 
 
 def write_db_lines(fn, entries):
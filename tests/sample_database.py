@@ -0,0 +1,157 @@
+""" Small sample database shared by the tests.
+
+The database has a CLBLL_L tile, the INT_L tile to its right and an empty
+VBRK tile.  Use setup_database() to get a temporary directory holding it.
+
+"""
+from contextlib import contextmanager
+import json
+import os.path
+from tempfile import TemporaryDirectory
+
+TILEGRID = {
+    "CLBLL_L_X2Y0": {
+        "bits": {
+            "CLB_IO_CLK": {
+                "baseaddr": "0x00400100",
+                "frames": 36,
+                "offset": 0,
+                "words": 2
+            }
+        },
+        "grid_x": 1,
+        "grid_y": 1,
+        "sites": {
+            "SLICE_X0Y0": "SLICEL",
+            "SLICE_X1Y0": "SLICEL"
+        },
+        "type": "CLBLL_L"
+    },
+    "INT_L_X2Y0": {
+        "bits": {
+            "CLB_IO_CLK": {
+                "baseaddr": "0x00400000",
+                "frames": 28,
+                "offset": 0,
+                "words": 2
+            }
+        },
+        "grid_x": 2,
+        "grid_y": 1,
+        "sites": {},
+        "type": "INT_L"
+    },
+    "VBRK_X0Y0": {
+        "bits": {},
+        "grid_x": 0,
+        "grid_y": 1,
+        "sites": {},
+        "type": "VBRK"
+    },
+}
+
+TILECONN = [
+    {
+        "grid_deltas": [1, 0],
+        "tile_types": ["CLBLL_L", "INT_L"],
+        "wire_pairs": [["CLBLL_L_A", "IMUX_L0"]],
+    },
+]
+
+
+def tile_type_json(tile_type, wires, pips, sites):
+    return {
+        "tile_type": tile_type,
+        "wires": dict((wire, None) for wire in wires),
+        "pips": pips,
+        "sites": sites,
+    }
+
+
+TILE_TYPES = {
+    "CLBLL_L":
+    tile_type_json(
+        "CLBLL_L", ["CLBLL_L_A"], {}, [
+            {
+                "name": "X0Y0",
+                "prefix": "SLICE",
+                "type": "SLICEL",
+                "x_coord": 0,
+                "y_coord": 0,
+                "site_pins": {
+                    "A1": "CLBLL_L_A"
+                },
+            }
+        ]),
+    "INT_L":
+    tile_type_json(
+        "INT_L", ["IMUX_L0", "LOGIC_OUTS_L0"], {
+            "INT_L.IMUX_L0->>LOGIC_OUTS_L0": {
+                "dst_wire": "IMUX_L0",
+                "src_wire": "LOGIC_OUTS_L0",
+                "can_invert": "0",
+                "is_directional": "1",
+                "is_pseudo": "0",
+            }
+        }, []),
+    "VBRK":
+    tile_type_json("VBRK", [], {}, []),
+}
+
+SEGBITS = {
+    "clbll_l":
+    "CLBLL_L.SLICEL_X0.ALUT.INIT[00] 32_14\n"
+    "CLBLL_L.SLICEL_X0.ALUT.INIT[01] 33_14\n"
+    "CLBLL_L.SLICEL_X0.AFFMUX.AX !30_00 31_01\n"
+    "CLBLL_L.SLICEL_X0.AFFMUX.BX 30_00 31_01\n",
+    "int_l":
+    "INT_L.IMUX_L0.LOGIC_OUTS_L0 00_02 01_03\n",
+}
+
+
+def write_database(db_root):
+    with open(os.path.join(db_root, 'tilegrid.json'), 'w') as f:
+        json.dump(TILEGRID, f)
+
+    with open(os.path.join(db_root, 'tileconn.json'), 'w') as f:
+        json.dump(TILECONN, f)
+
+    for tile_type, data in TILE_TYPES.items():
+        with open(os.path.join(db_root, 'tile_type_{}.json'.format(tile_type)),
+                  'w') as f:
+            json.dump(data, f)
+
+    for tile_type, data in SEGBITS.items():
+        with open(os.path.join(db_root, 'segbits_{}.db'.format(tile_type)),
+                  'w') as f:
+            f.write(data)
+
+    with open(os.path.join(db_root, 'ppips_int_l.db'), 'w') as f:
+        f.write('INT_L.LOGIC_OUTS_L0.IMUX_L0 hint\n')
+
+
+@contextmanager
+def setup_database():
+    """ Yields the path of a temporary directory with the sample database. """
+    with TemporaryDirectory() as db_root:
+        write_database(db_root)
+        yield db_root
+
+
+# Features of the sample database.
+FASM = """
+CLBLL_L_X2Y0.SLICEL_X0.ALUT.INIT[1:0] = 2'b10
+CLBLL_L_X2Y0.SLICEL_X0.AFFMUX.AX
+INT_L_X2Y0.IMUX_L0.LOGIC_OUTS_L0
+"""
+
+# Bits of the tiles of the sample database.
+BITS = (
+    # CLBLL_L_X2Y0, frame 1 and 3 of the tile.
+    'bit_00400101_000_05\n'
+    'bit_00400101_001_31\n'
+    'bit_00400103_000_00\n'
+    # Outside of the 2 words of the tile.
+    'bit_00400103_002_00\n'
+    # INT_L_X2Y0, frame 2.
+    'bit_00400002_001_02\n')
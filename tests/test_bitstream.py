@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import io
+import pickle
+import random
+from unittest import TestCase, main
+
+from prjxray import bitstream
+from prjxray.bitstream import BitData
+
+
+def random_bits_file(rng, nbits):
+    lines = set()
+    for _ in range(nbits):
+        frame = rng.choice([0x00400100, 0x00400101, 0x00400180, 0x00020500])
+        lines.add(
+            'bit_{:08x}_{:03d}_{:02d}\n'.format(
+                frame, rng.randint(0, 100), rng.randint(0, 31)))
+
+    return ''.join(sorted(lines))
+
+
+class TestBitData(TestCase):
+    def test_matches_legacy_loaders(self):
+        rng = random.Random(0)
+        bits_file = random_bits_file(rng, 500)
+
+        bitdata = BitData.load(io.StringIO(bits_file))
+        self.assertEqual(
+            bitdata.to_bitdata(), bitstream.load_bitdata(
+                io.StringIO(bits_file)))
+        self.assertEqual(
+            bitdata.to_bitdata2(),
+            bitstream.load_bitdata2(io.StringIO(bits_file)))
+        self.assertEqual(BitData.from_bitdata(bitdata.to_bitdata()), bitdata)
+        self.assertEqual(
+            ''.join(
+                'bit_{:08x}_{:03d}_{:02d}\n'.format(*bit)
+                for bit in bitdata.iter_bits()), bits_file)
+        self.assertEqual(pickle.loads(pickle.dumps(bitdata)), bitdata)
+
+    def test_queries(self):
+        bitdata = BitData.from_bits(
+            [
+                (0x00400100, 1, 2),
+                (0x00400100, 3, 31),
+                (0x00400101, 0, 0),
+                (0x00400180, 100, 5),
+            ])
+
+        self.assertEqual(len(bitdata), 3)
+        self.assertEqual(bitdata.count_bits(), 4)
+        self.assertIn(0x00400101, bitdata)
+        self.assertNotIn(0x00400102, bitdata)
+
+        self.assertTrue(bitdata.has_bit(0x00400100, 3 * 32 + 31))
+        self.assertFalse(bitdata.has_bit(0x00400100, 3 * 32 + 30))
+        self.assertFalse(bitdata.has_bit(0x00400102, 0))
+
+        self.assertEqual(bitdata.frame_words(0x00400100), [1, 3])
+        self.assertEqual(bitdata.frame_bits(0x00400100), [34, 127])
+        self.assertEqual(bitdata.word_value(0x00400100, 3), 0x80000000)
+        self.assertEqual(bitdata.word_bits(0x00400100, 1), [2])
+
+        self.assertTrue(bitdata.has_words(0x00400100, 2, 2))
+        self.assertFalse(bitdata.has_words(0x00400100, 2, 1))
+        self.assertEqual(bitdata.words_bits(0x00400100, 2, 2), [127])
+
+        self.assertEqual(
+            bitdata.base_frames(), {
+                0x00400100: [0x00400100, 0x00400101],
+                0x00400180: [0x00400180],
+            })
+        bitdata.add_bit(0x00400102, 0)
+        self.assertEqual(
+            bitdata.frames_in_base(0x00400100),
+            [0x00400100, 0x00400101, 0x00400102])
+
+    def test_set_algebra(self):
+        a = BitData.from_bits([(1, 0, 0), (1, 0, 1), (2, 5, 5)])
+        b = BitData.from_bits([(1, 0, 1), (2, 5, 5), (3, 0, 0)])
+
+        self.assertEqual(
+            a | b,
+            BitData.from_bits([(1, 0, 0), (1, 0, 1), (2, 5, 5), (3, 0, 0)]))
+        self.assertEqual(a & b, BitData.from_bits([(1, 0, 1), (2, 5, 5)]))
+        self.assertEqual(a - b, BitData.from_bits([(1, 0, 0)]))
+
+        # Frames without bits are dropped.
+        self.assertEqual(list(a - b), [1])
+        self.assertEqual(list(a & BitData.from_bits([(3, 0, 0)])), [])
+
+        c = a.copy()
+        c -= a
+        self.assertEqual(len(c), 0)
+        self.assertEqual(len(a), 2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import random
+import struct
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray import bitstream_reader
+from prjxray.bitstream import BitData
+from prjxray.bitstream_reader import frame_address
+
+IDCODE = 0x362d093
+
+
+def column_json(frame_counts):
+    return {
+        'configuration_columns':
+        dict(
+            (str(column), {
+                'frame_count': frame_count
+            }) for column, frame_count in enumerate(frame_counts))
+    }
+
+
+PART = {
+    'idcode': IDCODE,
+    'global_clock_regions': {
+        'top': {
+            'rows': {
+                '0': {
+                    'configuration_buses': {
+                        'CLB_IO_CLK': column_json([2, 3]),
+                        'BLOCK_RAM': column_json([2]),
+                    }
+                },
+                '1': {
+                    'configuration_buses': {
+                        'CLB_IO_CLK': column_json([2]),
+                    }
+                },
+            }
+        },
+        'bottom': {
+            'rows': {
+                '0': {
+                    'configuration_buses': {
+                        'CLB_IO_CLK': column_json([2]),
+                    }
+                },
+            }
+        },
+    },
+}
+
+# Frames of PART in auto-increment order, None marks the 2 frames of padding
+# written between rows.
+FRAME_ORDER = [
+    frame_address(0, False, 0, 0, 0),
+    frame_address(0, False, 0, 0, 1),
+    frame_address(0, False, 0, 1, 0),
+    frame_address(0, False, 0, 1, 1),
+    frame_address(0, False, 0, 1, 2),
+    None,
+    frame_address(0, False, 1, 0, 0),
+    frame_address(0, False, 1, 0, 1),
+    None,
+    frame_address(0, True, 0, 0, 0),
+    frame_address(0, True, 0, 0, 1),
+    frame_address(1, False, 0, 0, 0),
+    frame_address(1, False, 0, 0, 1),
+]
+
+
+def type1(register, data, opcode=bitstream_reader.OPCODE_WRITE):
+    return [1 << 29 | opcode << 27 | register << 13 | len(data)] + list(data)
+
+
+def type2(data, opcode=bitstream_reader.OPCODE_WRITE):
+    return [2 << 29 | opcode << 27 | len(data)] + list(data)
+
+
+def make_bitstream(frames, idcode=IDCODE):
+    fdri = []
+    for address in FRAME_ORDER:
+        if address is None:
+            fdri.extend([0xffffffff] * 2 * 101)
+        else:
+            fdri.extend(frames[address])
+
+    # Trailing dummy frame.
+    fdri.extend([0] * 101)
+
+    words = [0x20000000]
+    words += type1(bitstream_reader.REG_IDCODE, [idcode])
+    words += type1(bitstream_reader.REG_CMD, [bitstream_reader.CMD_WCFG])
+    words += type1(bitstream_reader.REG_FAR, [0])
+    words += type1(bitstream_reader.REG_FDRI, [])
+    words += type2(fdri)
+    words += [0x20000000] * 4
+
+    header = b'\x00\x09\x0f\xf0header' + b'\xff' * 8
+    header += struct.pack('>II', 0x000000bb, 0x11220044)
+    return header + bitstream_reader.SYNC_WORD + struct.pack(
+        '>{}I'.format(len(words)), *words)
+
+
+def bitread_bitdata(frames, include_ecc=False):
+    """ BitData of the output of "bitread -z -y". """
+    bitdata = {}
+    for address, data in frames.items():
+        for word, value in enumerate(data):
+            for bit in range(32):
+                if not value & (1 << bit):
+                    continue
+                if word == 50 and bit <= 12 and not include_ecc:
+                    continue
+
+                if address not in bitdata:
+                    bitdata[address] = set(), set()
+                bitdata[address][0].add(word)
+                bitdata[address][1].add(word * 32 + bit)
+
+    return BitData.from_bitdata(bitdata)
+
+
+class TestBitstreamReader(TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.frames = {}
+        for address in FRAME_ORDER:
+            if address is None:
+                continue
+
+            self.frames[address] = [
+                rng.getrandbits(32) if rng.random() < 0.1 else 0
+                for _ in range(101)
+            ]
+
+        # One empty frame, and one frame with only ECC bits set.
+        self.frames[FRAME_ORDER[1]] = [0] * 101
+        self.frames[FRAME_ORDER[2]] = [0] * 101
+        self.frames[FRAME_ORDER[2]][50] = 0x1fff
+
+        self.part = bitstream_reader.Part.from_json(PART)
+
+    def test_next_frame_address(self):
+        order = [address for address in FRAME_ORDER if address is not None]
+        for address, next_address in zip(order, order[1:] + [None]):
+            self.assertEqual(
+                self.part.get_next_frame_address(address), next_address)
+
+    def test_load_bitdata_from_bit(self):
+        with TemporaryDirectory() as tmp_dir:
+            part_file = os.path.join(tmp_dir, 'part.json')
+            with open(part_file, 'w') as f:
+                json.dump(PART, f)
+
+            bit_file = os.path.join(tmp_dir, 'design.bit')
+            with open(bit_file, 'wb') as f:
+                f.write(make_bitstream(self.frames))
+
+            self.assertEqual(
+                bitstream_reader.load_bitdata_from_bit(bit_file, part_file),
+                bitread_bitdata(self.frames))
+
+            self.assertEqual(
+                bitstream_reader.load_bitdata_from_bit(
+                    bit_file, self.part, include_ecc=True),
+                bitread_bitdata(self.frames, include_ecc=True))
+
+            first, last = FRAME_ORDER[6], FRAME_ORDER[10]
+            expected = BitData(
+                dict(
+                    (address, bitmap)
+                    for address, bitmap in bitread_bitdata(self.frames).frames.
+                    items()
+                    if first <= address <= last))
+            self.assertEqual(
+                bitstream_reader.load_bitdata_from_bit(
+                    bit_file, self.part, frame_range=(first, last)), expected)
+
+    def test_idcode_mismatch(self):
+        with TemporaryDirectory() as tmp_dir:
+            bit_file = os.path.join(tmp_dir, 'design.bit')
+            with open(bit_file, 'wb') as f:
+                f.write(make_bitstream(self.frames, idcode=IDCODE + 1))
+
+            with self.assertRaises(ValueError):
+                bitstream_reader.load_bitdata_from_bit(bit_file, self.part)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import os.path
+from unittest import TestCase, main
+
+from prjxray.db import Database
+from prjxray.compact_grid import CompactGrid
+from prjxray.grid_types import GridLoc
+
+from sample_database import setup_database
+
+
+class TestCompactGrid(TestCase):
+    def assertGridEqual(self, grid, compact):
+        self.assertEqual(sorted(grid.tiles()), compact.tiles())
+        self.assertEqual(
+            sorted(grid.tile_locations()), sorted(compact.tile_locations()))
+        self.assertEqual(grid.dims(), compact.dims())
+
+        for tile in grid.tiles():
+            loc = grid.loc_of_tilename(tile)
+            self.assertEqual(loc, compact.loc_of_tilename(tile))
+            self.assertEqual(tile, compact.tilename_at_loc(loc))
+            self.assertTrue(compact.is_populated(loc))
+            self.assertEqual(
+                grid.gridinfo_at_tilename(tile),
+                compact.gridinfo_at_tilename(tile))
+            self.assertEqual(
+                grid.gridinfo_at_loc(loc), compact.gridinfo_at_loc(loc))
+            self.assertEqual(grid.tile_key(tile), compact.tile_key(tile))
+
+        self.assertEqual(
+            sorted(grid.iter_all_frames()), sorted(compact.iter_all_frames()))
+
+        self.assertFalse(compact.is_populated(GridLoc(100, 100)))
+        with self.assertRaises(KeyError):
+            compact.loc_of_tilename('NOT_A_TILE')
+
+    def test_compact_grid(self):
+        with setup_database() as db_root:
+            grid = Database(db_root).grid()
+            compact = Database(db_root, compact_grid=True).grid()
+            self.assertIsInstance(compact, CompactGrid)
+            self.assertGridEqual(grid, compact)
+
+    def test_compact_grid_from_cache(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'db.cache')
+
+            grid = Database(db_root).grid()
+            db = Database(db_root, cache_file=cache_file, compact_grid=True)
+            compact = db.grid()
+            self.assertFalse(compact.tile_names.flags.writeable)
+            self.assertGridEqual(grid, compact)
+
+
+if __name__ == '__main__':
+    main()
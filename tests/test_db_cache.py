@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import functools
+import multiprocessing
+import os
+import os.path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main, mock
+
+from prjxray.db import Database
+from prjxray import db_cache
+from prjxray.grid_types import BlockType
+
+from sample_database import setup_database, write_database
+
+
+def gen_counted_sections(build_log):
+    with open(build_log, 'a') as f:
+        f.write('build\n')
+
+    yield 'data', b'shared'
+
+
+def open_counted_cache(db_root, build_log):
+    cache = db_cache.open_cache_file(
+        db_root, os.path.join(db_root, 'shared.cache'),
+        functools.partial(gen_counted_sections, build_log))
+    return bytes(cache.get_bytes('data'))
+
+
+class TestDbCache(TestCase):
+    def assertDatabaseEqual(self, db_a, db_b):
+        grid_a = db_a.grid()
+        grid_b = db_b.grid()
+        self.assertEqual(set(grid_a.tiles()), set(grid_b.tiles()))
+        for tile in grid_a.tiles():
+            self.assertEqual(
+                grid_a.gridinfo_at_tilename(tile),
+                grid_b.gridinfo_at_tilename(tile))
+            self.assertEqual(
+                grid_a.loc_of_tilename(tile), grid_b.loc_of_tilename(tile))
+
+        self.assertEqual(
+            set(db_a.get_tile_types()), set(db_b.get_tile_types()))
+        for tile_type in db_a.get_tile_types():
+            tile_a = db_a.get_tile_type(tile_type)
+            tile_b = db_b.get_tile_type(tile_type)
+            self.assertEqual(tile_a.get_wires(), tile_b.get_wires())
+            self.assertEqual(tile_a.get_sites(), tile_b.get_sites())
+            self.assertEqual(tile_a.get_pips(), tile_b.get_pips())
+
+            segbits_a = db_a.get_tile_segbits(tile_type)
+            segbits_b = db_b.get_tile_segbits(tile_type)
+            self.assertEqual(segbits_a.segbits, segbits_b.segbits)
+            self.assertEqual(segbits_a.ppips, segbits_b.ppips)
+            self.assertEqual(
+                segbits_a.feature_addresses, segbits_b.feature_addresses)
+
+        self.assertEqual(
+            sorted(db_a.connections().get_connections()),
+            sorted(db_b.connections().get_connections()))
+
+    def test_cache_matches_source(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'db.cache')
+
+            db = Database(db_root)
+            cached_db = Database(db_root, cache_file=cache_file)
+            self.assertIsNotNone(cached_db.cache)
+            self.assertTrue(os.path.exists(cache_file))
+
+            self.assertDatabaseEqual(db, cached_db)
+
+            # Second open reuses the cache.
+            self.assertDatabaseEqual(
+                db, Database(db_root, cache_file=cache_file))
+
+            grid = cached_db.grid()
+            self.assertIs(grid.db, cached_db)
+            self.assertIn(
+                BlockType.CLB_IO_CLK,
+                grid.gridinfo_at_tilename('INT_L_X2Y0').bits)
+
+    def test_cache_rebuilt_when_stale(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'db.cache')
+
+            Database(db_root, cache_file=cache_file)
+            cache_mtime = os.stat(cache_file).st_mtime_ns
+
+            # Touching a file without changing its contents keeps the cache.
+            segbits = os.path.join(db_root, 'segbits_int_l.db')
+            st = os.stat(segbits)
+            os.utime(segbits, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            db = Database(db_root, cache_file=cache_file)
+            self.assertEqual(os.stat(cache_file).st_mtime_ns, cache_mtime)
+
+            with open(segbits, 'a') as f:
+                f.write('INT_L.IMUX_L0.LOGIC_OUTS_L1 02_02\n')
+
+            db = Database(db_root, cache_file=cache_file)
+            self.assertIn(
+                'INT_L.IMUX_L0.LOGIC_OUTS_L1',
+                db.get_tile_segbits('INT_L').segbits[BlockType.CLB_IO_CLK])
+
+    def test_invalid_cache_file(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'db.cache')
+            with open(cache_file, 'wb') as f:
+                f.write(b'not a cache')
+
+            with self.assertRaises(db_cache.CacheError):
+                db_cache.DatabaseCache(cache_file)
+
+            db = Database(db_root, cache_file=cache_file)
+            self.assertIn('INT_L_X2Y0', db.grid().tiles())
+
+    def test_cache_dir(self):
+        with TemporaryDirectory() as tmp_dir:
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            db_roots = [os.path.join(tmp_dir, part, 'db') for part in 'ab']
+            for db_root in db_roots:
+                os.makedirs(db_root)
+                write_database(db_root)
+
+            cache_files = [
+                db_cache.cache_file_in_dir(cache_dir, db_root)
+                for db_root in db_roots
+            ]
+            self.assertNotEqual(cache_files[0], cache_files[1])
+
+            with mock.patch.dict(os.environ,
+                                 {'XRAY_DATABASE_CACHE': cache_dir}):
+                for db_root, cache_file in zip(db_roots, cache_files):
+                    db = Database(db_root)
+                    self.assertEqual(db.cache.fname, cache_file)
+
+            for cache_file in cache_files:
+                self.assertTrue(os.path.exists(cache_file))
+
+    def test_corrupt_cache_file(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'db.cache')
+            Database(db_root, cache_file=cache_file)
+            with open(cache_file, 'rb') as f:
+                preamble = f.read(db_cache.PREAMBLE.size)
+
+            magic, version, _ = db_cache.PREAMBLE.unpack(preamble)
+            bad_headers = [
+                b'',
+                preamble[:-1],
+                db_cache.PREAMBLE.pack(magic, version, 1 << 20),
+                db_cache.PREAMBLE.pack(magic, version, 9) + b'\xff garbage',
+                db_cache.PREAMBLE.pack(magic, version, 4) + b'null',
+                db_cache.PREAMBLE.pack(magic, version, 2) + b'{}',
+            ]
+            for contents in bad_headers:
+                with open(cache_file, 'wb') as f:
+                    f.write(contents)
+
+                with self.assertRaises(db_cache.CacheError):
+                    db_cache.DatabaseCache(cache_file)
+
+                db = Database(db_root, cache_file=cache_file)
+                self.assertIn('INT_L_X2Y0', db.grid().tiles())
+
+    def test_concurrent_open_builds_once(self):
+        with setup_database() as db_root:
+            build_log = os.path.join(db_root, 'build.log')
+
+            with multiprocessing.Pool(4) as pool:
+                data = pool.starmap(
+                    open_counted_cache, [(db_root, build_log)] * 8)
+
+            self.assertEqual(data, [b'shared'] * 8)
+            with open(build_log) as f:
+                self.assertEqual(f.read(), 'build\n')
+
+
+if __name__ == '__main__':
+    main()
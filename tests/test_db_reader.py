@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os.path
+import random
+import re
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray import db_reader
+from prjxray import util
+
+SEGBITS = [
+    "CLBLL_L.SLICEL_X0.AOUTMUX.A5Q !30_06 !30_08 30_07",
+    "  CLBLL_L.SLICEL_X0.AMUX.A5Q 30_07 !100_319 ",
+    "",
+    "INT_L.BYP_BOUNCE5.BYP_ALT5 always",
+    "CLBLL_L.SLICEL_X0.BMUX.B5Q <0 candidates>",
+    "CLBLL_L.SLICEL_X0.CMUX.C5Q <m1 2> 01_02",
+]
+
+
+def reference_parse_db_line(line):
+    """ Original regex based util.parse_db_line. """
+    parts = line.split()
+    assert len(parts), "Empty line"
+    tag = parts[0]
+    if tag == 'bit':
+        raise ValueError("Wanted bits db but got mask db")
+    assert re.match(r'[A-Z0-9_.]+',
+                    tag), "Invalid tag name: %s, line: %s" % (tag, line)
+    orig_bits = line.replace(tag + " ", "")
+    if "<" in orig_bits or "always" == orig_bits:
+        return tag, None, orig_bits
+
+    bits = frozenset(parts[1:])
+    for bit in bits:
+        assert re.match(r'[!]*[0-9]+_[0-9]+', bit), "Invalid bit: %s" % bit
+    return tag, bits, None
+
+
+def random_segbits(rng, num_tags):
+    lines = []
+    for tag in range(num_tags):
+        bits = set(
+            '{}{:02d}_{:02d}'.format(
+                rng.choice(('', '!')), rng.randrange(36), rng.randrange(64))
+            for _ in range(rng.randint(1, 4)))
+        lines.append('TYPE.TAG{} {}'.format(tag, ' '.join(sorted(bits))))
+
+    return lines
+
+
+class TestDbReader(TestCase):
+    def test_columns(self):
+        db = db_reader.parse_lines(SEGBITS)
+        self.assertEqual(len(db), 5)
+        self.assertEqual(db.lines[1], SEGBITS[1].strip())
+        self.assertEqual(
+            [db.tags.names[tag_id] for tag_id in db.tag_ids], [
+                "CLBLL_L.SLICEL_X0.AOUTMUX.A5Q",
+                "CLBLL_L.SLICEL_X0.AMUX.A5Q",
+                "INT_L.BYP_BOUNCE5.BYP_ALT5",
+                "CLBLL_L.SLICEL_X0.BMUX.B5Q",
+                "CLBLL_L.SLICEL_X0.CMUX.C5Q",
+            ])
+        self.assertEqual(
+            db.modes, [None, None, "always", "<0 candidates>", "<m1 2> 01_02"])
+
+        self.assertEqual(db.indptr.tolist(), [0, 3, 5, 5, 5, 5])
+        self.assertEqual(db.word_column.tolist(), [30, 30, 30, 30, 100])
+        self.assertEqual(db.word_bit.tolist(), [6, 8, 7, 7, 319])
+        self.assertEqual(db.isset.tolist(), [False, False, True, True, False])
+
+        # 30_07 is interned once.
+        self.assertEqual(db.bit_ids.tolist(), [0, 1, 2, 2, 3])
+        self.assertEqual(len(db.bits), 4)
+
+    def test_parse_db_line(self):
+        rng = random.Random(0)
+        lines = [line.strip() for line in SEGBITS if line.strip()]
+        lines += random_segbits(rng, 100)
+
+        db = db_reader.parse_lines(lines)
+        for line, entry in zip(lines, db.items()):
+            expected = reference_parse_db_line(line)
+            self.assertEqual(util.parse_db_line(line), expected)
+            self.assertEqual(db_reader.parse_db_line(line), expected)
+            self.assertEqual(entry, expected)
+
+    def test_shared_tables(self):
+        db1 = db_reader.parse_lines(["A.X 01_02 !01_03"])
+        db2 = db_reader.parse_lines(
+            ["A.Y !01_03 01_04", "A.X 01_02"], tags=db1.tags, bits=db1.bits)
+
+        self.assertEqual(db2.tag_ids.tolist(), [1, 0])
+        self.assertEqual(db2.bit_ids.tolist(), [1, 2, 0])
+        self.assertEqual(db2.word_bit.tolist(), [3, 4, 2])
+
+    def test_validate_only(self):
+        self.assertEqual(db_reader.parse_lines(SEGBITS, validate_only=True), 5)
+
+        with self.assertRaises(AssertionError):
+            db_reader.parse_lines(
+                ["A.X 01_02", "A.Y 01x02"], validate_only=True)
+        with self.assertRaises(AssertionError):
+            db_reader.parse_lines(["a.x 01_02"], validate_only=True)
+        with self.assertRaises(ValueError):
+            db_reader.parse_lines(["bit 01_02"], validate_only=True)
+
+    def test_mask(self):
+        db = db_reader.parse_lines(["bit 01_02", "bit 100_03"], db_reader.MASK)
+        self.assertEqual(db.word_column.tolist(), [1, 100])
+        self.assertEqual(db.word_bit.tolist(), [2, 3])
+
+        with self.assertRaises(AssertionError):
+            db_reader.parse_lines(["A.X 01_02"], db_reader.MASK)
+        with self.assertRaises(AssertionError):
+            db_reader.parse_lines(["bit 01_02 01_03"], db_reader.MASK)
+
+    def test_ppips(self):
+        db = db_reader.parse_lines(
+            ["INT_L.A always", "INT_L.B hint"], db_reader.PPIPS)
+        self.assertEqual(
+            list(db.items()),
+            [("INT_L.A", None, "always"), ("INT_L.B", None, "hint")])
+
+        with self.assertRaises(AssertionError):
+            db_reader.parse_lines(["INT_L.A"], db_reader.PPIPS)
+
+    def test_read_db(self):
+        with TemporaryDirectory() as d:
+            fn = os.path.join(d, 'segbits_test.db')
+            with open(fn, 'w') as f:
+                f.write('\n'.join(SEGBITS) + '\n')
+
+            self.assertEqual(
+                list(util.parse_db_lines(fn)),
+                list(
+                    zip(
+                        db_reader.parse_lines(SEGBITS).lines,
+                        db_reader.read_db(fn).items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os.path
+from unittest import TestCase, main
+
+import numpy as np
+
+from prjxray.db import Database
+from prjxray import fasm_assembler
+
+from sample_database import FASM, setup_database
+
+CONFLICT_FASM = """
+CLBLL_L_X2Y0.SLICEL_X0.AFFMUX.AX
+CLBLL_L_X2Y0.SLICEL_X0.AFFMUX.BX
+"""
+
+
+class TestFasmAssembler(TestCase):
+    def assemble(self, assembler_class, db_root, fasm_text, sparse):
+        fasm_file = os.path.join(db_root, 'design.fasm')
+        with open(fasm_file, 'w') as f:
+            f.write(fasm_text)
+
+        assembler = assembler_class(Database(db_root))
+        assembler.parse_fasm_filename(fasm_file)
+        return assembler.get_frames(sparse=sparse)
+
+    def test_vectorized_frames_match(self):
+        with setup_database() as db_root:
+            for sparse in (False, True):
+                frames = self.assemble(
+                    fasm_assembler.FasmAssembler, db_root, FASM, sparse)
+                self.assertTrue(any(any(words) for words in frames.values()))
+
+                for assembler_class in (fasm_assembler.VectorFasmAssembler,
+                                        fasm_assembler.StreamingFasmAssembler):
+                    self.assertEqual(
+                        frames,
+                        self.assemble(assembler_class, db_root, FASM, sparse))
+
+    def test_vectorized_conflict(self):
+        with setup_database() as db_root:
+            messages = []
+            for assembler_class in (fasm_assembler.FasmAssembler,
+                                    fasm_assembler.VectorFasmAssembler,
+                                    fasm_assembler.StreamingFasmAssembler):
+                with self.assertRaises(
+                        fasm_assembler.FasmInconsistentBits) as cm:
+                    self.assemble(
+                        assembler_class, db_root, CONFLICT_FASM, sparse=True)
+                messages.append(str(cm.exception))
+
+            self.assertEqual(messages[0], messages[1])
+            self.assertEqual(messages[0], messages[2])
+
+    def test_streaming_spill(self):
+        with setup_database() as db_root:
+            fasm_file = os.path.join(db_root, 'design.fasm')
+            with open(fasm_file, 'w') as f:
+                f.write(FASM)
+                f.write(CONFLICT_FASM)
+
+            assembler = fasm_assembler.StreamingFasmAssembler(
+                Database(db_root), max_memory=1, spill_dir=db_root)
+            assembler.bit_log = fasm_assembler.ProvenanceLog(
+                max_memory=1, spill_dir=db_root, chunk_size=1)
+            self.assertIsInstance(assembler.values, np.memmap)
+
+            with self.assertRaises(fasm_assembler.FasmInconsistentBits) as cm:
+                assembler.parse_fasm_filename(fasm_file)
+
+            self.assertGreater(assembler.bit_log.spilled_count, 0)
+            self.assertIn(
+                '"CLBLL_L_X2Y0.SLICEL_X0.AFFMUX.AX"', str(cm.exception))
+
+    def test_streaming_blocks(self):
+        with setup_database() as db_root:
+            fasm_file = os.path.join(db_root, 'design.fasm')
+            with open(fasm_file, 'w') as f:
+                f.write('# header\n')
+                f.write(FASM)
+                f.write('\n  # comment\n')
+                f.write(CONFLICT_FASM)
+
+            self.assertEqual(
+                [
+                    line_numbers for line_numbers, _ in fasm_assembler.
+                    read_fasm_blocks(fasm_file, block_lines=2)
+                ], [[3, 4], [5, 9], [10]])
+
+            messages = []
+            for block_lines in (1, 2, fasm_assembler.FASM_BLOCK_LINES):
+                assembler = fasm_assembler.StreamingFasmAssembler(
+                    Database(db_root), block_lines=block_lines)
+                with self.assertRaises(
+                        fasm_assembler.FasmInconsistentBits) as cm:
+                    assembler.parse_fasm_filename(fasm_file)
+                messages.append(str(cm.exception))
+
+            self.assertEqual(messages[0], messages[1])
+            self.assertEqual(messages[0], messages[2])
+            self.assertIn('"CLBLL_L_X2Y0.SLICEL_X0.AFFMUX.AX"', messages[0])
+
+
+if __name__ == '__main__':
+    main()
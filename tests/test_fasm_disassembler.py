@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os.path
+from unittest import TestCase, main, mock
+
+import fasm
+
+from prjxray.db import Database
+from prjxray import bitstream
+from prjxray import fasm_assembler
+from prjxray import fasm_disassembler
+
+from sample_database import FASM, setup_database
+
+
+def frames_to_bitdata(frames):
+    """ Convert FasmAssembler.get_frames output to load_bitdata format. """
+    bitdata = {}
+    for frame, words in frames.items():
+        for wordidx, word in enumerate(words):
+            for bitidx in range(bitstream.WORD_SIZE_BITS):
+                if word & (1 << bitidx):
+                    bitdata.setdefault(frame, (set(), set()))
+                    bitdata[frame][0].add(wordidx)
+                    bitdata[frame][1].add(
+                        wordidx * bitstream.WORD_SIZE_BITS + bitidx)
+
+    return bitdata
+
+
+class TestFasmDisassembler(TestCase):
+    def test_parallel_matches_sequential(self):
+        with setup_database() as db_root:
+            fasm_file = os.path.join(db_root, 'design.fasm')
+            with open(fasm_file, 'w') as f:
+                f.write(FASM)
+
+            db = Database(db_root)
+            assembler = fasm_assembler.FasmAssembler(db)
+            assembler.parse_fasm_filename(fasm_file)
+            frames = assembler.get_frames(sparse=True)
+
+            # Add a bit that is not part of any feature.
+            frames[0x00400000][1] |= 1 << 7
+
+            disassembler = fasm_disassembler.FasmDisassembler(db)
+            sequential = set(
+                disassembler.find_features_in_bitstream(
+                    frames_to_bitdata(frames), verbose=True))
+            parallel = list(
+                disassembler.find_features_in_bitstream_parallel(
+                    frames_to_bitdata(frames), processes=2, verbose=True))
+
+            self.assertEqual(sequential, set(parallel))
+            self.assertEqual(len(parallel), len(set(parallel)))
+            self.assertIn(
+                'INT_L_X2Y0.IMUX_L0.LOGIC_OUTS_L0',
+                set(
+                    line.set_feature.feature
+                    for line in parallel
+                    if line.set_feature))
+
+            # Output order is deterministic.
+            self.assertEqual(
+                parallel,
+                list(
+                    disassembler.find_features_in_bitstream_parallel(
+                        frames_to_bitdata(frames), processes=2, verbose=True)))
+
+            # Forked workers use the parent's disassembler.
+            if multiprocessing.get_start_method() == 'fork':
+                with mock.patch.object(Database, '__init__',
+                                       side_effect=AssertionError):
+                    self.assertEqual(
+                        parallel,
+                        list(
+                            disassembler.find_features_in_bitstream_parallel(
+                                frames_to_bitdata(frames),
+                                processes=2,
+                                verbose=True)))
+
+
+if __name__ == '__main__':
+    main()
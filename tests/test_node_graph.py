@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import os.path
+import random
+from unittest import TestCase, main, mock
+
+import numpy as np
+
+from prjxray.db import Database
+from prjxray.node_graph import NodeGraph, union_find
+
+from sample_database import TILECONN, setup_database
+
+
+def reference_nodes(db):
+    """ Nodes built by merging the connections of prjxray.connections. """
+    wire_sets = {}
+    for connection in db.connections().get_connections():
+        wire_a = (connection.wire_a.tile, connection.wire_a.wire)
+        wire_b = (connection.wire_b.tile, connection.wire_b.wire)
+
+        set_a = wire_sets.setdefault(wire_a, set((wire_a, )))
+        set_b = wire_sets.setdefault(wire_b, set((wire_b, )))
+        if set_a is set_b:
+            continue
+
+        set_a |= set_b
+        for wire in set_b:
+            wire_sets[wire] = set_a
+
+    return set(frozenset(wires) for wires in wire_sets.values())
+
+
+class TestNodeGraph(TestCase):
+    def test_union_find(self):
+        rng = random.Random(0)
+        num_elements = 500
+        a = [rng.randrange(num_elements) for _ in range(300)]
+        b = [rng.randrange(num_elements) for _ in range(300)]
+
+        expected = list(range(num_elements))
+
+        def find(x):
+            while expected[x] != x:
+                x = expected[x]
+            return x
+
+        for x, y in zip(a, b):
+            root_x, root_y = find(x), find(y)
+            expected[max(root_x, root_y)] = min(root_x, root_y)
+
+        self.assertEqual(
+            union_find(num_elements, np.array(a), np.array(b)).tolist(),
+            [find(x) for x in range(num_elements)])
+
+    def test_matches_connections(self):
+        with setup_database() as db_root:
+            db = Database(db_root)
+            graph = NodeGraph.from_database(db)
+
+            self.assertEqual(graph.num_wires(), 3)
+            self.assertEqual(graph.num_nodes(), 2)
+            self.assertEqual(
+                set(
+                    frozenset(wires)
+                    for _, wires in graph.iter_nodes(min_wires=2)),
+                reference_nodes(db))
+
+            for wire_id in range(graph.num_wires()):
+                tile, wire = graph.wire_name(wire_id)
+                self.assertEqual(graph.wire_id(tile, wire), wire_id)
+                self.assertIn(
+                    wire_id, graph.wires_of_node(graph.node_of_wire(wire_id)))
+
+            self.assertEqual(
+                graph.node_id('CLBLL_L_X2Y0', 'CLBLL_L_A'),
+                graph.node_id('INT_L_X2Y0', 'IMUX_L0'))
+            self.assertNotEqual(
+                graph.node_id('INT_L_X2Y0', 'LOGIC_OUTS_L0'),
+                graph.node_id('INT_L_X2Y0', 'IMUX_L0'))
+
+            with self.assertRaises(KeyError):
+                graph.wire_id('INT_L_X9Y9', 'IMUX_L0')
+            with self.assertRaises(KeyError):
+                graph.wire_id('INT_L_X2Y0', 'IMUX_L1')
+
+    def test_missing_wire_pairs(self):
+        with setup_database() as db_root:
+            graph = NodeGraph.from_database(Database(db_root))
+            self.assertEqual(graph.missing_wire_pairs, [])
+
+            tileconn = json.loads(json.dumps(TILECONN))
+            tileconn[0]['wire_pairs'].append(['CLBLL_L_B', 'IMUX_L0'])
+            with open(os.path.join(db_root, 'tileconn.json'), 'w') as f:
+                json.dump(tileconn, f)
+
+            db = Database(db_root)
+            graph = NodeGraph.from_database(db)
+            self.assertEqual(
+                graph.missing_wire_pairs,
+                [('CLBLL_L', 'CLBLL_L_B', 'INT_L', 'IMUX_L0')])
+            self.assertEqual(graph.num_nodes(), 2)
+
+            cache_file = os.path.join(db_root, 'nodes.cache')
+            self.assertEqual(
+                db.node_graph(cache_file).missing_wire_pairs,
+                graph.missing_wire_pairs)
+
+    def test_node_graph_cache(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'nodes.cache')
+
+            graph = NodeGraph.from_database(Database(db_root))
+            cached_graph = Database(db_root).node_graph(cache_file)
+            self.assertTrue(os.path.exists(cache_file))
+            self.assertFalse(cached_graph.wire_node.flags.writeable)
+
+            self.assertEqual(
+                list(cached_graph.iter_nodes()), list(graph.iter_nodes()))
+
+            # Opening again reuses the cache file.
+            mtime = os.path.getmtime(cache_file)
+            Database(db_root).node_graph(cache_file)
+            self.assertEqual(os.path.getmtime(cache_file), mtime)
+
+    def test_default_cache_file(self):
+        with setup_database() as db_root, mock.patch.dict(os.environ):
+            os.environ.pop('XRAY_DATABASE_CACHE', None)
+            files = sorted(os.listdir(db_root))
+
+            # Without a database cache, nothing is written.
+            graph = Database(db_root).node_graph()
+            self.assertEqual(graph.num_nodes(), 2)
+            self.assertEqual(sorted(os.listdir(db_root)), files)
+
+            # Otherwise the node graph is stored next to it.
+            cache_file = os.path.join(db_root, 'db.cache')
+            graph = Database(db_root, cache_file=cache_file).node_graph()
+            self.assertEqual(graph.num_nodes(), 2)
+            self.assertTrue(os.path.exists(cache_file + '.nodes'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import json
+import os.path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray.node_lookup import NodeLookup
+
+NODES = {
+    'INT_L_X2Y0/IMUX_L0': ['CLBLL_L_X2Y0/CLBLL_L_A', 'INT_L_X2Y0/IMUX_L0'],
+    'INT_L_X2Y0/LOGIC_OUTS_L0': ['INT_L_X2Y0/LOGIC_OUTS_L0'],
+    'CLBLL_L_X2Y0/CLBLL_L_AQ':
+    ['CLBLL_L_X2Y0/CLBLL_L_AQ', 'INT_L_X2Y0/LOGIC_OUTS_L4'],
+}
+
+
+def write_raw_nodes(root_dir):
+    nodes = []
+    for idx, (node, wires) in enumerate(sorted(NODES.items())):
+        fname = os.path.join(root_dir, 'node_{}.json5'.format(idx))
+        with open(fname, 'w') as f:
+            json.dump(
+                {
+                    'node': node,
+                    'wires': [{
+                        'wire': wire
+                    } for wire in wires],
+                }, f)
+        nodes.append(fname)
+
+    tiles = {
+        'CLBLL_L': [os.path.join(root_dir, 'tile_CLBLL_L_X2Y0.json5')],
+        'INT_L': [os.path.join(root_dir, 'tile_INT_L_X2Y0.json5')],
+    }
+
+    return nodes, tiles
+
+
+class TestNodeLookup(TestCase):
+    def check_lookup(self, node_lookup):
+        self.assertEqual(
+            list(
+                node_lookup.site_pin_node_to_wires(
+                    'CLBLL_L_X2Y0', 'INT_L_X2Y0/IMUX_L0')), ['CLBLL_L_A'])
+        self.assertEqual(
+            list(node_lookup.site_pin_node_to_wires('CLBLL_L_X2Y0', None)), [])
+        self.assertEqual(
+            sorted(node_lookup.wires_for_tile('INT_L_X2Y0')),
+            ['IMUX_L0', 'LOGIC_OUTS_L0', 'LOGIC_OUTS_L4'])
+
+        self.assertEqual(
+            node_lookup.site_pin_nodes_to_wires(
+                [
+                    ('CLBLL_L_X2Y0', 'INT_L_X2Y0/IMUX_L0'),
+                    ('INT_L_X2Y0', 'CLBLL_L_X2Y0/CLBLL_L_AQ'),
+                    ('INT_L_X2Y0', 'INT_L_X2Y0/LOGIC_OUTS_L0'),
+                    ('CLBLL_L_X2Y0', 'INT_L_X2Y0/LOGIC_OUTS_L0'),
+                    ('CLBLL_L_X2Y0', None),
+                ]),
+            {
+                ('CLBLL_L_X2Y0', 'INT_L_X2Y0/IMUX_L0'): ['CLBLL_L_A'],
+                ('INT_L_X2Y0', 'CLBLL_L_X2Y0/CLBLL_L_AQ'): ['LOGIC_OUTS_L4'],
+                ('INT_L_X2Y0', 'INT_L_X2Y0/LOGIC_OUTS_L0'): ['LOGIC_OUTS_L0'],
+            })
+
+        wires = node_lookup.wires_for_tiles(['INT_L_X2Y0', 'VBRK_X0Y0'])
+        self.assertEqual(list(wires.keys()), ['INT_L_X2Y0'])
+        self.assertEqual(
+            sorted(wires['INT_L_X2Y0']),
+            ['IMUX_L0', 'LOGIC_OUTS_L0', 'LOGIC_OUTS_L4'])
+
+    def test_build_database(self):
+        for processes in (1, 2):
+            with TemporaryDirectory() as root_dir:
+                nodes, tiles = write_raw_nodes(root_dir)
+                database_file = os.path.join(root_dir, 'nodes.db')
+
+                node_lookup = NodeLookup(database_file)
+                node_lookup.build_database(
+                    nodes=nodes, tiles=tiles, processes=processes)
+                self.check_lookup(node_lookup)
+
+                # Reopen the database, as reduce_tile_types workers do.
+                self.check_lookup(NodeLookup(database_file))
+
+
+if __name__ == '__main__':
+    main()
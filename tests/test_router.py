@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+import os.path
+import random
+from unittest import TestCase, main, mock
+
+import numpy as np
+
+from prjxray.db import Database
+from prjxray.router import RoutingError, RoutingGraph, routing_bounds
+
+from sample_database import setup_database
+
+
+def random_graph(rng, num_nodes, num_edges):
+    """ RoutingGraph of random nodes at random grid locations. """
+    edges = sorted(
+        set(
+            (rng.randrange(num_nodes), rng.randrange(num_nodes))
+            for _ in range(num_edges)))
+
+    node_bbox = np.zeros((num_nodes, 4), dtype=np.int32)
+    for node in range(num_nodes):
+        x, y = rng.randrange(20), rng.randrange(20)
+        node_bbox[node] = (x, y, x + rng.randrange(4), y + rng.randrange(4))
+
+    edge_src = np.array([src for src, _ in edges], dtype=np.int64)
+    edge_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    edge_indptr[1:] = np.cumsum(np.bincount(edge_src, minlength=num_nodes))
+
+    columns = {
+        'node_bbox': node_bbox,
+        'global_nodes': np.zeros(0, dtype=np.int64),
+        'edge_indptr': edge_indptr,
+        'edge_dst': np.array([dst for _, dst in edges], dtype=np.int64),
+        'edge_tile': np.zeros(len(edges), dtype=np.int32),
+        'edge_pip': np.zeros(len(edges), dtype=np.int32),
+        'pip_names': np.zeros(0, dtype=np.bytes_),
+    }
+
+    # Without a relation between edges and locations, only a span covering
+    # the whole grid keeps the heuristic admissible.
+    return RoutingGraph(None, columns, {'local_span': 46}), edges
+
+
+def located_graph(rng, num_nodes, num_global, num_edges):
+    """ RoutingGraph where edges only connect nodes sharing a tile.
+
+    The last num_global nodes span most of the grid.
+
+    """
+    node_bbox = np.zeros((num_nodes, 4), dtype=np.int32)
+    for node in range(num_nodes):
+        if node < num_nodes - num_global:
+            x, y = rng.randrange(30), rng.randrange(30)
+            node_bbox[node] = (
+                x, y, x + rng.randrange(4), y + rng.randrange(4))
+        elif rng.randrange(2):
+            x = rng.randrange(30)
+            node_bbox[node] = (x, 0, x + 1, 32)
+        else:
+            y = rng.randrange(30)
+            node_bbox[node] = (0, y, 32, y + 1)
+
+    def overlap(a, b):
+        return node_bbox[a][0] <= node_bbox[b][2] and \
+            node_bbox[b][0] <= node_bbox[a][2] and \
+            node_bbox[a][1] <= node_bbox[b][3] and \
+            node_bbox[b][1] <= node_bbox[a][3]
+
+    edges = set()
+    while len(edges) < num_edges:
+        src, dst = rng.randrange(num_nodes), rng.randrange(num_nodes)
+        if src != dst and overlap(src, dst):
+            edges.add((src, dst))
+    edges = sorted(edges)
+
+    edge_src = np.array([src for src, _ in edges], dtype=np.int64)
+    edge_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    edge_indptr[1:] = np.cumsum(np.bincount(edge_src, minlength=num_nodes))
+    edge_dst = np.array([dst for _, dst in edges], dtype=np.int64)
+    local_span, global_nodes = routing_bounds(node_bbox, edge_indptr, edge_dst)
+
+    columns = {
+        'node_bbox': node_bbox,
+        'global_nodes': global_nodes,
+        'edge_indptr': edge_indptr,
+        'edge_dst': edge_dst,
+        'edge_tile': np.zeros(len(edges), dtype=np.int32),
+        'edge_pip': np.zeros(len(edges), dtype=np.int32),
+        'pip_names': np.zeros(0, dtype=np.bytes_),
+    }
+    return RoutingGraph(None, columns, {'local_span': local_span}), edges
+
+
+def bfs_distance(edges, src, dst, blocked):
+    adjacency = collections.defaultdict(list)
+    for a, b in edges:
+        adjacency[a].append(b)
+
+    distance = {src: 0}
+    queue = collections.deque([src])
+    while queue:
+        node = queue.popleft()
+        for next_node in adjacency[node]:
+            if next_node not in distance and next_node not in blocked:
+                distance[next_node] = distance[node] + 1
+                queue.append(next_node)
+
+    return distance.get(dst)
+
+
+class TestRouter(TestCase):
+    def check_minimal_paths(self, rng, graph, edges, num_nodes):
+        edge_src = np.repeat(np.arange(num_nodes), np.diff(graph.edge_indptr))
+
+        for _ in range(100):
+            src, dst = rng.randrange(num_nodes), rng.randrange(num_nodes)
+            blocked = set(rng.randrange(num_nodes) for _ in range(20)) - set(
+                (src, dst))
+            distance = bfs_distance(edges, src, dst, blocked)
+
+            if distance is None:
+                with self.assertRaises(RoutingError):
+                    graph.find_path(src, dst, blocked)
+                continue
+
+            path = graph.find_path(src, dst, blocked)
+            self.assertEqual(len(path), distance)
+
+            node = src
+            for edge in path:
+                self.assertEqual(edge_src[edge], node)
+                node = int(graph.edge_dst[edge])
+                self.assertNotIn(node, blocked)
+            self.assertEqual(node, dst)
+
+    def test_find_path_is_minimal(self):
+        rng = random.Random(0)
+        graph, edges = random_graph(rng, 300, 900)
+        self.check_minimal_paths(rng, graph, edges, 300)
+
+    def test_find_path_global_nodes(self):
+        rng = random.Random(0)
+        graph, edges = located_graph(rng, 400, 8, 3000)
+        self.assertEqual(graph.local_span, 6)
+        self.assertEqual(len(graph.global_nodes), 8)
+        self.check_minimal_paths(rng, graph, edges, 400)
+
+    def test_long_route(self):
+        num_nodes = 5000
+        edges = [(node, node + 1) for node in range(num_nodes - 1)]
+        columns = {
+            'node_bbox':
+            np.array(
+                [(0, node, 0, node) for node in range(num_nodes)],
+                dtype=np.int32),
+            'global_nodes':
+            np.zeros(0, dtype=np.int64),
+            'edge_indptr':
+            np.array(list(range(num_nodes)) + [num_nodes - 1], dtype=np.int64),
+            'edge_dst':
+            np.array([dst for _, dst in edges], dtype=np.int64),
+            'edge_tile':
+            np.zeros(len(edges), dtype=np.int32),
+            'edge_pip':
+            np.zeros(len(edges), dtype=np.int32),
+            'pip_names':
+            np.zeros(0, dtype=np.bytes_),
+        }
+        graph = RoutingGraph(None, columns, {'local_span': 1})
+        self.assertEqual(
+            graph.find_path(0, num_nodes - 1), list(range(num_nodes - 1)))
+
+    def test_route_database(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'routing.cache')
+            db = Database(db_root)
+            graph = db.routing_graph(cache_file)
+            self.assertTrue(os.path.exists(cache_file))
+            self.assertEqual(graph.num_edges(), 1)
+
+            src = ('INT_L_X2Y0', 'LOGIC_OUTS_L0')
+            dst = ('CLBLL_L_X2Y0', 'CLBLL_L_A')
+            self.assertEqual(
+                graph.route([(src, dst)]),
+                [['INT_L_X2Y0.IMUX_L0.LOGIC_OUTS_L0']])
+
+            # The destination is in use by the first route.
+            with self.assertRaises(RoutingError):
+                graph.route([(src, dst), (src, dst)])
+
+            # No PIP drives LOGIC_OUTS_L0.
+            with self.assertRaises(RoutingError):
+                graph.route([(dst, src)])
+
+    def test_default_cache_file(self):
+        src = ('INT_L_X2Y0', 'LOGIC_OUTS_L0')
+        dst = ('CLBLL_L_X2Y0', 'CLBLL_L_A')
+        with setup_database() as db_root, mock.patch.dict(os.environ):
+            os.environ.pop('XRAY_DATABASE_CACHE', None)
+            files = sorted(os.listdir(db_root))
+
+            # Without a database cache, nothing is written.
+            graph = Database(db_root).routing_graph()
+            self.assertEqual(len(graph.route([(src, dst)])[0]), 1)
+            self.assertEqual(sorted(os.listdir(db_root)), files)
+
+            # Otherwise the graphs are stored next to it.
+            cache_file = os.path.join(db_root, 'db.cache')
+            graph = Database(db_root, cache_file=cache_file).routing_graph()
+            self.assertEqual(len(graph.route([(src, dst)])[0]), 1)
+            self.assertTrue(os.path.exists(cache_file + '.nodes'))
+            self.assertTrue(os.path.exists(cache_file + '.routing'))
+
+
+if __name__ == '__main__':
+    main()
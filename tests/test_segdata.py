@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import os.path
+import struct
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray import segdata
+from prjxray.segdata import Segment
+from prjxray.segmaker import Segmaker
+
+from sample_database import BITS, setup_database
+
+SEGMENTS = [
+    Segment(
+        name='00020880_048',
+        bits={'30_00', '31_63'},
+        tags={
+            'CLB.SLICE_X0.AFF': 1,
+            'CLB.SLICE_X1.A5LUT': 0
+        }),
+    Segment(name='00020880_050', bits=set(), tags={'CLB.SLICE_X0.AFF': 0}),
+    Segment(
+        name='00020880_048',
+        bits={'%02d_%02d' % (frame, 5)
+              for frame in range(70)},
+        tags={}),
+]
+
+
+class TestSegdata(TestCase):
+    def test_round_trip(self):
+        f = io.BytesIO()
+        segdata.write_segdata_bin(f, SEGMENTS)
+        f.seek(0)
+        self.assertEqual(list(segdata.read_segdata_bin(f)), SEGMENTS)
+
+        f = io.StringIO()
+        segdata.write_segdata_txt(f, SEGMENTS)
+        f.seek(0)
+        self.assertEqual(list(segdata.read_segdata_txt(f)), SEGMENTS)
+
+    def test_read_segdata(self):
+        with TemporaryDirectory() as tmp_dir:
+            bin_file = os.path.join(tmp_dir, 'segdata_clbll_l.bin')
+            with open(bin_file, 'wb') as f:
+                segdata.write_segdata_bin(f, SEGMENTS)
+
+            txt_file = os.path.join(tmp_dir, 'segdata_clbll_l.txt')
+            with open(txt_file, 'w') as f:
+                segdata.write_segdata_txt(f, SEGMENTS)
+
+            self.assertTrue(segdata.is_segdata_bin(bin_file))
+            self.assertFalse(segdata.is_segdata_bin(txt_file))
+            self.assertEqual(segdata.read_segdata(bin_file), SEGMENTS)
+            self.assertEqual(segdata.read_segdata(txt_file), SEGMENTS)
+
+    def test_invalid(self):
+        f = io.BytesIO()
+        segdata.write_segdata_bin(f, SEGMENTS)
+        data = f.getvalue()
+
+        with self.assertRaisesRegex(ValueError, 'Truncated'):
+            list(segdata.read_segdata_bin(io.BytesIO(data[:-1])))
+
+        data = data[:8] + struct.pack('<I', 2) + data[12:]
+        with self.assertRaisesRegex(ValueError, 'version'):
+            list(segdata.read_segdata_bin(io.BytesIO(data)))
+
+    def test_segmaker(self):
+        with setup_database() as db_root:
+            bits_file = os.path.join(db_root, 'design.bits')
+            with open(bits_file, 'w') as f:
+                f.write(BITS)
+
+            segmk = Segmaker(bits_file, db_root=db_root)
+            segmk.add_site_tag('SLICE_X0Y0', 'SLICEL.AFF', 1)
+            segmk.add_tile_tag('INT_L_X2Y0', 'IMUX_L0.LOGIC_OUTS_L0', 1)
+            segmk.compile()
+
+            olddir = os.getcwd()
+            os.chdir(db_root)
+            try:
+                segmk.write(binary=False)
+                segmk.write(binary=True)
+            finally:
+                os.chdir(olddir)
+
+            for tile_type in ('clbll_l', 'int_l'):
+                fname = os.path.join(db_root, 'segdata_{}'.format(tile_type))
+                self.assertTrue(segdata.is_segdata_bin(fname + '.bin'))
+                self.assertEqual(
+                    segdata.read_segdata(fname + '.bin'),
+                    segdata.read_segdata(fname + '.txt'))
+
+
+if __name__ == '__main__':
+    main()
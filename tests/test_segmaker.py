@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import os
+import os.path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main, mock
+
+from prjxray.compact_grid import CompactGrid
+from prjxray.segmaker import Segmaker
+
+from sample_database import BITS, setup_database
+
+EXPECTED_CLBLL_L = (
+    'seg 00400100_000\n'
+    'bit 01_05\n'
+    'bit 01_63\n'
+    'bit 03_00\n'
+    'tag CLB.SLICE_X0.AFF 1\n'
+    'tag CLB.SLICE_X1.A5LUT 0\n'
+    'tag CLB.TILE_TAG 1\n')
+
+EXPECTED_INT_L = (
+    'seg 00400000_000\n'
+    'bit 02_34\n'
+    'tag INT.IMUX_L0.LOGIC_OUTS_L0 1\n')
+
+
+class TestSegmaker(TestCase):
+    def compile_and_write(self, db_root, **kwargs):
+        bits_file = os.path.join(db_root, 'design.bits')
+        with open(bits_file, 'w') as f:
+            f.write(BITS)
+
+        segmk = Segmaker(bits_file, db_root=db_root)
+        segmk.add_site_tag('SLICE_X0Y0', 'SLICEL.AFF', 1)
+        segmk.add_site_tag('SLICE_X1Y0', 'A5LUT', 0)
+        segmk.add_tile_tag('CLBLL_L_X2Y0', 'TILE_TAG', 1)
+        segmk.add_tile_tag('INT_L_X2Y0', 'IMUX_L0.LOGIC_OUTS_L0', 1)
+        segmk.compile(**kwargs)
+
+        olddir = os.getcwd()
+        os.chdir(db_root)
+        try:
+            segmk.write()
+        finally:
+            os.chdir(olddir)
+
+        output = {}
+        for tile_type in ('clbll_l', 'int_l'):
+            with open(os.path.join(db_root,
+                                   'segdata_{}.txt'.format(tile_type))) as f:
+                output[tile_type] = f.read()
+
+        return output
+
+    def test_compile(self):
+        with setup_database() as db_root:
+            output = self.compile_and_write(db_root)
+            self.assertEqual(output['clbll_l'], EXPECTED_CLBLL_L)
+            self.assertEqual(output['int_l'], EXPECTED_INT_L)
+
+    def test_compile_cached_grid(self):
+        with setup_database() as db_root, \
+                TemporaryDirectory() as cache_dir:
+            with mock.patch.dict(os.environ,
+                                 {'XRAY_DATABASE_CACHE': cache_dir}):
+                segmk = Segmaker(os.devnull, db_root=db_root)
+                self.assertIsInstance(segmk.grid, CompactGrid)
+                self.assertEqual(segmk.sites['SLICE_X1Y0'], 'CLBLL_L_X2Y0')
+
+                output = self.compile_and_write(db_root)
+
+            self.assertEqual(output['clbll_l'], EXPECTED_CLBLL_L)
+            self.assertEqual(output['int_l'], EXPECTED_INT_L)
+
+    def test_skip_untagged(self):
+        with setup_database() as db_root:
+            self.assertEqual(
+                self.compile_and_write(db_root, skip_untagged=True), {
+                    'clbll_l': EXPECTED_CLBLL_L,
+                    'int_l': EXPECTED_INT_L,
+                })
+
+    def test_bitfilter(self):
+        with setup_database() as db_root:
+            output = self.compile_and_write(
+                db_root, bitfilter=lambda frame, bit: frame != 1)
+            self.assertEqual(
+                output['clbll_l'],
+                EXPECTED_CLBLL_L.replace('bit 01_05\nbit 01_63\n', ''))
+
+
+if __name__ == '__main__':
+    main()
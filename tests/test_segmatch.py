@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import os.path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray import segdata
+from prjxray.segdata import Segment
+from prjxray import segmatch
+
+SEGMENTS = [
+    Segment(name='a', bits={'00_01', '00_02', '00_03'}, tags={
+        'A': 1,
+        'B': 0
+    }),
+    Segment(name='b', bits={'00_01', '00_03'}, tags={
+        'A': 1,
+        'B': 1,
+        'C': 1
+    }),
+    Segment(name='c', bits={'00_02', '00_03'}, tags={
+        'A': 0,
+        'B': 0,
+        'C': 1
+    }),
+]
+
+EXPECTED = [
+    'A 00_01',
+    'B <0 candidates>',
+    'C <const1> 00_03',
+]
+
+
+class TestSegmatch(TestCase):
+    def test_solve(self):
+        s = segmatch.Segmatch()
+        s.add_segments(SEGMENTS)
+        solutions = s.solve()
+
+        self.assertEqual(
+            solutions[0],
+            segmatch.TagSolution(
+                tag='A', count1=2, count0=1, candidates=['00_01']))
+        self.assertEqual(
+            sorted(map(segmatch.format_solution, solutions)), EXPECTED)
+        self.assertEqual(
+            segmatch.format_solution(solutions[2], candidate_threshold=0),
+            'C <const1> <1 candidates>')
+
+    def test_invert_tags(self):
+        s = segmatch.Segmatch(invert_tags=True)
+        s.add_segments(SEGMENTS)
+        lines = sorted(map(segmatch.format_solution, s.solve()))
+
+        self.assertIn('A__INV <0 candidates>', lines)
+        self.assertIn('C__INV <const0>', lines)
+
+    def test_solve_groups(self):
+        with TemporaryDirectory() as tmp_dir:
+            groups = {}
+            for segtype in ('clbll_l', 'int_l'):
+                fname = os.path.join(tmp_dir, 'segdata_%s.bin' % segtype)
+                with open(fname, 'wb') as f:
+                    segdata.write_segdata_bin(f, SEGMENTS)
+                groups[segtype] = [fname]
+
+            for processes in (1, 2):
+                results = segmatch.solve_groups(
+                    groups, tmp_dir, mask=True, processes=processes)
+                self.assertEqual(
+                    sorted(results), [
+                        (
+                            os.path.join(tmp_dir, 'segbits_clbll_l.rdb'), 3, 3,
+                            None),
+                        (
+                            os.path.join(tmp_dir, 'segbits_int_l.rdb'), 3, 3,
+                            None),
+                    ])
+
+                for segtype in groups:
+                    with open(os.path.join(tmp_dir,
+                                           'segbits_%s.rdb' % segtype)) as f:
+                        self.assertEqual(f.read().splitlines(), EXPECTED)
+                    with open(os.path.join(tmp_dir,
+                                           'mask_%s.db' % segtype)) as f:
+                        self.assertEqual(
+                            f.read().splitlines(),
+                            ['bit 00_01', 'bit 00_02', 'bit 00_03'])
+
+    def test_incremental(self):
+        with TemporaryDirectory() as tmp_dir:
+            fnames = []
+            for idx, segment in enumerate(SEGMENTS):
+                fname = os.path.join(tmp_dir, 'segdata_%d.txt' % idx)
+                with open(fname, 'w') as f:
+                    segdata.write_segdata_txt(f, [segment])
+                fnames.append(fname)
+
+            state_file = os.path.join(tmp_dir, 'segbits.rdb.state')
+            for invert_tags in (False, True):
+                expected = segmatch.Segmatch(invert_tags=invert_tags)
+                expected.add_segments(SEGMENTS)
+                expected = sorted(expected.solve())
+
+                # Adds one new file every call, with new bits and tags.
+                for count in range(1, len(fnames) + 1):
+                    state, solutions, new_files, _ = segmatch.solve_incremental(
+                        state_file, fnames[:count], invert_tags=invert_tags)
+                    self.assertEqual(
+                        new_files,
+                        fnames[count - 1:count] if count > 1 else fnames[:1])
+
+                self.assertEqual(sorted(solutions), expected)
+                self.assertEqual(state.num_segments(), 3)
+                self.assertEqual(len(state.history), 3)
+
+            # A changed file causes a rebuild from all files.
+            with open(fnames[0], 'a') as f:
+                f.write('\n')
+            _, solutions, new_files, newly_solved = segmatch.solve_incremental(
+                state_file, fnames, invert_tags=True)
+            self.assertEqual(new_files, fnames)
+            self.assertEqual(sorted(solutions), expected)
+            self.assertIn('A', newly_solved)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os.path
+import random
+from unittest import TestCase, main
+
+from prjxray.db import Database
+from prjxray.grid_types import BlockType, BitAlias, Bits, BitsInfo
+from prjxray.segment_map import SegmentMap
+
+from sample_database import setup_database
+
+
+class RandomGrid(object):
+    """ Minimal grid providing iter_all_frames. """
+
+    def __init__(self, rng, ntiles):
+        self.bits_infos = []
+        for idx in range(ntiles):
+            alias = None
+            if rng.random() < 0.1:
+                alias = BitAlias(
+                    tile_type='ALIAS', start_offset=1, sites={'A': 'B'})
+
+            self.bits_infos.append(
+                BitsInfo(
+                    block_type=rng.choice(list(BlockType)),
+                    tile='TILE_X{}Y0'.format(idx),
+                    bits=Bits(
+                        base_address=rng.choice([0x100, 0x180, 0x200]) +
+                        rng.randint(0, 4),
+                        frames=rng.randint(1, 40),
+                        offset=rng.randint(0, 99),
+                        words=2,
+                        alias=alias,
+                    )))
+
+    def iter_all_frames(self):
+        return iter(self.bits_infos)
+
+
+def sort_key(bits_info):
+    return bits_info.tile, bits_info.block_type.value
+
+
+def reference_lookup(grid, frame):
+    return sorted(
+        (
+            bits_info for bits_info in grid.iter_all_frames()
+            if bits_info.bits.base_address <= frame <
+            bits_info.bits.base_address + bits_info.bits.frames),
+        key=sort_key)
+
+
+class TestSegmentMap(TestCase):
+    def test_matches_reference(self):
+        rng = random.Random(0)
+        grid = RandomGrid(rng, 200)
+        segment_map = SegmentMap(grid)
+
+        frames = list(range(0xf0, 0x260))
+        for frame in frames:
+            self.assertEqual(
+                sorted(
+                    segment_map.segment_info_for_frame(frame), key=sort_key),
+                reference_lookup(grid, frame))
+
+        rng.shuffle(frames)
+        batch = list(segment_map.segment_info_for_frames(frames))
+        self.assertEqual([frame for frame, _ in batch], frames)
+        for frame, bits_infos in batch:
+            self.assertEqual(
+                sorted(bits_infos, key=sort_key), reference_lookup(
+                    grid, frame))
+
+        self.assertEqual(list(segment_map.segment_info_for_frames([])), [])
+
+    def test_empty_grid(self):
+        segment_map = SegmentMap(RandomGrid(random.Random(0), 0))
+        self.assertEqual(list(segment_map.segment_info_for_frame(0x100)), [])
+        self.assertEqual(
+            list(segment_map.segment_info_for_frames([0x100])), [(0x100, [])])
+
+    def test_segment_map_from_cache(self):
+        with setup_database() as db_root:
+            cache_file = os.path.join(db_root, 'db.cache')
+
+            grid = Database(db_root).grid()
+            cached_db = Database(db_root, cache_file=cache_file)
+            segment_map = cached_db.grid().get_segment_map()
+            self.assertFalse(segment_map.indices.flags.writeable)
+
+            for frame in range(0x00400000, 0x00400200):
+                self.assertEqual(
+                    sorted(
+                        segment_map.segment_info_for_frame(frame),
+                        key=sort_key), reference_lookup(grid, frame))
+
+
+if __name__ == '__main__':
+    main()
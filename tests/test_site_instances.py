@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import json
+import os.path
+import random
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray.db import Database
+
+
+def proto_site(prefix, x, y, site_type):
+    return {
+        "name": "{}_X{}Y{}".format(prefix, x, y),
+        "prefix": prefix,
+        "type": site_type,
+        "x_coord": x,
+        "y_coord": y,
+        "site_pins": {},
+    }
+
+
+TILE_TYPES = {
+    "CLBLM_L": [
+        proto_site("SLICE", 0, 0, "SLICEM"),
+        proto_site("SLICE", 1, 0, "SLICEL"),
+    ],
+    "LIOB33": [
+        proto_site("IOB", 0, 0, "IOB33S"),
+        proto_site("IOB", 0, 1, "IOB33M"),
+        proto_site("IDELAY", 0, 0, "IDELAYE2"),
+    ],
+    # Site names of the grid do not use the prefix of the tile type, so
+    # sites are found by their (unique) type.
+    "CLK_BUFG": [
+        proto_site("BUFGCTRL", 0, 0, "BUFGCTRL"),
+    ],
+    "INT_L": [],
+}
+
+
+def random_tilegrid(seed=0):
+    rng = random.Random(seed)
+    tilegrid = {}
+
+    def add_tile(tile_type, sites):
+        idx = len(tilegrid)
+        tilegrid["{}_X{}Y0".format(tile_type, idx)] = {
+            "bits": {},
+            "grid_x": idx,
+            "grid_y": 0,
+            "sites": sites,
+            "type": tile_type,
+        }
+
+    for _ in range(20):
+        x, y = rng.randint(0, 50) * 2, rng.randint(0, 100)
+        add_tile(
+            "CLBLM_L", {
+                "SLICE_X{}Y{}".format(x, y): "SLICEM",
+                "SLICE_X{}Y{}".format(x + 1, y): "SLICEL",
+            })
+
+    for _ in range(20):
+        y, idelay_y = rng.randint(0, 50) * 2, rng.randint(0, 50)
+        add_tile(
+            "LIOB33", {
+                "IOB_X0Y{}".format(y + 1): "IOB33M",
+                "IOB_X0Y{}".format(y): "IOB33S",
+                "IDELAY_X0Y{}".format(idelay_y): "IDELAYE2",
+            })
+
+    for y in range(5):
+        add_tile("CLK_BUFG", {"BUFG_X0Y{}".format(y): "BUFGCTRL"})
+        add_tile("INT_L", {})
+
+    # Tiles that Tile.get_instance_sites rejects.
+    add_tile("CLBLM_L", {"SLICE_X0Y0": "SLICEM"})
+    add_tile("CLBLM_L", {"SLICE_X0Y0": "SLICEL", "SLICE_X1Y0": "SLICEL"})
+    add_tile(
+        "CLBLM_L", {
+            "SLICE_X0Y0": "SLICEM",
+            "SLICE_X1Y0": "SLICEL",
+            "SLICE_X2Y0": "SLICEL",
+        })
+    add_tile("CLK_BUFG", {"BUFG_X0Y0": "BUFGCTRL", "BUFG_X0Y1": "BUFGCTRL"})
+    add_tile("INT_L", {"NOT_A_SITE": "TIEOFF"})
+
+    return tilegrid
+
+
+def write_database(db_root):
+    with open(os.path.join(db_root, 'tilegrid.json'), 'w') as f:
+        json.dump(random_tilegrid(), f)
+
+    for tile_type, sites in TILE_TYPES.items():
+        with open(os.path.join(db_root, 'tile_type_{}.json'.format(tile_type)),
+                  'w') as f:
+            json.dump(
+                {
+                    "tile_type": tile_type,
+                    "wires": {},
+                    "pips": {},
+                    "sites": sites,
+                }, f)
+
+
+def reference_instance_sites(db, grid, tilename):
+    """ Sites from Tile.get_instance_sites, or None if it fails. """
+    gridinfo = grid.gridinfo_at_tilename(tilename)
+    tile = db.get_tile_type(gridinfo.tile_type)
+    try:
+        return list(tile.get_instance_sites(gridinfo))
+    except AssertionError:
+        return None
+
+
+class TestSiteInstances(TestCase):
+    def check_grid(self, db, grid):
+        site_instances = grid.get_site_instances()
+        self.assertIs(site_instances, grid.get_site_instances())
+
+        invalid = 0
+        for tilename in grid.tiles():
+            expected = reference_instance_sites(db, grid, tilename)
+            self.assertEqual(
+                site_instances.is_valid(tilename), expected is not None,
+                tilename)
+
+            if expected is None:
+                invalid += 1
+                with self.assertRaises(AssertionError):
+                    list(grid.get_instance_sites(tilename))
+                continue
+
+            self.assertEqual(list(grid.get_instance_sites(tilename)), expected)
+            for site_index, site in enumerate(expected):
+                self.assertEqual(
+                    site_instances.instance_site(tilename, site_index),
+                    (site.name, site.x, site.y))
+
+        self.assertEqual(invalid, 5)
+
+    def test_matches_tile(self):
+        with TemporaryDirectory() as db_root:
+            write_database(db_root)
+            db = Database(db_root)
+            self.check_grid(db, db.grid())
+
+    def test_compact_grid(self):
+        with TemporaryDirectory() as db_root:
+            write_database(db_root)
+            db = Database(db_root, compact_grid=True)
+            self.check_grid(db, db.grid())
+
+    def test_cache(self):
+        with TemporaryDirectory() as db_root:
+            write_database(db_root)
+            cache_file = os.path.join(db_root, 'db.cache')
+            Database(db_root, cache_file=cache_file)
+
+            db = Database(db_root, cache_file=cache_file)
+            self.assertTrue(db.cache.has_section('site_instances/tile_names'))
+            self.check_grid(db, db.grid())
+
+    def test_unknown_tile(self):
+        with TemporaryDirectory() as db_root:
+            write_database(db_root)
+            site_instances = Database(db_root).grid().get_site_instances()
+            self.assertFalse(site_instances.is_valid('NOT_A_TILE'))
+            with self.assertRaises(KeyError):
+                site_instances.instance_site('NOT_A_TILE', 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import json
+import os.path
+import random
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray.tile import Tile, TileDbs, WireInfo
+
+
+def random_tile_type(num_wires=30, num_pips=200, num_sites=3, seed=0):
+    rng = random.Random(seed)
+    wires = ['WIRE{}'.format(i) for i in range(num_wires)]
+
+    pips = {}
+    for i in range(num_pips):
+        dst, src = rng.choice(wires), rng.choice(wires)
+        pips['TEST.{}->>{}.{}'.format(src, dst, i)] = {
+            "dst_wire": dst,
+            "src_wire": src,
+            "can_invert": "0",
+            "is_directional": "1",
+            "is_pseudo": str(rng.randint(0, 1)),
+        }
+
+    sites = []
+    for i in range(num_sites):
+        site_pins = dict(
+            ('P{}'.format(j), rng.choice(wires)) for j in range(5))
+        sites.append(
+            {
+                "name": "X0Y{}".format(i),
+                "prefix": "SLICE",
+                "type": "SLICEL",
+                "x_coord": 0,
+                "y_coord": i,
+                "site_pins": site_pins,
+            })
+
+    return {
+        "tile_type": "TEST",
+        "wires": dict((wire, None) for wire in wires),
+        "pips": pips,
+        "sites": sites,
+    }
+
+
+def reference_wire_info(tile, target_wire, allow_pseudo):
+    """ Original O(wires x (pips + site pins)) get_wire_info. """
+    pips = list()
+    sites = list()
+
+    for site in tile.sites:
+        for site_pin in site.site_pins:
+            if site_pin.wire == target_wire:
+                sites.append((site.name, site_pin.name))
+
+    for pip in tile.pips:
+        pseudo_filter = (not pip.is_pseudo) or allow_pseudo
+        if (target_wire == pip.net_to
+                or target_wire == pip.net_from) and pseudo_filter:
+            pips.append(pip.name)
+
+    return WireInfo(pips=pips, sites=sites)
+
+
+class TestTile(TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        fname = os.path.join(self.tempdir.name, 'tile_type_TEST.json')
+        with open(fname, 'w') as f:
+            json.dump(random_tile_type(), f)
+
+        self.tile = Tile(
+            'test',
+            TileDbs(
+                segbits=None,
+                block_ram_segbits=None,
+                ppips=None,
+                mask=None,
+                tile_type=fname))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_get_wire_info(self):
+        for wire in self.tile.get_wires():
+            for allow_pseudo in (False, True):
+                self.assertEqual(
+                    self.tile.get_wire_info(wire, allow_pseudo=allow_pseudo),
+                    reference_wire_info(self.tile, wire, allow_pseudo))
+
+    def test_allow_pseudo_after_first_call(self):
+        wire = max(
+            self.tile.get_wires(),
+            key=
+            lambda wire: len(reference_wire_info(self.tile, wire, True).pips))
+
+        pips = set(self.tile.get_wire_info(wire).pips)
+        pseudo_pips = set(
+            self.tile.get_wire_info(wire, allow_pseudo=True).pips)
+        self.assertLess(pips, pseudo_pips)
+        for name in pseudo_pips - pips:
+            self.assertTrue(self.tile.get_pip_by_name(name).is_pseudo)
+
+    def test_get_wire_infos(self):
+        wires = sorted(self.tile.get_wires())[:5]
+        infos = self.tile.get_wire_infos(wires, allow_pseudo=True)
+        self.assertEqual(sorted(infos), wires)
+        for wire in wires:
+            self.assertEqual(
+                infos[wire], reference_wire_info(self.tile, wire, True))
+
+    def test_uphill_downhill_pips(self):
+        wires = set(sorted(self.tile.get_wires())[:5])
+        for allow_pseudo in (False, True):
+            pips = [
+                pip for pip in self.tile.get_pips()
+                if allow_pseudo or not pip.is_pseudo
+            ]
+            self.assertEqual(
+                self.tile.get_uphill_pips(wires, allow_pseudo=allow_pseudo),
+                [pip for pip in pips if pip.net_to in wires])
+            self.assertEqual(
+                self.tile.get_downhill_pips(wires, allow_pseudo=allow_pseudo),
+                [pip for pip in pips if pip.net_from in wires])
+
+        self.assertEqual(self.tile.get_uphill_pips([]), [])
+        self.assertEqual(self.tile.get_downhill_pips(['NOT_A_WIRE']), [])
+        with self.assertRaises(KeyError):
+            self.tile.get_wire_info('NOT_A_WIRE')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import json
+import os.path
+import random
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray.db import Database
+from prjxray import tile_overlap
+
+
+def random_segbits(rng, num_tags, frames, words):
+    lines = []
+    for tag in range(num_tags):
+        bits = set(
+            (rng.randrange(frames), rng.randrange(32 * words))
+            for _ in range(rng.randint(1, 3)))
+        lines.append(
+            'TYPE.TAG{} {}'.format(
+                tag, ' '.join(
+                    '{}{:02d}_{:02d}'.format(
+                        rng.choice(('', '!')), frame, bit)
+                    for frame, bit in sorted(bits))))
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_database(db_root, overlap, seed=0):
+    """ Write a database of CLBs stacked in columns, two words per tile.
+
+    With overlap, one tile is moved on top of the tile below it.
+
+    """
+    rng = random.Random(seed)
+    tilegrid = {}
+    for column in range(4):
+        for row in range(2):
+            for y in range(10):
+                # Two regions per column, frame address bit 17 is the row.
+                tilegrid['CLB_X{}Y{}'.format(column, row * 10 + y)] = {
+                    "bits": {
+                        "CLB_IO_CLK": {
+                            "baseaddr": hex((row << 17) | (column << 7)),
+                            "frames": 36,
+                            "offset": 2 * y,
+                            "words": 2,
+                        },
+                    },
+                    "grid_x": column,
+                    "grid_y": row * 10 + y,
+                    "sites": {},
+                    "type": "CLB",
+                }
+
+    tilegrid['INT_X0Y0'] = {
+        "bits": {},
+        "grid_x": 10,
+        "grid_y": 0,
+        "sites": {},
+        "type": "INT",
+    }
+
+    if overlap:
+        tilegrid['CLB_X2Y13']['bits']['CLB_IO_CLK']['offset'] = 2 * 2 + 1
+
+    with open(os.path.join(db_root, 'tilegrid.json'), 'w') as f:
+        json.dump(tilegrid, f)
+
+    for tile_type in ('CLB', 'INT'):
+        with open(os.path.join(db_root, 'tile_type_{}.json'.format(tile_type)),
+                  'w') as f:
+            json.dump(
+                {
+                    "tile_type": tile_type,
+                    "wires": {},
+                    "pips": {},
+                    "sites": [],
+                }, f)
+
+    with open(os.path.join(db_root, 'segbits_clb.db'), 'w') as f:
+        f.write(random_segbits(rng, 40, 36, 2))
+
+
+def reference_tile_overlap(db):
+    """ Original dict based checkdb.check_tile_overlap. """
+    mall = dict()
+    grid = db.grid()
+    tiles_checked = 0
+
+    for tile_name in grid.tiles():
+        tile_info = grid.gridinfo_at_tilename(tile_name)
+        segbits = db.get_tile_segbits(tile_info.tile_type).segbits
+
+        mtile = dict()
+        for block_type in segbits:
+            block = tile_info.bits[block_type]
+            for tag in segbits[block_type]:
+                for bit in segbits[block_type][tag]:
+                    mtile.setdefault(
+                        (
+                            bit.word_column + block.base_address,
+                            bit.word_bit + 32 * block.offset),
+                        "%s.%s" % (tile_name, tag))
+
+        if len(mtile) == 0:
+            continue
+
+        collisions = [bits for bits in mtile.keys() if bits in mall]
+        if collisions:
+            return [
+                tile_overlap.Collision(
+                    address=addr,
+                    bitaddr=bitaddr,
+                    had=mall[(addr, bitaddr)],
+                    got=mtile[(addr, bitaddr)])
+                for addr, bitaddr in sorted(collisions)
+            ]
+
+        mall.update(mtile)
+        tiles_checked += 1
+
+    return tile_overlap.TileOverlap(
+        tiles_checked=tiles_checked, bits=len(mall), collisions=[])
+
+
+class TestTileOverlap(TestCase):
+    def check(self, overlap, processes):
+        with TemporaryDirectory() as db_root:
+            write_database(db_root, overlap)
+            db = Database(db_root)
+            return (
+                tile_overlap.check_tile_overlap(db, processes=processes),
+                reference_tile_overlap(db))
+
+    def test_no_overlap(self):
+        for processes in (1, 2):
+            result, expected = self.check(False, processes)
+            self.assertEqual(result, expected)
+            self.assertEqual(result.tiles_checked, 80)
+            self.assertGreater(result.bits, 0)
+
+    def test_overlap(self):
+        for processes in (1, 2):
+            result, expected = self.check(True, processes)
+            self.assertTrue(result.collisions)
+            self.assertEqual(result.collisions, expected)
+            for collision in result.collisions:
+                self.assertTrue(collision.had.startswith('CLB_X2Y1'))
+                self.assertTrue(collision.got.startswith('CLB_X2Y13.'))
+
+    def test_frame_region(self):
+        self.assertEqual(
+            tile_overlap.frame_region(0x00400100),
+            tile_overlap.frame_region(0x0041ff00))
+        self.assertNotEqual(
+            tile_overlap.frame_region(0x00400100),
+            tile_overlap.frame_region(0x00420100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import os.path
+import random
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from prjxray import bitstream
+from prjxray.grid_types import BlockType, Bits
+from prjxray.tile import TileDbs
+from prjxray.tile_segbits import TileSegbits
+
+
+def reference_match_bitdata(
+        tile_segbits, block_type, bits, bitdata, match_filter=None):
+    """ Exhaustive per feature scan of every segbit. """
+    for feature, segbit in tile_segbits.segbits[block_type].items():
+        if not tile_segbits.match_segbit(block_type, bits, bitdata, segbit,
+                                         match_filter):
+            continue
+
+        ones = []
+        for query_bit in segbit:
+            if query_bit.isset:
+                ones.append(
+                    (
+                        bits.base_address + query_bit.word_column,
+                        bits.offset * bitstream.WORD_SIZE_BITS +
+                        query_bit.word_bit))
+
+        yield tuple(ones), feature
+
+
+class TestTileSegbits(TestCase):
+    def test_match_bitdata_index(self):
+        rng = random.Random(1)
+
+        lines = []
+        for idx in range(300):
+            bits = set()
+            for _ in range(rng.randint(1, 4)):
+                bits.add(
+                    '{}{:02d}_{:02d}'.format(
+                        rng.choice(['', '', '!']), rng.randint(0, 5),
+                        rng.randint(0, 63)))
+            lines.append('TILE.FEATURE{} {}'.format(idx, ' '.join(bits)))
+        lines.append('TILE.CLEAR_ONLY !00_00 !01_01')
+
+        with TemporaryDirectory() as d:
+            segbits_fn = os.path.join(d, 'segbits_tile.db')
+            with open(segbits_fn, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            tile_segbits = TileSegbits(
+                TileDbs(
+                    segbits=segbits_fn,
+                    block_ram_segbits=None,
+                    ppips=None,
+                    mask=None,
+                    tile_type=None))
+
+        bits = Bits(
+            base_address=0x100, frames=6, offset=2, words=2, alias=None)
+
+        def match_filter(block_type, query_bit):
+            return query_bit.word_column != 3
+
+        for _ in range(20):
+            bitdata = {}
+            for _ in range(rng.randint(0, 40)):
+                frame = bits.base_address + rng.randint(0, 6)
+                wordidx = rng.randint(0, 6)
+                bitidx = rng.randint(0, 31)
+                bitdata.setdefault(frame, (set(), set()))
+                bitdata[frame][0].add(wordidx)
+                bitdata[frame][1].add(
+                    wordidx * bitstream.WORD_SIZE_BITS + bitidx)
+            bitdata = bitstream.BitData.from_bitdata(bitdata)
+
+            for f in (None, match_filter):
+                self.assertEqual(
+                    list(
+                        tile_segbits.match_bitdata(
+                            BlockType.CLB_IO_CLK, bits, bitdata, f)),
+                    list(
+                        reference_match_bitdata(
+                            tile_segbits, BlockType.CLB_IO_CLK, bits, bitdata,
+                            f)))
+
+    def test_feature_bits(self):
+        with TemporaryDirectory() as d:
+            segbits_fn = os.path.join(d, 'segbits_tile.db')
+            with open(segbits_fn, 'w') as f:
+                f.write('TILE.A !01_02 03_68\n')
+                f.write('TILE.B[0] 00_00\n')
+                f.write('TILE.B[1] 00_01\n')
+
+            tile_segbits = TileSegbits(
+                TileDbs(
+                    segbits=segbits_fn,
+                    block_ram_segbits=None,
+                    ppips=None,
+                    mask=None,
+                    tile_type=None))
+
+        bits_map = {
+            BlockType.CLB_IO_CLK:
+            Bits(base_address=0x100, frames=6, offset=2, words=4, alias=None)
+        }
+
+        for feature, address in (('TILE.A', 0), ('TILE.B', 1)):
+            bits, feature_bits = tile_segbits.feature_to_feature_bits(
+                bits_map, feature, address)
+            compiled = [
+                (
+                    bits.base_address + int(word_column),
+                    (bits.offset + int(word_index)) * bitstream.WORD_SIZE_BITS
+                    + int(bit_index), bool(isset))
+                for word_column, word_index, bit_index, isset in zip(
+                    feature_bits.word_columns, feature_bits.word_indices,
+                    feature_bits.bit_indices, feature_bits.isset)
+            ]
+
+            self.assertEqual(
+                compiled, [
+                    tuple(bit) for _, bit in tile_segbits.feature_to_bits(
+                        bits_map, feature, address)
+                ])
+
+        with self.assertRaises(KeyError):
+            tile_segbits.feature_to_feature_bits(bits_map, 'TILE.C')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 #include <assert.h>
 #include <stdint.h>
 #include <stdio.h>
+#include <string.h>
 #include <unistd.h>
 #include <algorithm>
 #include <fstream>
@@ -136,6 +137,59 @@ static inline bool_vec& segdata_tags0(segdata_t& sd) {
 	return std::get<2>(sd);
 }
 
+// Returns the segment named token in filename, renaming it if a segment of
+// that name exists already.
+segdata_t& new_segment(std::string filename, std::string token) {
+	token = filename + ":" + token;
+	while (segdata.count(token)) {
+		int idx = 1;
+		if (segnamecnt.count(token))
+			idx = segnamecnt.at(token);
+		segnamecnt[token] = idx + 1;
+		char buffer[64];
+		snprintf(buffer, 64, "-%d", idx);
+		token += buffer;
+	}
+	return segdata[token];
+}
+
+int get_bit_id(const string& token) {
+	if (bit_ids.count(token) == 0) {
+		bit_ids[token] = num_bits++;
+		bit_ids_r.push_back(token);
+	}
+	return bit_ids.at(token);
+}
+
+int get_tag_id(const string& token) {
+	if (tag_ids.count(token) == 0) {
+		tag_ids[token] = num_tags++;
+		tag_ids_r.push_back(token);
+	}
+	return tag_ids.at(token);
+}
+
+// Records tag_idx with value in segment sd, and the inverted tag if
+// requested.
+void add_tag(segdata_t& sd, int tag_idx, bool value) {
+	auto& tags = value ? segdata_tags1(sd) : segdata_tags0(sd);
+	tags.set(tag_idx);
+
+	if (FLAGS_i) {
+		auto& inv_tags = value ? segdata_tags0(sd) : segdata_tags1(sd);
+		int inv_tag_idx = get_tag_id(tag_ids_r.at(tag_idx) + "__INV");
+		inv_tags.set(inv_tag_idx);
+	}
+}
+
+void resize_segdata() {
+	for (auto& segdat : segdata) {
+		segdata_bits(segdat.second).resize(num_bits);
+		segdata_tags1(segdat.second).resize(num_tags);
+		segdata_tags0(segdat.second).resize(num_tags);
+	}
+}
+
 void read_input(std::istream& f, std::string filename) {
 	string token;
 	segdata_t* segptr = nullptr;
@@ -143,17 +197,7 @@ void read_input(std::istream& f, std::string filename) {
 	while (f >> token) {
 		if (token == "seg") {
 			f >> token;
-			token = filename + ":" + token;
-			while (segdata.count(token)) {
-				int idx = 1;
-				if (segnamecnt.count(token))
-					idx = segnamecnt.at(token);
-				segnamecnt[token] = idx + 1;
-				char buffer[64];
-				snprintf(buffer, 64, "-%d", idx);
-				token += buffer;
-			}
-			segptr = &segdata[token];
+			segptr = &new_segment(filename, token);
 			continue;
 		}
 
@@ -161,15 +205,8 @@ void read_input(std::istream& f, std::string filename) {
 			assert(segptr != nullptr);
 
 			f >> token;
-			if (bit_ids.count(token) == 0) {
-				bit_ids[token] = num_bits++;
-				bit_ids_r.push_back(token);
-			}
-
-			int bit_idx = bit_ids.at(token);
-			auto& bits = segdata_bits(*segptr);
-
-			bits.set(bit_idx);
+			int bit_idx = get_bit_id(token);
+			segdata_bits(*segptr).set(bit_idx);
 			continue;
 		}
 
@@ -177,37 +214,12 @@ void read_input(std::istream& f, std::string filename) {
 			assert(segptr != nullptr);
 
 			f >> token;
-			if (tag_ids.count(token) == 0) {
-				tag_ids[token] = num_tags++;
-				tag_ids_r.push_back(token);
-			}
-
-			int tag_idx = tag_ids.at(token);
+			int tag_idx = get_tag_id(token);
 
 			f >> token;
 			assert(token == "0" || token == "1");
 
-			auto& tags = token == "1" ? segdata_tags1(*segptr)
-			                          : segdata_tags0(*segptr);
-
-			tags.set(tag_idx);
-
-			if (FLAGS_i) {
-				auto& inv_tags = token == "1"
-				                     ? segdata_tags0(*segptr)
-				                     : segdata_tags1(*segptr);
-
-				token = tag_ids_r.at(tag_idx) + "__INV";
-
-				if (tag_ids.count(token) == 0) {
-					tag_ids[token] = num_tags++;
-					tag_ids_r.push_back(token);
-				}
-
-				int inv_tag_idx = tag_ids.at(token);
-				inv_tags.set(inv_tag_idx);
-			}
-
+			add_tag(*segptr, tag_idx, token == "1");
 			continue;
 		}
 
@@ -218,11 +230,97 @@ void read_input(std::istream& f, std::string filename) {
 	// printf("Number of bits: %d\n", num_bits);
 	// printf("Number of tags: %d\n", num_tags);
 
-	for (auto& segdat : segdata) {
-		segdata_bits(segdat.second).resize(num_bits);
-		segdata_tags1(segdat.second).resize(num_tags);
-		segdata_tags0(segdat.second).resize(num_tags);
+	resize_segdata();
+}
+
+// Binary segdata format, see prjxray/segdata.py.
+const char segdata_magic[] = "PRJXSEGD";
+const int segdata_magic_len = 8;
+const uint32_t segdata_version = 1;
+
+bool is_binary_input(std::istream& f) {
+	char magic[segdata_magic_len];
+	f.read(magic, segdata_magic_len);
+	bool is_binary = f.gcount() == segdata_magic_len &&
+	                 memcmp(magic, segdata_magic, segdata_magic_len) == 0;
+	f.clear();
+	f.seekg(0);
+	return is_binary;
+}
+
+uint64_t read_le(std::istream& f, int size) {
+	unsigned char buffer[8];
+	f.read(reinterpret_cast<char*>(buffer), size);
+	if (f.gcount() != size) {
+		printf("ERROR: Truncated segdata file!\n");
+		exit(1);
 	}
+
+	uint64_t value = 0;
+	for (int i = size - 1; i >= 0; i--)
+		value = (value << 8) | buffer[i];
+	return value;
+}
+
+string read_name(std::istream& f) {
+	int len = read_le(f, 2);
+	string name(len, '\0');
+	f.read(&name[0], len);
+	if (f.gcount() != len) {
+		printf("ERROR: Truncated segdata file!\n");
+		exit(1);
+	}
+	return name;
+}
+
+// Calls fn(idx) for every index set in a bitset of n entries.
+template <typename Fn>
+void read_bitset(std::istream& f, int n, Fn fn) {
+	for (int word_idx = 0; word_idx < (n + 63) / 64; word_idx++) {
+		uint64_t word = read_le(f, 8);
+		for (int bit = 0; word; bit++, word >>= 1)
+			if (word & 1)
+				fn(word_idx * 64 + bit);
+	}
+}
+
+void read_binary_input(std::istream& f, std::string filename) {
+	char magic[segdata_magic_len];
+	f.read(magic, segdata_magic_len);
+	assert(memcmp(magic, segdata_magic, segdata_magic_len) == 0);
+
+	uint32_t version = read_le(f, 4);
+	if (version != segdata_version) {
+		printf("ERROR: Unsupported segdata version %u!\n", version);
+		exit(1);
+	}
+
+	int file_num_bits = read_le(f, 4);
+	int file_num_tags = read_le(f, 4);
+	int file_num_segs = read_le(f, 4);
+
+	// Map the vocabularies of the file to the global ids.
+	vector<int> file_bit_ids, file_tag_ids;
+	for (int i = 0; i < file_num_bits; i++)
+		file_bit_ids.push_back(get_bit_id(read_name(f)));
+	for (int i = 0; i < file_num_tags; i++)
+		file_tag_ids.push_back(get_tag_id(read_name(f)));
+
+	for (int i = 0; i < file_num_segs; i++) {
+		segdata_t& sd = new_segment(filename, read_name(f));
+
+		read_bitset(f, file_num_bits, [&](int idx) {
+			segdata_bits(sd).set(file_bit_ids.at(idx));
+		});
+		read_bitset(f, file_num_tags, [&](int idx) {
+			add_tag(sd, file_tag_ids.at(idx), true);
+		});
+		read_bitset(f, file_num_tags, [&](int idx) {
+			add_tag(sd, file_tag_ids.at(idx), false);
+		});
+	}
+
+	resize_segdata();
 }
 
 int main(int argc, char** argv) {
@@ -234,7 +332,7 @@ int main(int argc, char** argv) {
 		for (int optind = 1; optind < argc; optind++) {
 			printf("Reading %s.\n", argv[optind]);
 			std::ifstream f;
-			f.open(argv[optind]);
+			f.open(argv[optind], std::ios::binary);
 
 			// Check if input file exists.
 			if (!f.good()) {
@@ -243,7 +341,10 @@ int main(int argc, char** argv) {
 			}
 
 			assert(!f.fail());
-			read_input(f, argv[optind]);
+			if (is_binary_input(f))
+				read_binary_input(f, argv[optind]);
+			else
+				read_input(f, argv[optind]);
 		}
 	} else {
 		printf("Reading from stding.\n");
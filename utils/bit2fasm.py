@@ -10,6 +10,7 @@ import fasm.output
 from prjxray.db import Database
 from prjxray import fasm_disassembler
 from prjxray import bitstream
+from prjxray import bitstream_reader
 import subprocess
 import tempfile
 
@@ -27,16 +28,40 @@ def bit_to_bits(bitread, part_yaml, bit_file, bits_file, frame_range=None):
         shell=True)
 
 
-def bits_to_fasm(db_root, bits_file, verbose, canonical):
+def bits_to_fasm(db_root, bits_file, verbose, canonical, jobs=1):
+    with open(bits_file) as f:
+        bitdata = bitstream.BitData.load(f)
+
+    bitdata_to_fasm(db_root, bitdata, verbose, canonical, jobs)
+
+
+def bit_to_fasm(
+        db_root, part_yaml, bit_file, verbose, canonical, frame_range=None,
+        jobs=1):
+    """ Decodes bit file directly, without writing a bits file. """
+    if frame_range:
+        frame_range = bitstream_reader.parse_frame_range(frame_range)
+
+    bitdata = bitstream_reader.load_bitdata_from_bit(
+        bit_file, part_yaml, frame_range=frame_range)
+
+    bitdata_to_fasm(db_root, bitdata, verbose, canonical, jobs)
+
+
+def bitdata_to_fasm(db_root, bitdata, verbose, canonical, jobs=1):
     db = Database(db_root)
     grid = db.grid()
     disassembler = fasm_disassembler.FasmDisassembler(db)
 
-    with open(bits_file) as f:
-        bitdata = bitstream.load_bitdata(f)
+    if jobs > 1:
+        fasm_lines = disassembler.find_features_in_bitstream_parallel(
+            bitdata, processes=jobs, verbose=verbose)
+    else:
+        fasm_lines = disassembler.find_features_in_bitstream(
+            bitdata, verbose=verbose)
 
     model = fasm.output.merge_and_sort(
-        disassembler.find_features_in_bitstream(bitdata, verbose=verbose),
+        fasm_lines,
         zero_function=disassembler.is_zero_feature,
         sort_key=grid.tile_key,
     )
@@ -85,6 +110,11 @@ def main():
         default=default_bitread)
     parser.add_argument(
         '--frame_range', help="Frame range to use with bitread.")
+    parser.add_argument(
+        '--use-bitread',
+        help="Decode the bit file with bitread instead of the builtin reader. "
+        "Implied by --bits-file.",
+        action='store_true')
     parser.add_argument('bit_file', help='')
     parser.add_argument(
         '--verbose',
@@ -92,8 +122,26 @@ def main():
         action='store_true')
     parser.add_argument(
         '--canonical', help='Output canonical bitstream.', action='store_true')
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help='Number of processes used to disassemble tiles.')
     args = parser.parse_args()
 
+    part_yaml = os.path.join(args.db_root, '{}.yaml'.format(args.part))
+
+    if not args.use_bitread and not args.bits_file:
+        bit_to_fasm(
+            args.db_root,
+            part_yaml,
+            args.bit_file,
+            args.verbose,
+            args.canonical,
+            frame_range=args.frame_range,
+            jobs=args.jobs)
+        return
+
     with contextlib.ExitStack() as stack:
         if args.bits_file:
             bits_file = stack.enter_context(open(args.bits_file, 'wb'))
@@ -102,14 +150,15 @@ def main():
 
         bit_to_bits(
             bitread=args.bitread,
-            part_yaml=os.path.join(args.db_root, '{}.yaml'.format(args.part)),
+            part_yaml=part_yaml,
             bit_file=args.bit_file,
             bits_file=bits_file.name,
             frame_range=args.frame_range,
         )
 
         bits_to_fasm(
-            args.db_root, bits_file.name, args.verbose, args.canonical)
+            args.db_root, bits_file.name, args.verbose, args.canonical,
+            args.jobs)
 
 
 if __name__ == '__main__':
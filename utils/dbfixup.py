@@ -1,8 +1,16 @@
 #/usr/bin/env python3
 
 import sys, os, re
+import hashlib
+import json
+import multiprocessing
+from collections import OrderedDict
+from prjxray import db_reader
 from prjxray import util
 
+# Content hashes of the last --incremental run, in --db-root
+MANIFEST_NAME = ".dbfixup_manifest.json"
+
 clb_int_zero_db = [
     # CLB interconnet
     # Ex:
@@ -116,61 +124,58 @@ def add_zero_bits(fn_in, zero_db, clb_int=False, strict=True, verbose=False):
 
     llast = None
     drops = 0
-    with open(fn_in, "r") as f:
-        for line in f:
-            # Hack: skip duplicate lines
-            # This happens while merging a new multibit entry
-            line = line.strip()
-            if line == llast:
-                continue
+    entries = db_reader.read_db(fn_in)
+    for line, (tag, bits, mode) in zip(entries.lines, entries.items()):
+        # Hack: skip duplicate lines
+        # This happens while merging a new multibit entry
+        if line == llast:
+            continue
+
+        # an enum that needs masking
+        # check below asserts that a mask was actually applied
+        if mode and mode != "<0 candidates>" and not strict:
+            verbose and print("WARNING: dropping unresolved line: %s" % line)
+            drops += 1
+            continue
+
+        assert mode not in (
+            "<const0>",
+            "<const1>"), "Entries must be resolved. line: %s" % (line, )
+
+        if mode == "always":
+            new_line = line
+        else:
+            if mode:
+                assert mode == "<0 candidates>", line
+                bits = set()
+            else:
+                bits = set(bits)
+            """
+            This appears to be a large range of one hot interconnect bits
+            They are immediately before the first CLB real bits
+            """
+            if clb_int:
+                zero_range(tag, bits, 22, 25)
+            zero_groups(tag, bits, zero_db, strict=strict, verbose=verbose)
 
-            tag, bits, mode = util.parse_db_line(line)
-            # an enum that needs masking
-            # check below asserts that a mask was actually applied
-            if mode and mode != "<0 candidates>" and not strict:
+            if strict:
+                assert len(bits) > 0, 'Line {} found no bits.'.format(line)
+            elif len(bits) == 0:
                 verbose and print(
                     "WARNING: dropping unresolved line: %s" % line)
                 drops += 1
                 continue
 
-            assert mode not in (
-                "<const0>",
-                "<const1>"), "Entries must be resolved. line: %s" % (line, )
+            new_line = " ".join([tag] + sorted(bits))
 
-            if mode == "always":
-                new_line = line
-            else:
-                if mode:
-                    assert mode == "<0 candidates>", line
-                    bits = set()
-                else:
-                    bits = set(bits)
-                """
-                This appears to be a large range of one hot interconnect bits
-                They are immediately before the first CLB real bits
-                """
-                if clb_int:
-                    zero_range(tag, bits, 22, 25)
-                zero_groups(tag, bits, zero_db, strict=strict, verbose=verbose)
-
-                if strict:
-                    assert len(bits) > 0, 'Line {} found no bits.'.format(line)
-                elif len(bits) == 0:
-                    verbose and print(
-                        "WARNING: dropping unresolved line: %s" % line)
-                    drops += 1
-                    continue
-
-                new_line = " ".join([tag] + sorted(bits))
-
-            if re.match(r'.*<.*>.*', new_line):
-                print("Original line: %s" % line)
-                assert 0, "Failed to remove line mode: %s" % (new_line)
-
-            if new_line != line:
-                changes += 1
-            new_lines.add(new_line)
-            llast = line
+        if re.match(r'.*<.*>.*', new_line):
+            print("Original line: %s" % line)
+            assert 0, "Failed to remove line mode: %s" % (new_line)
+
+        if new_line != line:
+            changes += 1
+        new_lines.add(new_line)
+        llast = line
 
     if drops:
         print("WARNING: %s dropped %s unresolved lines" % (fn_in, drops))
@@ -178,40 +183,54 @@ def add_zero_bits(fn_in, zero_db, clb_int=False, strict=True, verbose=False):
     return changes, new_lines
 
 
-def update_mask(db_root, mask_db, src_dbs, offset=0):
-    bits = set()
-    mask_db_file = "%s/mask_%s.db" % (db_root, mask_db)
+def mask_bits(entries, offset=0):
+    """ Yields the set bits of segbits DbEntries, with offset added to the bit.
+    """
+    bit_ids = entries.bit_ids[entries.isset]
+    if offset == 0:
+        bit_names = entries.bits.names
+        for bit in bit_ids.tolist():
+            yield bit_names[bit]
+        return
 
-    if os.path.exists(mask_db_file):
-        with open(mask_db_file, "r") as f:
-            for line in f:
-                line = line.split()
-                assert len(line) == 2
-                assert line[0] == "bit"
-                bits.add(line[1])
+    word_column = entries.word_column[entries.isset]
+    word_bit = entries.word_bit[entries.isset] + offset
+    for column, bit in zip(word_column.tolist(), word_bit.tolist()):
+        yield "%02d_%02d" % (column, bit)
 
-    for src_db in src_dbs:
-        seg_db_file = "%s/segbits_%s.db" % (db_root, src_db)
 
-        if not os.path.exists(seg_db_file):
-            continue
+def update_mask(args):
+    """
+    Add the bits of segbits files to a mask file
 
-        with open(seg_db_file, "r") as f:
-            for line in f:
-                line = line.split()
-                for bit in line[1:]:
-                    if bit[0] == "!":
-                        continue
-                    if offset != 0:
-                        m = re.match(r"(\d+)_(\d+)", bit)
-                        bit = "%02d_%02d" % (
-                            int(m.group(1)), int(m.group(2)) + offset)
-                    bits.add(bit)
+    args is (mask_db_file, mask_lines, passes), where mask_lines are the lines
+    of the existing mask file (None if missing) and passes a list of
+    (list of segbits lines, offset).
+    Returns (mask_db_file, lines written or None if nothing was written)
+    """
+    mask_db_file, mask_lines, passes = args
+    bits = set()
+
+    if mask_lines is not None:
+        mask = db_reader.parse_lines(mask_lines, db_reader.MASK)
+        bits.update(mask.bits.names)
+
+    # The same segbits lines are used by several passes, parse them once.
+    parsed = {}
+    for seg_lines_list, offset in passes:
+        for seg_lines in seg_lines_list:
+            entries = parsed.get(id(seg_lines))
+            if entries is None:
+                entries = db_reader.parse_lines(seg_lines)
+                parsed[id(seg_lines)] = entries
+            bits.update(mask_bits(entries, offset=offset))
+
+    if len(bits) == 0:
+        return mask_db_file, None
 
-    if len(bits) > 0:
-        with open(mask_db_file, "w") as f:
-            for bit in sorted(bits):
-                print("bit %s" % bit, file=f)
+    lines = ["bit %s" % bit for bit in sorted(bits)]
+    write_lines(mask_db_file, lines)
+    return mask_db_file, lines
 
 
 def load_zero_db(fn):
@@ -277,40 +296,188 @@ def remove_ambiguous_solutions(fn_in, db_lines, strict=True, verbose=True):
     return drops, output_lines
 
 
+def read_lines(fn):
+    """ Returns the lines of fn without line endings, None if missing. """
+    if not os.path.exists(fn):
+        return None
+
+    with open(fn, "r") as f:
+        return f.read().splitlines()
+
+
+def write_lines(fn, lines):
+    with open(fn, "w") as f:
+        for line in lines:
+            print(line, file=f)
+
+
+def content_hash(*parts):
+    """ Hash of parts, which are JSON serializable (file lines, options). """
+    return hashlib.sha1(json.dumps(
+        parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class FixupManifest(object):
+    """
+    Content hashes of the inputs and outputs of the last run
+
+    Every fixup rewrites its output from inputs that are hashed with
+    content_hash.  A fixup is skipped if the hash of its inputs is the one
+    recorded by the last run, and its output was not modified since.
+
+    Most fixups are in place (input file == output file).  The fixups are
+    idempotent, so for those the inputs hash is recorded as if the output
+    was the input: rerunning dbfixup on a file it wrote is skipped, while a
+    file rewritten by the solver (ex: segmatch) is fixed up again.
+    """
+
+    VERSION = 1
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.files = {}
+
+        if fn is not None and os.path.exists(fn):
+            with open(fn, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == FixupManifest.VERSION:
+                self.files = manifest["files"]
+
+    def is_current(self, fn_out, inputs_hash):
+        if self.fn is None:
+            return False
+
+        entry = self.files.get(fn_out)
+        if entry is None or entry["inputs"] != inputs_hash:
+            return False
+
+        return content_hash(read_lines(fn_out)) == entry["output"]
+
+    def update(self, fn_out, inputs_hash, output_lines):
+        self.files[fn_out] = {
+            "inputs": inputs_hash,
+            "output": content_hash(output_lines),
+        }
+
+    def save(self):
+        if self.fn is None:
+            return
+
+        tmp_fn = self.fn + ".tmp"
+        with open(tmp_fn, "w") as f:
+            json.dump(
+                {
+                    "version": FixupManifest.VERSION,
+                    "files": self.files,
+                },
+                f,
+                indent=2,
+                sort_keys=True)
+        os.replace(tmp_fn, self.fn)
+
+
+def run_jobs(func, jobs, processes):
+    """ Yields func(job) for each job, in a process pool if more than one. """
+    if len(jobs) <= 1 or processes == 1:
+        for job in jobs:
+            yield func(job)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap(func, jobs):
+            yield result
+
+
+def fixup_seg_fn(args):
+    """ add_zero_bits and remove_ambiguous_solutions of one segbits file """
+    fn_in, fn_out, zero_db, clb_int, strict, verbose = args
+
+    changes, new_lines = add_zero_bits(
+        fn_in, zero_db, clb_int=clb_int, strict=strict, verbose=verbose)
+
+    new_changes, final_lines = remove_ambiguous_solutions(
+        fn_in,
+        new_lines,
+        strict=strict,
+        verbose=verbose,
+    )
+
+    changes += new_changes
+
+    lines = sorted(final_lines)
+    write_lines(fn_out, lines)
+    return fn_out, changes, lines
+
+
 def update_seg_fns(
-        fn_inouts, zero_db, clb_int, lazy=False, strict=True, verbose=False):
+        fn_inouts,
+        zero_db,
+        clb_int,
+        lazy=False,
+        strict=True,
+        verbose=False,
+        jobs=None,
+        manifest=None,
+        seg_cache=None):
+    """
+    Fixup segbits files, each in its own process
+
+    seg_cache is filled with segbits file name => lines after the fixup, so
+    later stages (update_masks) do not need to read them again.
+    """
+    manifest = manifest or FixupManifest(None)
+    seg_cache = {} if seg_cache is None else seg_cache
+
     seg_files = 0
     seg_lines = 0
+    skipped = 0
+    pending = []
     for fn_in, fn_out in fn_inouts:
         verbose and print("zb %s: %s" % (fn_in, os.path.exists(fn_in)))
         if lazy and not os.path.exists(fn_in):
             continue
 
-        changes, new_lines = add_zero_bits(
-            fn_in, zero_db, clb_int=clb_int, strict=strict, verbose=verbose)
-
-        new_changes, final_lines = remove_ambiguous_solutions(
-            fn_in,
-            new_lines,
-            strict=strict,
-            verbose=verbose,
-        )
+        inputs_hash = None
+        if manifest.fn is not None:
+            options = [zero_db, clb_int, strict]
+            if fn_in == fn_out:
+                inputs_hash = content_hash(
+                    "segbits", options, read_lines(fn_in))
+            else:
+                inputs_hash = content_hash(
+                    "segbits", options, read_lines(fn_in), fn_out)
+            if manifest.is_current(fn_out, inputs_hash):
+                verbose and print("Unchanged %s" % fn_out)
+                seg_cache[fn_out] = read_lines(fn_out)
+                skipped += 1
+                continue
 
-        changes += new_changes
+        pending.append(
+            (inputs_hash, (fn_in, fn_out, zero_db, clb_int, strict, verbose)))
 
-        with open(fn_out, "w") as f:
-            for line in sorted(final_lines):
-                print(line, file=f)
+    results = run_jobs(fixup_seg_fn, [job for _, job in pending], jobs)
+    for (inputs_hash, job), (fn_out, changes, lines) in zip(pending, results):
+        fn_in = job[0]
+        seg_cache[fn_out] = lines
+        if manifest.fn is not None:
+            if fn_in == fn_out:
+                # Recorded as if the output was the input, see FixupManifest.
+                inputs_hash = content_hash(
+                    "segbits", [zero_db, clb_int, strict], lines)
+            manifest.update(fn_out, inputs_hash, lines)
 
         if changes is not None:
             seg_files += 1
             seg_lines += changes
     print(
-        "Segbit: checked %u files w/ %u changed lines" %
-        (seg_files, seg_lines))
+        "Segbit: checked %u files w/ %u changed lines, %u unchanged" %
+        (seg_files, seg_lines, skipped))
+    return seg_cache
 
 
-def update_masks(db_root):
+def mask_passes():
+    """ Returns OrderedDict of mask_db => list of (src_dbs, offset) """
+    passes = OrderedDict()
     for mask_db, src_dbs in [
         ("clbll_l", ("clbll_l", "int_l")),
         ("clbll_r", ("clbll_r", "int_r")),
@@ -323,7 +490,7 @@ def update_masks(db_root):
         ("dsp_l", ("dsp_l", )),
         ("dsp_r", ("dsp_r", )),
     ]:
-        update_mask(db_root, mask_db, src_dbs)
+        passes.setdefault(mask_db, []).append((src_dbs, 0))
 
     for mask_db, src_dbs in [
         ("bram_l", ("int_l", )),
@@ -332,9 +499,56 @@ def update_masks(db_root):
         ("dsp_r", ("int_r", )),
     ]:
         for k in range(5):
-            update_mask(db_root, mask_db, src_dbs, offset=64 * k)
+            passes.setdefault(mask_db, []).append((src_dbs, 64 * k))
+
+    return passes
+
+
+def update_masks(db_root, jobs=None, manifest=None, seg_cache=None):
+    """
+    Add the bits of the segbits files to the mask files
+
+    Every mask file only depends on segbits files, so all passes of a mask
+    file are done at once, and mask files are updated in parallel.
+    Segbits files are taken from seg_cache if present.
+    """
+    manifest = manifest or FixupManifest(None)
+    seg_cache = {} if seg_cache is None else seg_cache
+
+    def seg_lines(src_db):
+        seg_db_file = "%s/segbits_%s.db" % (db_root, src_db)
+        if seg_db_file not in seg_cache:
+            seg_cache[seg_db_file] = read_lines(seg_db_file)
+        return seg_cache[seg_db_file]
+
+    pending = []
+    skipped = 0
+    for mask_db, passes in mask_passes().items():
+        mask_db_file = "%s/mask_%s.db" % (db_root, mask_db)
+        mask_lines = read_lines(mask_db_file)
+
+        job_passes = []
+        for src_dbs, offset in passes:
+            src_lines = [seg_lines(src_db) for src_db in src_dbs]
+            job_passes.append(
+                ([lines for lines in src_lines if lines is not None], offset))
+
+        if manifest.fn is not None and mask_lines is not None:
+            inputs_hash = content_hash("mask", job_passes, mask_lines)
+            if manifest.is_current(mask_db_file, inputs_hash):
+                skipped += 1
+                continue
+
+        pending.append((job_passes, (mask_db_file, mask_lines, job_passes)))
+
+    results = run_jobs(update_mask, [job for _, job in pending], jobs)
+    for (job_passes, _), (mask_db_file, lines) in zip(pending, results):
+        if manifest.fn is not None and lines is not None:
+            # Recorded as if the output was the input, see FixupManifest.
+            manifest.update(
+                mask_db_file, content_hash("mask", job_passes, lines), lines)
 
-    print("Mask: checked files")
+    print("Mask: checked files, %u unchanged" % skipped)
 
 
 def update_segs(
@@ -344,7 +558,10 @@ def update_segs(
         seg_fn_out,
         zero_db_fn,
         strict=True,
-        verbose=False):
+        verbose=False,
+        jobs=None,
+        manifest=None,
+        seg_cache=None):
     if clb_int:
         zero_db = clb_int_zero_db
         lazy = True
@@ -368,8 +585,16 @@ def update_segs(
         zero_db = load_zero_db(zero_db_fn)
     print("CLB INT mode: %s" % clb_int)
     print("Segbit groups: %s" % len(zero_db))
-    update_seg_fns(
-        fn_inouts, zero_db, clb_int, lazy=lazy, strict=strict, verbose=verbose)
+    return update_seg_fns(
+        fn_inouts,
+        zero_db,
+        clb_int,
+        lazy=lazy,
+        strict=strict,
+        verbose=verbose,
+        jobs=jobs,
+        manifest=manifest,
+        seg_cache=seg_cache)
 
 
 def run(
@@ -379,22 +604,32 @@ def run(
         seg_fn_in=None,
         seg_fn_out=None,
         strict=None,
-        verbose=False):
+        verbose=False,
+        jobs=None,
+        incremental=False):
 
     if strict is None:
         strict = not clb_int
 
+    manifest = FixupManifest(
+        os.path.join(db_root, MANIFEST_NAME) if incremental else None)
+
     # Probably should split this into two programs
-    update_segs(
+    seg_cache = update_segs(
         db_root,
         clb_int=clb_int,
         seg_fn_in=seg_fn_in,
         seg_fn_out=seg_fn_out,
         zero_db_fn=zero_db_fn,
         strict=strict,
-        verbose=verbose)
+        verbose=verbose,
+        jobs=jobs,
+        manifest=manifest)
     if clb_int:
-        update_masks(db_root)
+        update_masks(
+            db_root, jobs=jobs, manifest=manifest, seg_cache=seg_cache)
+
+    manifest.save()
 
 
 def main():
@@ -410,6 +645,13 @@ def main():
     parser.add_argument('--seg-fn-in', help='')
     parser.add_argument('--seg-fn-out', help='')
     util.add_bool_arg(parser, "--strict", default=False)
+    parser.add_argument(
+        '--jobs', type=int, help='Number of processes, default all cores')
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Skip files whose inputs did not change since the last run, '
+        'see FixupManifest')
     args = parser.parse_args()
 
     run(
@@ -419,7 +661,9 @@ def main():
         args.seg_fn_in,
         args.seg_fn_out,
         strict=args.strict,
-        verbose=args.verbose)
+        verbose=args.verbose,
+        jobs=args.jobs,
+        incremental=args.incremental)
 
 
 if __name__ == '__main__':
@@ -26,6 +26,7 @@ export XRAY_MERGEDB="bash ${XRAY_UTILS_DIR}/mergedb.sh"
 export XRAY_DBFIXUP="python3 ${XRAY_UTILS_DIR}/dbfixup.py"
 export XRAY_MASKMERGE="bash ${XRAY_UTILS_DIR}/maskmerge.sh"
 export XRAY_SEGMATCH="${XRAY_TOOLS_DIR}/segmatch"
+export XRAY_SEGMATCH_PY="python3 ${XRAY_UTILS_DIR}/segmatch.py"
 export XRAY_SEGPRINT="python3 ${XRAY_UTILS_DIR}/segprint.py"
 export XRAY_BIT2FASM="python3 ${XRAY_UTILS_DIR}/bit2fasm.py"
 export XRAY_FASM2FRAMES="python3 ${XRAY_UTILS_DIR}/fasm2frames.py"
@@ -9,6 +9,7 @@ import os
 import os.path
 
 from prjxray import fasm_assembler
+from prjxray import util
 from prjxray.db import Database
 from prjxray.roi import Roi
 
@@ -54,9 +55,24 @@ def dump_frm(f, frames):
             '0x%08X ' % addr + ','.join(['0x%08X' % w for w in words]) + '\n')
 
 
-def run(db_root, filename_in, f_out, sparse=False, roi=None, debug=False):
+def run(
+        db_root,
+        filename_in,
+        f_out,
+        sparse=False,
+        roi=None,
+        debug=False,
+        vectorized=True,
+        stream=False,
+        max_memory=None):
     db = Database(db_root)
-    assembler = fasm_assembler.FasmAssembler(db)
+    if stream:
+        assembler = fasm_assembler.StreamingFasmAssembler(
+            db, max_memory=max_memory)
+    elif vectorized:
+        assembler = fasm_assembler.VectorFasmAssembler(db)
+    else:
+        assembler = fasm_assembler.FasmAssembler(db)
 
     extra_features = []
     if roi:
@@ -105,6 +121,19 @@ def main():
         help="ROI design.json file defining which tiles are within the ROI.")
     parser.add_argument(
         '--debug', action='store_true', help="Print debug dump")
+    util.add_bool_arg(
+        parser,
+        '--vectorized',
+        default=True,
+        help="Use the numpy frame buffer assembler")
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help="Parse the FASM file line by line, with bounded memory")
+    parser.add_argument(
+        '--max-memory',
+        type=int,
+        help="With --stream, memory ceiling in MiB before spilling to disk")
     parser.add_argument('fn_in', help='Input FPGA assembly (.fasm) file')
     parser.add_argument(
         'fn_out',
@@ -113,13 +142,21 @@ def main():
         help='Output FPGA frame (.frm) file')
 
     args = parser.parse_args()
+
+    max_memory = None
+    if args.max_memory is not None:
+        max_memory = args.max_memory * 1024 * 1024
+
     run(
         db_root=args.db_root,
         filename_in=args.fn_in,
         f_out=open(args.fn_out, 'w'),
         sparse=args.sparse,
         roi=args.roi,
-        debug=args.debug)
+        debug=args.debug,
+        vectorized=args.vectorized,
+        stream=args.stream,
+        max_memory=max_memory)
 
 
 if __name__ == '__main__':
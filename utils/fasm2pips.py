@@ -44,8 +44,9 @@ def main():
 
             tile_type = database.get_tile_type(gridinfo.tile_type)
 
-            for pip in tile_type.pips:
-                if pip.net_from == parts[2] and pip.net_to == parts[1]:
+            for pip in tile_type.get_uphill_pips([parts[1]],
+                                                 allow_pseudo=True):
+                if pip.net_from == parts[2]:
                     yield '{}/{}'.format(tile, pip.name)
 
     print(
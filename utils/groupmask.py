@@ -1,18 +1,21 @@
 #/usr/bin/env python3
 
 import sys, os, re
+from prjxray import db_reader
 from prjxray import util
 
 
-def index_masks(fn_in, groups_in):
-    """Return a dictionary with the bits active in each group for the specified list of groups"""
+def index_masks(db, groups_in):
+    """Return a dictionary with the bits active in each group for the specified list of groups
+
+    db is the db_reader.DbEntries of the input .db"""
     # Only analyze the given groups
     groups = {}
     for group in groups_in:
         groups[group] = set()
 
     # Index bits
-    for line, (tag, bits, mode) in util.parse_db_lines(fn_in):
+    for line, (tag, bits, mode) in zip(db.lines, db.items()):
         assert not mode, "Unresolved tag: %s" % (line, )
         prefix = tag[0:tag.rfind(".")]
         group = groups.get(prefix, None)
@@ -30,10 +33,10 @@ def index_masks(fn_in, groups_in):
     return groups
 
 
-def apply_masks(fn_in, groups):
+def apply_masks(db, groups):
     """Add 0 entries ("!") to .db entries based on groups definition"""
     new_db = {}
-    for line, (tag, bits, mode) in util.parse_db_lines(fn_in):
+    for line, (tag, bits, mode) in zip(db.lines, db.items()):
         assert not mode, "Unresolved tag: %s" % (line, )
         prefix = tag[0:tag.rfind(".")]
         group = groups.get(prefix, None)
@@ -56,8 +59,9 @@ def load_groups(fn):
 
 def run(fn_in, fn_out, groups_fn, verbose=False):
     groups_in = load_groups(groups_fn)
-    groups = index_masks(fn_in, groups_in)
-    new_db = apply_masks(fn_in, groups)
+    db = db_reader.read_db(fn_in)
+    groups = index_masks(db, groups_in)
+    new_db = apply_masks(db, groups)
     util.write_db_lines(fn_out, new_db)
 
 
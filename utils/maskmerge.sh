@@ -8,7 +8,12 @@ mv "$outfile" "$outfile.tmp"
 
 for infile; do
 	echo "Reading mask bits from $infile."
-	grep ^bit "$infile" | sort -u >> "$outfile.tmp"
+	if [ "$(head -c 8 "$infile")" = "PRJXSEGD" ]; then
+		# Binary segdata file, see prjxray/segdata.py.
+		python3 "$(dirname "$0")/segdata2txt.py" "$infile" | grep ^bit | sort -u >> "$outfile.tmp"
+	else
+		grep ^bit "$infile" | sort -u >> "$outfile.tmp"
+	fi
 done
 
 sort -u < "$outfile.tmp" > "$outfile"
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+from prjxray import db_reader
 from prjxray import util
 
 
@@ -12,9 +13,13 @@ def run(fn_ins, fn_out, strict=False, verbose=False):
     # bits to (tag, line)
     bitss = dict()
 
+    # Shared by all inputs, so bits common to the inputs are parsed once.
+    tag_table = db_reader.TagTable()
+    bit_table = db_reader.BitTable()
+
     for fn_in in fn_ins:
-        for line, (tag, bits, mode) in util.parse_db_lines(fn_in):
-            line = line.strip()
+        db = db_reader.read_db(fn_in, tags=tag_table, bits=bit_table)
+        for line, (tag, bits, mode) in zip(db.lines, db.items()):
             assert mode is not None or mode != "always", "strict: got ill defined line: %s" % (
                 line, )
 
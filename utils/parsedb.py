@@ -1,22 +1,31 @@
 #!/usr/bin/env python3
 
 import sys, re
+from prjxray import db_reader
 from prjxray import util
 
 
 def run(fnin, fnout=None, strict=False, verbose=False):
     lines = open(fnin, 'r').read().split('\n')
-    tags = dict()
-    bitss = dict()
+
+    # TODO: figure out what to do with masks
+    # Mask lines are only checked to be well formed
+    mask_lines = []
+    seg_lines = []
     for line in lines:
-        line = line.strip()
-        if line == '':
-            continue
-        # TODO: figure out what to do with masks
-        if line.startswith("bit "):
-            continue
-        tag, bits, mode = util.parse_db_line(line)
-        if strict:
+        if line.strip().startswith("bit "):
+            mask_lines.append(line)
+        else:
+            seg_lines.append(line)
+    db_reader.parse_lines(mask_lines, db_reader.MASK, validate_only=True)
+
+    if not strict:
+        db_reader.parse_lines(seg_lines, validate_only=True)
+    else:
+        db = db_reader.parse_lines(seg_lines)
+        tags = dict()
+        bitss = dict()
+        for line, (tag, bits, mode) in zip(db.lines, db.items()):
             if mode != "always":
                 assert not mode, "strict: got ill defined line: %s" % (line, )
             if tag in tags:
@@ -25,9 +34,9 @@ def run(fnin, fnout=None, strict=False, verbose=False):
                 assert 0, "strict: got duplicate tag %s" % (tag, )
             assert bits not in bitss, "strict: got duplicate bits %s: %s %s" % (
                 bits, tag, bitss[bits])
-        tags[tag] = line
-        if bits != None:
-            bitss[bits] = tag
+            tags[tag] = line
+            if bits != None:
+                bitss[bits] = tag
 
     if fnout:
         with open(fnout, "w") as fout:
@@ -40,7 +40,7 @@ def quick_test(db_root):
 
         tile = db.get_tile_type(gridinfo.tile_type)
 
-        instance_sites = list(tile.get_instance_sites(gridinfo))
+        instance_sites = list(g.get_instance_sites(g.tilename_at_loc(loc)))
         assert len(instance_sites) == len(tile.get_sites())
 
 
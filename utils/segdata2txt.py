@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+""" Convert a segdata file, text or binary, to the text format. """
+
+import sys
+
+from prjxray import segdata
+
+
+def run(infile, outfile):
+    segdata.write_segdata_txt(outfile, segdata.read_segdata(infile))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Convert a segdata file to the text format')
+    parser.add_argument('infile', help='Input segdata file (.txt or .bin)')
+    parser.add_argument(
+        'outfile',
+        nargs='?',
+        help='Output text segdata file, stdout if not given')
+    args = parser.parse_args()
+
+    if args.outfile is None:
+        run(args.infile, sys.stdout)
+    else:
+        with open(args.outfile, 'w') as f:
+            run(args.infile, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Python version of tools/segmatch, see prjxray/segmatch.py.
+
+With -o, all input files are solved together, as tools/segmatch does.  With
+--output-dir, input files are grouped by segment type (segdata_<type>.txt) and
+each group is solved in its own process, writing <output-dir>/segbits_<type>.rdb.
+
+With --incremental, the solver state is kept in <output file>.state and only
+input files not seen by a previous run are read.  This is meant for int_loop
+fuzzers, which pass the segdata files of all iterations every iteration.
+"""
+
+import sys
+
+from prjxray import segmatch
+
+
+def print_stats(segmatch_data, solutions):
+    print("#of segments: %d" % segmatch_data.num_segments())
+    print("#of bits: %d" % len(segmatch_data.bit_ids))
+    print("#of tags: %d" % len(solutions))
+
+    print(
+        "#of const0 tags: %d" % sum(
+            1 for solution in solutions if not solution.count1))
+    print(
+        "#of const1 tags: %d" % sum(
+            1 for solution in solutions
+            if solution.count1 and not solution.count0))
+
+    num_candidates = [
+        len(solution.candidates)
+        for solution in solutions
+        if solution.count1 and solution.count0
+    ]
+    if num_candidates:
+        print("min #of candidates: %d" % min(num_candidates))
+        print("max #of candidates: %d" % max(num_candidates))
+        print(
+            "avg #of candidates: %.3f" %
+            (sum(num_candidates) / len(num_candidates)))
+
+
+def print_progress(segbits_file, state, newly_solved):
+    """ Print tags solved by the last update of state, and the trend. """
+    for tag in newly_solved:
+        print("Solved %s" % tag)
+
+    if not state.history:
+        return
+
+    num_files, num_segments, num_solved, num_tags = state.history[-1]
+    print(
+        "%s: %d/%d tags solved (%.1f%%), %d new from %d files" % (
+            segbits_file, num_solved, num_tags, 100.0 * num_solved / max(
+                num_tags, 1), len(newly_solved), num_files))
+
+    if len(state.history) > 1:
+        prev_files, prev_segments, prev_solved, _ = state.history[-2]
+        print(
+            "%s: %.2f tags solved per 1000 new segments" % (
+                segbits_file, 1000.0 * (num_solved - prev_solved) / max(
+                    num_segments - prev_segments, 1)))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Correlate segdata tags with segment bits")
+    parser.add_argument(
+        '-c',
+        type=int,
+        default=segmatch.DEFAULT_CANDIDATE_THRESHOLD,
+        help="threshold under which candidates are output. "
+        "set to -1 to output all.")
+    parser.add_argument('-i', action='store_true', help="add inverted tags")
+    parser.add_argument(
+        '-m',
+        type=int,
+        default=0,
+        help="min number of set/cleared samples each")
+    parser.add_argument(
+        '-M',
+        type=int,
+        default=0,
+        help="min number of set/cleared samples total")
+    parser.add_argument('-o', help="set output file")
+    parser.add_argument('-k', help="set output mask file")
+    parser.add_argument(
+        '--output-dir',
+        help="solve each segment type in parallel, writing "
+        "segbits_<type>.rdb files to this directory")
+    parser.add_argument(
+        '--mask',
+        action='store_true',
+        help="with --output-dir, also write mask_<type>.db files")
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help="number of processes with --output-dir, default all cores")
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help="keep solver state in <output>.state, only read new files")
+    parser.add_argument('files', nargs='+', help="segdata files")
+    args = parser.parse_args()
+
+    format_args = dict(
+        candidate_threshold=args.c, min_samples=args.m, min_total=args.M)
+
+    if args.output_dir is not None:
+        groups = segmatch.group_by_segment_type(args.files)
+        for segbits_file, num_segments, num_tags, newly_solved in segmatch.solve_groups(
+                groups, args.output_dir, mask=args.mask, invert_tags=args.i,
+                incremental=args.incremental, processes=args.jobs,
+                **format_args):
+            print(
+                "Wrote %s, %d segments, %d tags." %
+                (segbits_file, num_segments, num_tags))
+            if newly_solved is not None:
+                print(
+                    "%s: %d new tags solved" %
+                    (segbits_file, len(newly_solved)))
+        return
+
+    if args.incremental:
+        if args.o is None:
+            parser.error("--incremental requires -o or --output-dir")
+
+        segmatch_data, solutions, new_files, newly_solved = segmatch.solve_incremental(
+            args.o + '.state', args.files, invert_tags=args.i, **format_args)
+        for fname in new_files:
+            print("Reading %s." % fname)
+        print_stats(segmatch_data, solutions)
+        print_progress(args.o, segmatch_data, newly_solved)
+    else:
+        for fname in args.files:
+            print("Reading %s." % fname)
+
+        segmatch_data, solutions = segmatch.solve_files(
+            args.files, invert_tags=args.i)
+        print_stats(segmatch_data, solutions)
+
+    if args.o is not None:
+        with open(args.o, 'w') as f:
+            segmatch.write_segbits(f, solutions, **format_args)
+    else:
+        segmatch.write_segbits(sys.stdout, solutions, **format_args)
+
+    if args.k is not None:
+        with open(args.k, 'w') as f:
+            segmatch.write_mask(f, segmatch_data)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,6 @@ Ex: BRAM_L_X6Y100:CLB_IO_CLK
 '''
 
 import sys, os, json, re
-import copy
 from prjxray import bitstream
 from prjxray import db as prjxraydb
 from prjxray import util
@@ -84,14 +83,11 @@ def mk_segbits(seginfo, bitdata):
     for frame in range(baseaddr, baseaddr + frames):
         if frame not in bitdata:
             continue
-        for wordidx in range(word_offset, word_offset + words):
-            if wordidx not in bitdata[frame]:
-                continue
-            for bitidx in bitdata[frame][wordidx]:
-                frame_addr = frame - baseaddr
-                bit_addr = 32 * (wordidx - word_offset) + bitidx
-                #segbits.add( "%02d_%02d" % (frame_addr, word_addr))
-                segbits.add((frame_addr, bit_addr))
+        for bit in bitdata.words_bits(frame, word_offset, words):
+            frame_addr = frame - baseaddr
+            bit_addr = bit - 32 * word_offset
+            #segbits.add( "%02d_%02d" % (frame_addr, word_addr))
+            segbits.add((frame_addr, bit_addr))
 
     return segbits
 
@@ -112,27 +108,20 @@ def print_unknown_bits(tiles, bitdata):
     Print bits not covered by known tiles
 
     tiles: tilegrid json
-    bitdata[addr][word] = set of bit indices (0 to 31)
+    bitdata: bitstream.BitData
     '''
-    # Start with an open set and remove elements as we find them
-    tocheck = copy.deepcopy(bitdata)
-
+    covered = bitstream.BitData()
     for addr_min, addr_max_p1, word_min, word_max_p1 in gen_tilegrid_masks(
             tiles):
+        mask = bitstream.word_mask(word_min, word_max_p1 - word_min)
         for addr in range(addr_min, addr_max_p1):
-            if addr not in tocheck:
-                continue
-            for word in range(word_min, word_max_p1):
-                if word not in tocheck[addr]:
-                    continue
-                del tocheck[addr][word]
+            if addr in bitdata:
+                covered.add_bitmap(addr, mask)
 
     # print uncovered locations
     print('Non-database bits:')
-    for frame in sorted(tocheck.keys()):
-        for wordidx in sorted(tocheck[frame].keys()):
-            for bitidx in sorted(tocheck[frame][wordidx]):
-                print("bit_%08x_%03d_%02d" % (frame, wordidx, bitidx))
+    for frame, wordidx, bitidx in (bitdata - covered).iter_bits():
+        print("bit_%08x_%03d_%02d" % (frame, wordidx, bitidx))
 
 
 def tagmatch(entry, segbits):
@@ -438,7 +427,8 @@ def run(
     db = prjxraydb.Database(db_root)
     tiles = load_tiles(db_root)
     segments = mk_segments(tiles)
-    bitdata = bitstream.load_bitdata2(open(bits_file, "r"))
+    with open(bits_file, "r") as f:
+        bitdata = bitstream.BitData.load(f)
 
     if flag_unknown_bits:
         print_unknown_bits(tiles, bitdata)
@@ -10,46 +10,14 @@ import json
 import sys
 
 
-def full_wire_name(wire_in_grid):
-    return '{}/{}'.format(wire_in_grid.tile, wire_in_grid.wire)
+def make_connections(graph):
+    """ Returns iterable of the nodes of graph, as lists of tile/wire.
 
+    Wires that are not connected to any other wire are not returned.
 
-def make_connection(wires, connection):
-    wire_a = full_wire_name(connection.wire_a)
-    wire_b = full_wire_name(connection.wire_b)
-
-    if wire_a not in wires:
-        wires[wire_a] = set((wire_a, ))
-
-    if wire_b not in wires:
-        wires[wire_b] = set((wire_b, ))
-
-    wire_a_set = wires[wire_a]
-    wire_b_set = wires[wire_b]
-
-    if wire_a_set is wire_b_set:
-        return
-
-    wire_a_set |= wire_b_set
-
-    for wire in wire_a_set:
-        wires[wire] = wire_a_set
-
-
-def make_connections(db_root):
-    db = prjxray.db.Database(db_root)
-    c = db.connections()
-
-    wires = {}
-    for connection in c.get_connections():
-        make_connection(wires, connection)
-
-    nodes = {}
-
-    for wire_node in wires.values():
-        nodes[id(wire_node)] = wire_node
-
-    return nodes.values()
+    """
+    for _, wires in graph.iter_nodes(min_wires=2):
+        yield ['{}/{}'.format(tile, wire) for tile, wire in wires]
 
 
 def read_json5(fname):
@@ -88,7 +56,18 @@ def main():
             bar.update(idx + 1)
 
     print('{} Creating connections'.format(datetime.datetime.now()))
-    generated_nodes = make_connections(args.db_root)
+    graph = prjxray.db.Database(args.db_root).node_graph()
+    generated_nodes = make_connections(graph)
+
+    # These tileconn.json wire pairs can not be part of the generated nodes.
+    for type_a, wire_a, type_b, wire_b in graph.missing_wire_pairs:
+        print(
+            'Wire pair {}/{} {}/{} refers to a missing wire'.format(
+                type_a, wire_a, type_b, wire_b))
+    if graph.missing_wire_pairs:
+        print(
+            '{} Found {} wire pairs with missing wires'.format(
+                datetime.datetime.now(), len(graph.missing_wire_pairs)))
 
     print('{} Verifying connections'.format(datetime.datetime.now()))
     error_nodes = []
@@ -126,6 +105,9 @@ def main():
                     args.ignored_wires,
                 ))
 
+    if graph.missing_wire_pairs:
+        sys.exit(1)
+
 
 if __name__ == '__main__':
     main()